@@ -1,6 +1,35 @@
+import uuid
+
 from django.contrib import admin
 from django import forms
-from .models import Site, Pricing, OptionalCharge, Booking, Location
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .models import Site, Pricing, OptionalCharge, Booking, Location, WebhookEvent
+from .search import matching_location_ids
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists of large tables show Postgres' planner estimate
+    (pg_class.reltuples) instead of running COUNT(*) over every row.
+    Filtered lists, small tables and other backends count exactly.
+    """
+    estimate_above = 100_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        connection = connections[qs.db]
+        if connection.vendor == 'postgresql' and not qs.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [qs.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_above:
+                return row[0]
+        return super().count
 
 class SiteAdminForm(forms.ModelForm):
     """Custom form to include location fields inline"""
@@ -46,6 +75,7 @@ class SiteAdmin(admin.ModelAdmin):
     list_display = ['name', 'get_location', 'address', 'total_slots_car', 'total_slots_bike', 'created_at']
     search_fields = ['name', 'address', 'location__name']
     readonly_fields = ['created_at']
+    show_full_result_count = False
     fieldsets = (
         ('Site Information', {
             'fields': ('name', 'address', 'total_slots_car', 'total_slots_bike', 
@@ -54,11 +84,89 @@ class SiteAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Joined for the changelist's Location column and for SiteAdminForm,
+        # which reads the location when an existing site is edited.
+        return super().get_queryset(request).select_related('location')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Same shape as api.search: every predicate on an api_site column
+        # (trigram indexed), with matching locations resolved first, instead
+        # of a LIKE across the location join.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(
+            Q(name__icontains=term) | Q(address__icontains=term)
+            | Q(location_id__in=list(matching_location_ids(term)))
+        ), False
+
     def get_location(self, obj):
         return obj.location.name if obj.location else '-'
     get_location.short_description = 'Location'
 
+
+class PricingAdmin(admin.ModelAdmin):
+    list_display = ['site', 'vehicle_type', 'tier', 'price']
+    list_filter = ['vehicle_type', 'tier']
+    list_select_related = ['site__location']
+    raw_id_fields = ['site']
+
+
+class OptionalChargeAdmin(admin.ModelAdmin):
+    list_display = ['name', 'site', 'amount', 'is_active']
+    list_filter = ['is_active']
+    list_select_related = ['site__location']
+    raw_id_fields = ['site']
+
+
+class BookingAdmin(admin.ModelAdmin):
+    """
+    Built for millions of rows: one query for the page (site, location and
+    user joined), an estimated total, and filters, ordering, date drill-down
+    and search that all run on indexed columns.
+    """
+    list_display = ['id', 'site', 'user', 'vehicle_type', 'status', 'start_time', 'end_time', 'total_amount', 'created_at']
+    list_filter = ['status', 'vehicle_type']
+    list_select_related = ['site__location', 'user']
+    raw_id_fields = ['site', 'user', 'optional_charges']
+    readonly_fields = ['created_at']
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    search_fields = ['id', 'razorpay_order_id', 'razorpay_payment_id']
+    search_help_text = 'Exact booking id, Razorpay order id or payment id.'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Exact lookups only: a booking UUID hits the primary key, anything
+        # else the Razorpay id columns. No LIKE scans.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(id=uuid.UUID(term)), False
+        except ValueError:
+            return queryset.filter(Q(razorpay_order_id=term) | Q(razorpay_payment_id=term)), False
+
+
+class WebhookEventAdmin(admin.ModelAdmin):
+    """Read-only view of the webhook inbox; filter on needs_refund for payments to give back."""
+    list_display = ('event_id', 'received_at', 'processed_at', 'needs_refund')
+    list_filter = ('needs_refund',)
+    search_fields = ('=event_id',)
+    ordering = ('-id',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Site, SiteAdmin)
-admin.site.register(Pricing)
-admin.site.register(OptionalCharge)
-admin.site.register(Booking)
+admin.site.register(Pricing, PricingAdmin)
+admin.site.register(OptionalCharge, OptionalChargeAdmin)
+admin.site.register(Booking, BookingAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
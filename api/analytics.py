@@ -0,0 +1,221 @@
+"""
+Occupancy and revenue rollups over bookings.
+
+HourlyBookingRollup and DailyBookingRollup hold, per (site, vehicle_type,
+status) and period, the number of bookings and their revenue (counted in
+the period the booking starts), plus the occupied slot-minutes (spread
+over every period the booking covers). Periods are local-time hours and
+days.
+
+Booking changes do not touch the rollups themselves. In the same
+transaction as the change they queue a BookingRollupDelta per affected
+row (one small INSERT, whatever the booking's length):
+- model saves and deletes (creation, admin edits) go through the signals
+  in api/signals.py;
+- queryset status updates (payment, cancellation, expiry) call
+  record_transition() themselves.
+apply_deltas(), run by the api.tasks.apply_booking_rollups periodic task,
+folds queued deltas into the rollups with multi-row INSERT ... ON
+CONFLICT DO UPDATE statements, taking rollup rows in key order so
+concurrent appliers never deadlock. Rollups therefore trail the bookings
+by up to one task interval. rebuild() recomputes a time window from the
+bookings table; the backfill_booking_rollups command uses it.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Booking, BookingRollupDelta, HourlyBookingRollup, DailyBookingRollup, Site
+
+ROLLUP_FIELDS = ('site_id', 'vehicle_type', 'status', 'start_time', 'end_time', 'total_amount')
+UPSERT_BATCH = 500
+HOUR = datetime.timedelta(hours=1)
+
+
+def _floor_hour(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_minute(value):
+    return value.replace(second=0, microsecond=0)
+
+
+def contributions(rows, sign=1, window=None):
+    """
+    Rollup deltas of booking `rows` (tuples of ROLLUP_FIELDS) as
+    ({hourly key: [bookings, slot_minutes, revenue]}, {daily key: ...}).
+    With `window` = (start, end), only the parts falling inside it count.
+    """
+    hourly = defaultdict(lambda: [0, 0, Decimal('0')])
+    daily = defaultdict(lambda: [0, 0, Decimal('0')])
+    for site_id, vehicle_type, status, start, end, amount in rows:
+        start, end = _floor_minute(start), _floor_minute(end)
+        if window is None or window[0] <= start < window[1]:
+            hour = _floor_hour(start)
+            for totals in (hourly[site_id, vehicle_type, status, hour], daily[site_id, vehicle_type, status, hour.date()]):
+                totals[0] += sign
+                totals[2] += sign * amount
+        cursor = start if window is None else max(start, window[0])
+        stop = end if window is None else min(end, window[1])
+        while cursor < stop:
+            hour = _floor_hour(cursor)
+            upto = min(hour + HOUR, stop)
+            minutes = int((upto - cursor).total_seconds()) // 60
+            hourly[site_id, vehicle_type, status, hour][1] += sign * minutes
+            daily[site_id, vehicle_type, status, hour.date()][1] += sign * minutes
+            cursor = upto
+    return hourly, daily
+
+
+def _upsert(model, period_field, deltas):
+    """
+    Add `deltas` onto the model's rows, creating missing ones, in batches.
+    Rows are written in key order, so two appliers lock them in the same order.
+    """
+    rows = sorted((key, totals) for key, totals in deltas.items() if any(totals))
+    if not rows:
+        return
+    opts = model._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    key_fields = [opts.get_field(name) for name in ('site', 'vehicle_type', 'status', period_field)]
+    value_fields = [opts.get_field(name) for name in ('bookings', 'slot_minutes', 'revenue')]
+    columns = ', '.join(qn(field.column) for field in key_fields + value_fields)
+    conflict = ', '.join(qn(field.column) for field in key_fields)
+    updates = ', '.join(
+        f"{qn(field.column)} = {table}.{qn(field.column)} + EXCLUDED.{qn(field.column)}" for field in value_fields
+    )
+    placeholder = '(' + ', '.join(['%s'] * (len(key_fields) + len(value_fields))) + ')'
+    fields = key_fields + value_fields
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH):
+            batch = rows[start:start + UPSERT_BATCH]
+            params = [
+                field.get_db_prep_save(value, connection)
+                for key, totals in batch for field, value in zip(fields, (*key, *totals))
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}",
+                params,
+            )
+
+
+def move(old_rows, new_rows):
+    """Queue replacing the contributions of `old_rows` by those of `new_rows`."""
+    BookingRollupDelta.objects.bulk_create(
+        [BookingRollupDelta(sign=-1, **dict(zip(ROLLUP_FIELDS, row))) for row in old_rows]
+        + [BookingRollupDelta(sign=1, **dict(zip(ROLLUP_FIELDS, row))) for row in new_rows]
+    )
+
+
+def _apply(rows, window=None):
+    """Upsert the contributions of (sign, *ROLLUP_FIELDS) `rows` into both tables."""
+    hourly, daily = defaultdict(lambda: [0, 0, Decimal('0')]), defaultdict(lambda: [0, 0, Decimal('0')])
+    for sign in (-1, 1):
+        for target, source in zip((hourly, daily), contributions([row[1:] for row in rows if row[0] == sign], sign, window)):
+            for key, totals in source.items():
+                target[key] = [a + b for a, b in zip(target[key], totals)]
+    live = set(Site.objects.filter(id__in={key[0] for key in daily}).values_list('id', flat=True))
+    _upsert(HourlyBookingRollup, 'hour', {key: totals for key, totals in hourly.items() if key[0] in live})
+    _upsert(DailyBookingRollup, 'day', {key: totals for key, totals in daily.items() if key[0] in live})
+
+
+def apply_deltas(batch_size):
+    """
+    Fold up to `batch_size` queued deltas into the rollups and drop them.
+    Concurrent appliers skip each other's rows. Returns the deltas applied.
+    """
+    with transaction.atomic():
+        deltas = list(
+            BookingRollupDelta.objects.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'sign', *ROLLUP_FIELDS)[:batch_size]
+        )
+        if not deltas:
+            return 0
+        _apply([row[1:] for row in deltas])
+        BookingRollupDelta.objects.filter(id__in=[row[0] for row in deltas]).delete()
+    return len(deltas)
+
+
+def booking_row(booking):
+    return tuple(getattr(booking, field) for field in ROLLUP_FIELDS)
+
+
+def record_transition(rows, old_status, new_status):
+    """
+    Move booking `rows` (ROLLUP_FIELDS tuples, as returned by the UPDATE)
+    that just switched from `old_status` to `new_status`. Call inside the
+    transaction that made the update.
+    """
+    move([row[:2] + (old_status,) + row[3:] for row in rows], [row[:2] + (new_status,) + row[3:] for row in rows])
+
+
+def rebuild(start, end):
+    """
+    Recompute the rollups of local days [start, end) from the bookings
+    table. Bookings touching the window are locked for the duration, so
+    transitions on them wait instead of racing the rebuild. Deltas queued
+    before the lock are applied first; the window's part of them is then
+    superseded by the recomputed rows.
+    """
+    tz = timezone.get_current_timezone()
+    window = (
+        datetime.datetime.combine(start, datetime.time(), tzinfo=tz),
+        datetime.datetime.combine(end, datetime.time(), tzinfo=tz),
+    )
+    with transaction.atomic():
+        rows = list(
+            Booking.objects.select_for_update()
+            .filter(Q(start_time__gte=window[0], start_time__lt=window[1])
+                    | Q(start_time__lt=window[1], end_time__gt=window[0]))
+            .values_list(*ROLLUP_FIELDS)
+        )
+        while apply_deltas(UPSERT_BATCH):
+            pass
+        HourlyBookingRollup.objects.filter(hour__gte=window[0], hour__lt=window[1]).delete()
+        DailyBookingRollup.objects.filter(day__gte=start, day__lt=end).delete()
+        _apply([(1, *row) for row in rows], window)
+    return len(rows)
+
+
+PERIODS = {
+    # name: (model, period field, longest range in days one request may read)
+    'hourly': (HourlyBookingRollup, 'hour', 31),
+    'daily': (DailyBookingRollup, 'day', 731),
+}
+GROUP_FIELDS = ('site_id', 'vehicle_type', 'status')
+
+
+def report(period, start, end, site_id=None, vehicle_type=None, statuses=None, group_by=('status',)):
+    """
+    Totals per period (and per `group_by` fields) for local days
+    start..end inclusive, read from the rollups only.
+    """
+    model, field, _ = PERIODS[period]
+    qs = model.objects.all()
+    if field == 'hour':
+        tz = timezone.get_current_timezone()
+        qs = qs.filter(
+            hour__gte=datetime.datetime.combine(start, datetime.time(), tzinfo=tz),
+            hour__lt=datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time(), tzinfo=tz),
+        )
+    else:
+        qs = qs.filter(day__gte=start, day__lte=end)
+    if site_id is not None:
+        qs = qs.filter(site_id=site_id)
+    if vehicle_type:
+        qs = qs.filter(vehicle_type=vehicle_type)
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+    keys = [field, *group_by]
+    return list(
+        qs.values(*keys)
+        .annotate(bookings=Sum('bookings'), slot_minutes=Sum('slot_minutes'), revenue=Sum('revenue'))
+        .order_by(*keys)
+    )
@@ -0,0 +1,197 @@
+"""
+Async (ASGI) variants of the hot public endpoints.
+
+Same request/response contracts as their api.views counterparts, served
+as native coroutines so one ASGI worker can keep many bookings in flight
+while they wait on Razorpay. DRF's @api_view is sync-only, so these are
+plain Django views that do DRF-compatible token authentication.
+
+Sections that need a transaction (slot reservation) or only hit warm
+caches (price quotes) run in the thread executor via sync_to_async.
+"""
+import json
+from decimal import Decimal
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.encoders import JSONEncoder
+import razorpay
+
+from .availability import reserve_booking
+from .booking_state import mark_paid, cancel_pending, NOT_FOUND, CONFLICT, REFUND_DUE, REFUND_DUE_DETAIL
+from .geo import near_candidates, rank_by_distance, parse_point, DEFAULT_RADIUS_KM, MAX_RADIUS_KM
+from .http_cache import conditional_listing
+from .idempotency import idempotent
+from .models import Site, Booking
+from .pricing_cache import get_tier_prices
+from . import razorpay_client
+from .razorpay_client import acreate_order
+from .search import search_queryset, matching_location_ids
+from .site_cards import with_cards, card_payloads, add_field, cards_response
+from .utils import calculate_amount, parse_window, parse_target, has_payment_fields, TARGET_ERROR, PAYMENT_ERROR
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def token_required(view):
+    """`Authorization: Token <key>` like DRF's TokenAuthentication + IsAuthenticated."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+        token = None
+        if keyword == 'Token' and key.strip():
+            token = await Token.objects.select_related('user').filter(key=key.strip()).afirst()
+        if token is None or not token.user.is_active:
+            return _json({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = token.user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _body(request):
+    """The JSON object in the request body, or None if it isn't one."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_GET
+@token_required
+@conditional_listing(shared=True)
+async def search_sites(request):
+    """Async api.views.search_sites (q, pincode, near, radius_km; no pagination modes)."""
+    q = request.GET.get('q', '').strip()
+    pincode = request.GET.get('pincode', '').strip()
+    near = request.GET.get('near', '')
+    location_ids = [i async for i in matching_location_ids(q)] if q else None
+    qs = with_cards(search_queryset(q, pincode, location_ids))
+    if not near:
+        sites = [site async for site in qs]
+        return cards_response(await sync_to_async(card_payloads)(sites))
+
+    try:
+        lat, lng = parse_point(near)
+        radius_km = float(request.GET.get('radius_km', DEFAULT_RADIUS_KM))
+    except ValueError:
+        return _json({'detail': 'near must be "lat,lng" and radius_km a number.'}, status=400)
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        return _json({'detail': f'radius_km must be between 0 and {MAX_RADIUS_KM}.'}, status=400)
+    sites = rank_by_distance([site async for site in near_candidates(qs, lat, lng, radius_km)], lat, lng, radius_km)
+    payloads = await sync_to_async(card_payloads)(sites)
+    return cards_response([add_field(p, 'distance_km', site.distance_km) for p, site in zip(payloads, sites)])
+
+
+@csrf_exempt
+@require_POST
+@token_required
+async def calculate_price(request):
+    """Async api.views.calculate_price."""
+    data = _body(request)
+    if data is None:
+        return _json({'detail': 'Invalid JSON body.'}, status=400)
+    target = parse_target(data)
+    if target is None:
+        return _json({'detail': TARGET_ERROR}, status=400)
+    if await sync_to_async(get_tier_prices)(*target) is None:
+        return _json({'detail': 'Not found.'}, status=404)
+    window = parse_window(data)
+    if window is None:
+        return _json({'detail': 'start_time and end_time must be ISO datetimes with end after start.'}, status=400)
+    result = await sync_to_async(calculate_amount)(*target, *window, data.get('optional_charges', []))
+    return _json(result)
+
+
+@csrf_exempt
+@require_POST
+@token_required
+@idempotent
+async def book_create(request):
+    """Async api.views.book_create; the Razorpay call awaits instead of blocking a thread."""
+    data = _body(request)
+    if data is None:
+        return _json({'detail': 'Invalid JSON body.'}, status=400)
+    target = parse_target(data)
+    if target is None:
+        return _json({'detail': TARGET_ERROR}, status=400)
+    site_id, vehicle_type = target
+    site = await Site.objects.filter(id=site_id).afirst()
+    if site is None:
+        return _json({'detail': 'Not found.'}, status=404)
+    window = parse_window(data)
+    if window is None:
+        return _json({'detail': 'start_time and end_time must be ISO datetimes with end after start.'}, status=400)
+    start, end = window
+    calc = await sync_to_async(calculate_amount)(site, vehicle_type, start, end, data.get('optional_charges', []))
+    amount_paise = int(Decimal(calc['total_amount']) * 100)
+
+    booking = await sync_to_async(reserve_booking)(
+        request.user, site, vehicle_type, start, end, calc, data.get('optional_charges'))
+    if booking is None:
+        return _json({'detail': 'No slots available for this time window.'}, status=409)
+
+    if settings.RAZORPAY_ASYNC_ORDERS:
+        from .tasks import create_razorpay_order
+        await sync_to_async(create_razorpay_order.delay)(str(booking.id))
+        return _json({
+            'booking_id': str(booking.id),
+            'razorpay_order_id': None,
+            'amount': amount_paise,
+            'razorpay_key': settings.RAZORPAY_KEY_ID,
+            'order_status_url': reverse('booking_order_status', args=[booking.id]),
+        }, status=202)
+
+    try:
+        razorpay_order = await acreate_order(amount_paise, receipt=str(booking.id))
+    except Exception:
+        await sync_to_async(cancel_pending)(booking.id)
+        return _json({'detail': 'Could not create payment order, please retry.'}, status=502)
+    await Booking.objects.filter(id=booking.id).aupdate(razorpay_order_id=razorpay_order['id'])
+
+    return _json({
+        'booking_id': str(booking.id),
+        'razorpay_order_id': razorpay_order['id'],
+        'amount': amount_paise,
+        'razorpay_key': settings.RAZORPAY_KEY_ID
+    }, status=201)
+
+
+@csrf_exempt
+@require_POST
+@token_required
+@idempotent
+async def verify_payment(request):
+    """Async api.views.verify_payment."""
+    payload = _body(request)
+    if payload is None:
+        return _json({'detail': 'Invalid JSON body.'}, status=400)
+    if not has_payment_fields(payload):
+        return _json({'detail': PAYMENT_ERROR}, status=400)
+    try:
+        razorpay_client.client.utility.verify_payment_signature({
+            'razorpay_order_id': payload['razorpay_order_id'],
+            'razorpay_payment_id': payload['razorpay_payment_id'],
+            'razorpay_signature': payload['razorpay_signature']
+        })
+    except razorpay.errors.SignatureVerificationError:
+        return _json({'detail': 'Signature verification failed'}, status=400)
+
+    result = await sync_to_async(mark_paid)(payload['booking_id'], payload['razorpay_order_id'],
+                                            payload['razorpay_payment_id'], payload['razorpay_signature'])
+    if result == NOT_FOUND:
+        return _json({'detail': 'Not found.'}, status=404)
+    if result == CONFLICT:
+        return _json({'detail': 'Booking is not awaiting this payment.'}, status=409)
+    if result == REFUND_DUE:
+        return _json({'detail': REFUND_DUE_DETAIL, 'status': 'refund_due'}, status=409)
+    return _json({'detail': 'Payment verified and booking confirmed.'})
@@ -0,0 +1,129 @@
+"""
+Slot availability over a time window.
+
+A booking holds a slot from start_time to end_time while it is paid, or
+while it is pending and younger than BOOKING_HOLD_TTL_MINUTES (an abandoned
+checkout stops blocking the slot once its hold lapses). Free slots for a window are the site's capacity minus the peak number
+of bookings overlapping at any instant of that window.
+
+The overlap query filters on end_time > window start first: historical
+bookings have ended, so the (site, vehicle_type, end_time, start_time)
+partial index on Booking skips them no matter how many there are.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Booking, SlotLock, OptionalCharge
+
+ACTIVE_STATUSES = ('pending', 'paid')
+HOLD_TTL = timedelta(minutes=getattr(settings, 'BOOKING_HOLD_TTL_MINUTES', 15))
+
+
+CAPACITY_FIELDS = {'car': 'total_slots_car', 'bike': 'total_slots_bike'}
+
+
+def site_capacity(site, vehicle_type):
+    try:
+        return getattr(site, CAPACITY_FIELDS[vehicle_type])
+    except KeyError:
+        raise ValueError(f"Unknown vehicle_type {vehicle_type!r}") from None
+
+
+def overlapping_bookings(site_ids, vehicle_types, start, end):
+    """Active bookings intersecting [start, end) for the given sites."""
+    hold_cutoff = timezone.now() - HOLD_TTL
+    return Booking.objects.filter(
+        Q(status='paid') | Q(status='pending', created_at__gte=hold_cutoff),
+        site_id__in=site_ids,
+        vehicle_type__in=vehicle_types,
+        # Redundant with the Q above, but lets the planner match the partial index.
+        status__in=ACTIVE_STATUSES,
+        end_time__gt=start,
+        start_time__lt=end,
+    )
+
+
+def peak_occupancy(intervals, start, end):
+    """Maximum number of intervals overlapping at once inside [start, end)."""
+    events = []
+    for s, e in intervals:
+        events.append((max(s, start), 1))
+        events.append((min(e, end), -1))
+    # Ends sort before starts at the same instant: back-to-back bookings share a slot.
+    events.sort(key=lambda ev: (ev[0], ev[1]))
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def availability(sites, vehicle_types, start, end):
+    """
+    Free slot counts for each site and vehicle type over [start, end).
+    One query regardless of how many sites are asked for.
+    """
+    sites = list(sites)
+    intervals = defaultdict(list)
+    rows = overlapping_bookings([s.id for s in sites], vehicle_types, start, end).values_list(
+        'site_id', 'vehicle_type', 'start_time', 'end_time')
+    for site_id, vehicle_type, s, e in rows:
+        intervals[(site_id, vehicle_type)].append((s, e))
+
+    results = []
+    for site in sites:
+        for vehicle_type in vehicle_types:
+            capacity = site_capacity(site, vehicle_type)
+            booked = peak_occupancy(intervals[(site.id, vehicle_type)], start, end)
+            results.append({
+                'site_id': site.id,
+                'vehicle_type': vehicle_type,
+                'capacity': capacity,
+                'booked': booked,
+                'available': max(capacity - booked, 0),
+            })
+    return results
+
+
+def free_slots(site, vehicle_type, start, end):
+    return availability([site], [vehicle_type], start, end)[0]['available']
+
+
+def lock_slots(site_id, vehicle_type):
+    """
+    Row-lock the (site, vehicle_type) SlotLock until the current transaction
+    ends, so concurrent reservations for that pair check and insert one at a
+    time while other sites proceed in parallel. Must run inside atomic().
+    """
+    SlotLock.objects.get_or_create(site_id=site_id, vehicle_type=vehicle_type)
+    return SlotLock.objects.select_for_update().get(site_id=site_id, vehicle_type=vehicle_type)
+
+
+def reserve_booking(user, site, vehicle_type, start, end, calc, optional_charge_ids=None):
+    """
+    Atomically check capacity and create the pending booking that holds the
+    slot (it lapses after BOOKING_HOLD_TTL_MINUTES). Returns None when the
+    window is full. `calc` is the calculate_amount result.
+    """
+    with transaction.atomic():
+        lock_slots(site.id, vehicle_type)
+        if free_slots(site, vehicle_type, start, end) <= 0:
+            return None
+        booking = Booking.objects.create(
+            user=user,
+            site=site,
+            vehicle_type=vehicle_type,
+            start_time=start,
+            end_time=end,
+            duration_minutes=calc['duration_minutes'],
+            base_amount=Decimal(calc['base_amount']),
+            total_amount=Decimal(calc['total_amount']),
+            status='pending'
+        )
+        if optional_charge_ids:
+            booking.optional_charges.set(OptionalCharge.objects.filter(id__in=optional_charge_ids))
+    return booking
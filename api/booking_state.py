@@ -0,0 +1,184 @@
+"""
+Booking status transitions shared by the sync/async views and webhooks.
+
+Each transition locks the pending row (SELECT ... FOR UPDATE, which also
+reads the fields the rollups need) and then UPDATEs only the changed
+columns, in one transaction. Retried or duplicate callbacks wait on the
+lock and then find the row no longer pending, so they cannot apply it
+twice, and side effects are queued only by the call that moved the row.
+
+Orders are auto-captured, so a payment can arrive after the booking's
+hold lapsed (expired, or pending but past BOOKING_HOLD_TTL_MINUTES) or
+after it was cancelled. settle_late_payment() then re-checks capacity
+under the slot lock: the booking is revived as paid if its slot is still
+free, and otherwise kept with the payment as `refund_due` and logged.
+"""
+import logging
+from functools import partial
+
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from . import analytics
+from .availability import HOLD_TTL, free_slots, lock_slots
+from .models import Booking, Site
+
+logger = logging.getLogger(__name__)
+
+PAID = 'paid'
+ALREADY_PAID = 'already_paid'
+REFUND_DUE = 'refund_due'
+CONFLICT = 'conflict'
+NOT_FOUND = 'not_found'
+REFUND_DUE_DETAIL = 'The slot was released before the payment completed; the payment will be refunded.'
+# States a captured payment can still find its booking in after the hold.
+LATE_STATUSES = ('pending', 'expired', 'cancelled')
+
+
+def _lock_pending(queryset):
+    """Lock the pending booking in `queryset`; its ROLLUP_FIELDS, or None if there is none."""
+    return queryset.select_for_update().filter(status='pending').values_list(*analytics.ROLLUP_FIELDS).first()
+
+
+def _held(queryset):
+    """Bookings in `queryset` whose hold has not lapsed, so their slot is still counted."""
+    return queryset.filter(created_at__gte=timezone.now() - HOLD_TTL)
+
+
+def _outcome(booking_id, order_id, payment_id):
+    """Result for a payment that did not move the booking, from its current state."""
+    current = Booking.objects.filter(id=booking_id).values_list('status', 'razorpay_order_id', 'razorpay_payment_id').first()
+    if current is None:
+        return NOT_FOUND
+    if current == ('paid', order_id, payment_id):
+        return ALREADY_PAID
+    if current == ('refund_due', order_id, payment_id):
+        return REFUND_DUE
+    return CONFLICT
+
+
+def _notify(booking_id):
+    from .tasks import send_booking_notifications
+    send_booking_notifications.delay(str(booking_id))
+
+
+def mark_paid(booking_id, order_id, payment_id, signature=None):
+    """
+    pending -> paid for the booking that owns `order_id`.
+
+    Returns PAID on the first transition (notifications are enqueued once
+    the transaction commits), ALREADY_PAID when the same payment was applied
+    before, REFUND_DUE when the payment came after the hold and the slot was
+    gone (see settle_late_payment), CONFLICT when the booking is in another
+    state or belongs to another order/payment, and NOT_FOUND when there is
+    no such booking.
+    """
+    with transaction.atomic():
+        row = _lock_pending(_held(Booking.objects.filter(id=booking_id, razorpay_order_id=order_id)))
+        if row is not None:
+            Booking.objects.filter(id=booking_id).update(
+                status='paid', razorpay_payment_id=payment_id, razorpay_signature=signature)
+            analytics.record_transition([row], 'pending', 'paid')
+            transaction.on_commit(lambda: _notify(booking_id))
+            return PAID
+    result = settle_late_payment(booking_id, order_id, payment_id, signature)
+    return _outcome(booking_id, order_id, payment_id) if result is None else result
+
+
+def settle_late_payment(booking_id, order_id, payment_id, signature=None):
+    """
+    Apply a captured payment to a booking whose hold lapsed or that was
+    cancelled. Under the (site, vehicle_type) slot lock, an expired or
+    lapsed booking whose slot is still free becomes paid (PAID); otherwise
+    the booking becomes refund_due with the payment recorded (REFUND_DUE).
+    Returns None when the booking is not in a LATE_STATUSES state for
+    this order.
+    """
+    with transaction.atomic():
+        target = Booking.objects.filter(id=booking_id, razorpay_order_id=order_id, status__in=LATE_STATUSES)
+        booking = target.only('site_id', 'vehicle_type').first()
+        if booking is None:
+            return None
+        lock_slots(booking.site_id, booking.vehicle_type)
+        row = target.select_for_update().values_list(*analytics.ROLLUP_FIELDS).first()
+        if row is None:
+            return None
+        site_id, vehicle_type, old_status, start, end, _ = row
+        revive = old_status != 'cancelled' and free_slots(
+            Site.objects.only('total_slots_car', 'total_slots_bike').get(id=site_id), vehicle_type, start, end) > 0
+        new_status = 'paid' if revive else 'refund_due'
+        Booking.objects.filter(id=booking_id).update(
+            status=new_status, razorpay_payment_id=payment_id, razorpay_signature=signature)
+        analytics.record_transition([row], old_status, new_status)
+        if revive:
+            transaction.on_commit(lambda: _notify(booking_id))
+            return PAID
+    logger.error(
+        'Payment %s for %s booking %s arrived after its slot was released; refund due',
+        payment_id, old_status, booking_id,
+        extra={'booking_id': str(booking_id), 'razorpay_payment_id': payment_id, 'refund_due': True},
+    )
+    return REFUND_DUE
+
+
+def mark_paid_bulk(payments):
+    """
+    pending -> paid for many bookings at once; `payments` maps
+    razorpay_order_id -> razorpay_payment_id. Held bookings move with one
+    locking SELECT and one UPDATE regardless of size; the rest go through
+    settle_late_payment one by one, in slot-lock order.
+
+    Returns (ids of bookings that moved to paid, {order_id: REFUND_DUE |
+    CONFLICT | NOT_FOUND} for payments that confirmed nothing and need a
+    refund). Payments that were already applied appear in neither.
+    """
+    if not payments:
+        return [], {}
+    booking_ids = []
+    with transaction.atomic():
+        rows = list(
+            _held(Booking.objects.select_for_update())
+            .filter(status='pending', razorpay_order_id__in=list(payments))
+            .values_list('id', 'razorpay_order_id', *analytics.ROLLUP_FIELDS)
+        )
+        if rows:
+            booking_ids = [row[0] for row in rows]
+            Booking.objects.filter(id__in=booking_ids).update(
+                status='paid',
+                razorpay_payment_id=Case(
+                    *[When(razorpay_order_id=row[1], then=Value(payments[row[1]])) for row in rows],
+                    output_field=models.CharField(),
+                ),
+            )
+            analytics.record_transition([row[2:] for row in rows], 'pending', 'paid')
+            for booking_id in booking_ids:
+                transaction.on_commit(partial(_notify, booking_id))
+
+        unsettled = {}
+        moved = {row[1] for row in rows}
+        remaining = [order_id for order_id in payments if order_id not in moved]
+        found = sorted(
+            Booking.objects.filter(razorpay_order_id__in=remaining)
+            .values_list('site_id', 'vehicle_type', 'razorpay_order_id', 'id', 'status', 'razorpay_payment_id')
+        ) if remaining else []
+        for _, _, order_id, booking_id, status, _ in found:
+            result = settle_late_payment(booking_id, order_id, payments[order_id]) if status in LATE_STATUSES else None
+            result = result or _outcome(booking_id, order_id, payments[order_id])
+            if result == PAID:
+                booking_ids.append(booking_id)
+            elif result != ALREADY_PAID:
+                unsettled[order_id] = result
+        for order_id in set(remaining) - {row[2] for row in found}:
+            unsettled[order_id] = NOT_FOUND
+    return booking_ids, unsettled
+
+
+def cancel_pending(booking_id):
+    """pending -> cancelled (the hold is given back). Returns True if the booking moved."""
+    with transaction.atomic():
+        row = _lock_pending(Booking.objects.filter(id=booking_id))
+        if row is None:
+            return False
+        Booking.objects.filter(id=booking_id).update(status='cancelled')
+        analytics.record_transition([row], 'pending', 'cancelled')
+    return True
@@ -0,0 +1,133 @@
+"""
+A local stand-in for the Razorpay Orders API, for tests and benchmarks.
+
+    with FakeRazorpayServer(latency=0.2) as server:
+        client = build_client(base_url=server.url)
+
+Speaks HTTP/1.1 keep-alive so connection pooling can be observed via
+`connections`, and can inject latency and 503 failures.
+"""
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def sign(order_id, payment_id, secret):
+    """The checkout signature Razorpay would send for a successful payment."""
+    msg = f"{order_id}|{payment_id}".encode()
+    return hmac.new(str(secret).encode(), msg, hashlib.sha256).hexdigest()
+
+
+def sign_webhook(body, secret):
+    """The X-Razorpay-Signature header for a webhook `body` (bytes or str)."""
+    if isinstance(body, str):
+        body = body.encode()
+    return hmac.new(str(secret).encode(), body, hashlib.sha256).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle plus
+    # delayed ACKs add ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_or_fail(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failure_rate and random.random() < server.failure_rate:
+            self._send(503, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = json.loads(self.rfile.read(length) or b'{}')
+        if self._delay_or_fail():
+            return
+        if self.path.rstrip('/') != '/v1/orders':
+            return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+        order = {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': data.get('amount'),
+            'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'),
+            'status': 'created',
+            'created_at': int(time.time()),
+        }
+        with self.server.lock:
+            self.server.orders[order['id']] = order
+        self._send(200, order)
+
+    def do_GET(self):
+        if self._delay_or_fail():
+            return
+        order = self.server.orders.get(self.path.rstrip('/').rsplit('/', 1)[-1])
+        if order is None:
+            return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}})
+        self._send(200, order)
+
+
+class FakeRazorpayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.connections = 0
+        self.requests = 0
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that's expected here.
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,69 @@
+import math
+from decimal import Decimal
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 50.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Return (min_lat, max_lat, min_lng, max_lng) enclosing a circle of
+    `radius_km` around the point. Used as an index-friendly prefilter.
+    """
+    lat, lng = float(lat), float(lng)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Longitude degrees shrink towards the poles; guard the cos() at the poles.
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(lat)), 1e-6)))
+    quant = lambda v: Decimal(str(round(v, 6)))
+    return (
+        quant(max(lat - dlat, -90.0)), quant(min(lat + dlat, 90.0)),
+        quant(max(lng - dlng, -180.0)), quant(min(lng + dlng, 180.0)),
+    )
+
+
+def parse_point(value):
+    """Parse a 'lat,lng' query param. Raises ValueError on bad input."""
+    lat, lng = (float(part) for part in value.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('Coordinates out of range')
+    return lat, lng
+
+
+def near_candidates(queryset, lat, lng, radius_km=DEFAULT_RADIUS_KM):
+    """Bounding-box prefilter on the indexed (lat, lng) columns of Site."""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    return queryset.filter(
+        lat__gte=min_lat, lat__lte=max_lat,
+        lng__gte=min_lng, lng__lte=max_lng,
+    )
+
+
+def rank_by_distance(sites, lat, lng, radius_km=DEFAULT_RADIUS_KM):
+    """Keep sites truly within `radius_km`, nearest first, tagging `distance_km`."""
+    results = []
+    for site in sites:
+        distance = haversine_km(lat, lng, site.lat, site.lng)
+        if distance <= radius_km:
+            site.distance_km = round(distance, 3)
+            results.append(site)
+    results.sort(key=lambda s: s.distance_km)
+    return results
+
+
+def sites_near(queryset, lat, lng, radius_km=DEFAULT_RADIUS_KM):
+    """
+    Sites within `radius_km` of (lat, lng), nearest first.
+
+    The bounding box narrows the candidates using the (lat, lng) index on
+    Site, then the exact haversine distance is computed only for those rows.
+    Each returned site carries a `distance_km` attribute.
+    """
+    return rank_by_distance(near_candidates(queryset, lat, lng, radius_km), lat, lng, radius_km)
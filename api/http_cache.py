@@ -0,0 +1,128 @@
+"""
+Conditional GET and a shared response cache for site listings.
+
+Listing responses only change when the site catalog does (Site, Location,
+Pricing or OptionalCharge rows), so they are stamped with a catalog
+version: a millisecond timestamp in the shared cache. It is bumped when a
+change is written and again once it commits and the affected site cards
+are rebuilt (api/site_cards.py).
+
+Each response carries ETag (catalog version + path + normalized query
+params) and Last-Modified (the version). A client revalidating with
+If-None-Match / If-Modified-Since gets a 304 before the view runs, so
+there is no ORM or serializer work. Search results do not depend on who
+asks, so views decorated with shared=True also serve repeated queries
+from one cache entry per (version, query). A version bump makes every
+old entry unreachable, and old entries then age out.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version'
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def catalog_version():
+    """Current catalog version: epoch milliseconds of the last change (or first use)."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _now_ms(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Mark the catalog changed. Strictly increasing, so no two states share an ETag."""
+    cache.set(VERSION_KEY, max(_now_ms(), (cache.get(VERSION_KEY) or 0) + 1), None)
+
+
+def query_key(request):
+    """Host, path and the non-empty query params, sorted with whitespace collapsed."""
+    params = sorted(
+        (name, ' '.join(value.split()))
+        for name, values in request.GET.lists() for value in values if value.strip()
+    )
+    query = '&'.join(f"{name}={value}" for name, value in params)
+    return f"{request.get_host()}{request.path}?{query}"
+
+
+def _stamp(request):
+    version = catalog_version()
+    digest = hashlib.sha256(f"{version}:{query_key(request)}".encode()).hexdigest()
+    return version, f'"{digest[:32]}"', f"listing:{digest}"
+
+
+def _headers(response, version, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(version // 1000)
+    # Revalidate every time; a 304 is cheap and never stale.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _begin(request, shared, drf):
+    """(version, etag, cache_key, response) where response short-circuits the view."""
+    version, etag, cache_key = _stamp(request)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=version // 1000)
+    if not_modified is not None:
+        return version, etag, cache_key, _headers(not_modified, version, etag)
+    stored = cache.get(cache_key) if shared else None
+    if stored is None:
+        return version, etag, cache_key, None
+    if drf and 'data' in stored:
+        response = Response(stored['data'])
+    elif 'content' in stored:
+        response = HttpResponse(stored['content'], content_type=stored['content_type'])
+    else:
+        return version, etag, cache_key, None
+    return version, etag, cache_key, _headers(response, version, etag)
+
+
+def _finish(response, version, etag, cache_key, shared):
+    if response.status_code != 200 or response.streaming:
+        return response
+    if shared:
+        if isinstance(response, Response):
+            stored = {'data': response.data}
+        else:
+            stored = {'content': response.content, 'content_type': response.get('Content-Type')}
+        cache.set(cache_key, stored, getattr(settings, 'LISTING_CACHE_TIMEOUT', 300))
+    return _headers(response, version, etag)
+
+
+def conditional_listing(shared=False):
+    """
+    Decorate a GET DRF function view (below @api_view, so authentication
+    and permissions run first) or an async Django view.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                version, etag, cache_key, response = await sync_to_async(_begin)(request, shared, False)
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                return await sync_to_async(_finish)(response, version, etag, cache_key, shared)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version, etag, cache_key, response = _begin(request, shared, True)
+            if response is not None:
+                return response
+            return _finish(view(request, *args, **kwargs), version, etag, cache_key, shared)
+        return wrapper
+    return decorator
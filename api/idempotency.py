@@ -0,0 +1,114 @@
+"""
+Idempotency-Key support for unsafe endpoints.
+
+A client that retries a request with the same `Idempotency-Key` header
+gets the stored response of the first attempt instead of a second booking
+or payment transition. Keys are scoped to the user and path and kept in
+the cache for IDEMPOTENCY_KEY_TTL seconds. A retry that arrives while the
+first attempt is still running gets 409; reusing a key with a different
+body gets 422.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+IN_PROGRESS_TTL = 60
+_IN_PROGRESS = 'in-progress'
+
+
+def _cache_key(request, key):
+    user_id = getattr(request.user, 'pk', None) or 'anon'
+    digest = hashlib.sha256(f"{user_id}:{request.path}:{key}".encode()).hexdigest()
+    return f"idempotency:{digest}"
+
+
+def _fingerprint(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def _conflict(message, status, drf):
+    if drf:
+        return Response({'detail': message}, status=status)
+    return HttpResponse(json.dumps({'detail': message}), status=status, content_type='application/json')
+
+
+def _begin(request, key, fingerprint, drf):
+    """Claim the key, or return the response to send instead of running the view."""
+    cache_key = _cache_key(request, key)
+    if cache.add(cache_key, _IN_PROGRESS, IN_PROGRESS_TTL):
+        return cache_key, None
+    stored = cache.get(cache_key)
+    if stored is None or stored == _IN_PROGRESS:
+        return cache_key, _conflict('A request with this Idempotency-Key is still in progress.', 409, drf)
+    if stored['fingerprint'] != fingerprint:
+        return cache_key, _conflict('Idempotency-Key was already used with a different request body.', 422, drf)
+    if drf:
+        response = Response(stored['data'], status=stored['status'])
+    else:
+        response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    response['Idempotent-Replay'] = 'true'
+    return cache_key, response
+
+
+def _finish(cache_key, fingerprint, response, drf):
+    if response.status_code >= 500:
+        # Let the client retry server errors for real.
+        cache.delete(cache_key)
+        return
+    stored = {'fingerprint': fingerprint, 'status': response.status_code}
+    if drf:
+        stored['data'] = response.data
+    else:
+        stored['content'] = response.content
+        stored['content_type'] = response.get('Content-Type')
+    cache.set(cache_key, stored, getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def idempotent(view):
+    """
+    Decorate a DRF function view (below @api_view) or an async Django view.
+    Requests without the header run normally.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return await view(request, *args, **kwargs)
+            fingerprint = _fingerprint(request.body)
+            cache_key, replay = await sync_to_async(_begin)(request, key, fingerprint, False)
+            if replay is not None:
+                return replay
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception:
+                await sync_to_async(cache.delete)(cache_key)
+                raise
+            await sync_to_async(_finish)(cache_key, fingerprint, response, False)
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        fingerprint = _fingerprint(json.dumps(request.data, sort_keys=True, default=str).encode())
+        cache_key, replay = _begin(request, key, fingerprint, True)
+        if replay is not None:
+            return replay
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        _finish(cache_key, fingerprint, response, True)
+        return response
+    return wrapper
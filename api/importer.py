@@ -0,0 +1,238 @@
+"""
+Bulk import of sites with their pricing tiers and optional charges.
+
+Rows are streamed from JSONL (one site per line, pricing and charges as
+nested lists) or CSV (one site per row):
+
+    site_name,address,location_name,pincode,lat,lng,total_slots_car,total_slots_bike,price_car_0_2,price_bike_full_day,charges
+    P1,1 Main Rd,Andheri East,400069,19.11,72.86,50,100,60,150,Valet:50;Wash:80:inactive
+
+Each row is validated with SiteImportSerializer. Rows are upserted in
+chunks, one transaction per chunk:
+
+- Locations match by name. Sites match by (location, site name), and
+  later rows for the same site win.
+- Sites and charges have no unique constraints, so they are matched in
+  memory and written with bulk_create / bulk_update.
+- Pricing tiers use bulk_create(update_conflicts=True) on the
+  (site, vehicle_type, tier) unique key.
+
+Bulk writes skip model signals, so the pricing cache of every touched
+site is invalidated, and its listing card rebuilt, when the chunk commits.
+"""
+import csv
+import json
+import time
+
+from django.db import transaction
+
+from . import pricing_cache, site_cards
+from .models import Location, Site, Pricing, OptionalCharge, VEHICLE_CHOICES
+from .serializers import SiteImportSerializer
+
+DEFAULT_CHUNK_SIZE = 500
+SITE_FIELDS = ('address', 'pincode', 'lat', 'lng', 'total_slots_car', 'total_slots_bike')
+PRICE_COLUMNS = {
+    f'price_{vehicle}_{tier}': (vehicle, tier)
+    for vehicle, _ in VEHICLE_CHOICES for tier, _ in Pricing.TIER_CHOICES
+}
+
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _text_lines(stream, errors):
+    """
+    Decode a text or bytes stream line by line. A line that isn't UTF-8 is
+    appended to `errors` as (line_number, message) and read as a blank line,
+    which both formats skip, so one bad line can't abort a half-written import.
+    """
+    for number, line in enumerate(stream, start=1):
+        if isinstance(line, bytes):
+            try:
+                # utf-8-sig drops the BOM spreadsheet exports put before the header.
+                line = line.decode('utf-8-sig')
+            except UnicodeDecodeError as e:
+                errors.append((number, f"not UTF-8 (byte {e.start}): save the file as UTF-8"))
+                line = '\n'
+        yield line
+
+
+def _drain(errors):
+    while errors:
+        yield errors.pop(0)
+
+
+def parse_jsonl(stream):
+    """Yield (line_number, record) from a JSONL text or bytes stream; bad lines yield an error string."""
+    errors = []
+    for number, line in enumerate(_text_lines(stream, errors), start=1):
+        yield from _drain(errors)
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, f"invalid JSON: {e}"
+
+
+def _parse_charges(value):
+    charges = []
+    for item in filter(None, (part.strip() for part in (value or '').split(';'))):
+        name, _, rest = item.partition(':')
+        amount, _, flag = rest.partition(':')
+        charges.append({'name': name.strip(), 'amount': amount.strip(), 'is_active': flag.strip() != 'inactive'})
+    return charges
+
+
+def parse_csv(stream):
+    """Yield (line_number, record) from a CSV text or bytes stream with a header row; undecodable lines yield an error string."""
+    errors = []
+    reader = csv.DictReader(_text_lines(stream, errors))
+    for row in reader:
+        yield from _drain(errors)
+        record = {k: v for k, v in row.items() if k and k not in PRICE_COLUMNS and k != 'charges' and v != ''}
+        record['pricing'] = [
+            {'vehicle_type': vehicle, 'tier': tier, 'price': row[column]}
+            for column, (vehicle, tier) in PRICE_COLUMNS.items() if row.get(column)
+        ]
+        record['charges'] = _parse_charges(row.get('charges'))
+        yield reader.line_num, record
+    yield from _drain(errors)
+
+
+PARSERS = {'jsonl': parse_jsonl, 'csv': parse_csv}
+
+
+def _write_chunk(rows, dry_run=False):
+    """Upsert one chunk of validated rows; returns counts. A dry run schedules no cache or card refresh."""
+    # Later rows for the same (location, site) replace earlier ones.
+    rows = list({(row['location_name'], row['site_name']): row for row in rows}.values())
+
+    locations = {}
+    for location in Location.objects.filter(name__in={row['location_name'] for row in rows}).order_by('-id'):
+        locations[location.name] = location  # lowest id wins, like get_or_create's first match
+    new_locations = {}
+    for row in rows:
+        name = row['location_name']
+        if name not in locations and name not in new_locations:
+            new_locations[name] = Location(name=name, pincode=row.get('pincode'), lat=row.get('lat'), lng=row.get('lng'))
+    Location.objects.bulk_create(new_locations.values())
+    locations.update(new_locations)
+
+    existing = {
+        (site.location_id, site.name): site
+        for site in Site.objects.filter(location__in=list(locations.values()), name__in={row['site_name'] for row in rows})
+        .order_by('-id')
+    }
+    created, updated, site_for_row = [], [], []
+    for row in rows:
+        location = locations[row['location_name']]
+        site = existing.get((location.id, row['site_name']))
+        if site is None:
+            site = Site(location=location, name=row['site_name'])
+            created.append(site)
+        else:
+            updated.append(site)
+        site.address = row.get('address', site.address or '')
+        site.pincode = row.get('pincode', site.pincode)
+        site.total_slots_car = row.get('total_slots_car', site.total_slots_car)
+        site.total_slots_bike = row.get('total_slots_bike', site.total_slots_bike)
+        site.lat, site.lng = row.get('lat', site.lat), row.get('lng', site.lng)
+        if site.lat is None and site.lng is None:
+            # Site.save() does this for single saves; bulk_create skips save().
+            site.lat, site.lng = location.lat, location.lng
+        site_for_row.append(site)
+    Site.objects.bulk_create(created)
+    Site.objects.bulk_update(updated, SITE_FIELDS)
+
+    pricings = {
+        (site.id, tier['vehicle_type'], tier['tier']): Pricing(
+            site=site, vehicle_type=tier['vehicle_type'], tier=tier['tier'], price=tier['price'])
+        for site, row in zip(site_for_row, rows) for tier in row['pricing']
+    }
+    Pricing.objects.bulk_create(pricings.values(), update_conflicts=True,
+                                unique_fields=['site', 'vehicle_type', 'tier'], update_fields=['price'])
+
+    charges = {
+        (charge.site_id, charge.name): charge
+        for charge in OptionalCharge.objects.filter(site__in=updated).order_by('-id')
+    } if updated else {}
+    new_charges, changed_charges = {}, {}
+    for site, row in zip(site_for_row, rows):
+        for item in row['charges']:
+            key = (site.id, item['name'])
+            charge = charges.get(key)
+            if charge is None:
+                charge = charges[key] = new_charges[key] = OptionalCharge(site=site, name=item['name'])
+            elif key not in new_charges:
+                changed_charges[key] = charge
+            charge.amount, charge.is_active = item['amount'], item['is_active']
+    OptionalCharge.objects.bulk_create(new_charges.values())
+    OptionalCharge.objects.bulk_update(changed_charges.values(), ['amount', 'is_active'])
+
+    if not dry_run:
+        touched = [site.id for site in site_for_row]
+        transaction.on_commit(lambda: [pricing_cache.invalidate_site(site_id) for site_id in touched])
+        site_cards.schedule_refresh(touched)
+    return {
+        'locations_created': len(new_locations), 'sites_created': len(created), 'sites_updated': len(updated),
+        'pricings': len(pricings), 'charges': len(new_charges) + len(changed_charges),
+    }
+
+
+def import_sites(records, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """
+    Validate and upsert (line_number, record) pairs. Invalid rows are
+    skipped and reported (the first MAX_REPORTED_ERRORS of them). Returns a
+    report dict with counts, errors and rows/sec.
+    """
+    report = {'rows': 0, 'error_count': 0, 'errors': [], 'locations_created': 0, 'sites_created': 0, 'sites_updated': 0,
+              'pricings': 0, 'charges': 0}
+    started = time.perf_counter()
+    chunk = []
+
+    def flush():
+        if not chunk:
+            return
+        with transaction.atomic():
+            counts = _write_chunk(chunk, dry_run)
+            if dry_run:
+                transaction.set_rollback(True)
+        for key, value in counts.items():
+            report[key] += value
+        chunk.clear()
+
+    def reject(number, errors):
+        report['error_count'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': number, 'errors': errors})
+
+    for number, record in records:
+        report['rows'] += 1
+        if isinstance(record, str):
+            reject(number, record)
+            continue
+        serializer = SiteImportSerializer(data=record)
+        if not serializer.is_valid():
+            reject(number, serializer.errors)
+            continue
+        chunk.append(serializer.validated_data)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['rows_per_sec'] = round(report['rows'] / report['seconds'], 1) if report['seconds'] else 0.0
+    report['dry_run'] = dry_run
+    return report
+
+
+def detect_format(name, default='jsonl'):
+    lowered = (name or '').lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
+
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.analytics import rebuild
+from api.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hourly/daily booking rollups from the bookings table, a few days per "
+        "transaction. Safe to re-run; by default covers every day that has bookings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD). Default: earliest booking.')
+        parser.add_argument('--end', help='Last day, inclusive (YYYY-MM-DD). Default: latest booking end.')
+        parser.add_argument('--chunk-days', type=int, default=1, help='Days rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        bounds = Booking.objects.aggregate(first=Min('start_time'), last=Max('end_time'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write("No bookings; nothing to backfill")
+            return
+        start = parse_date(options['start']) if options['start'] else timezone.localdate(bounds['first'])
+        end = parse_date(options['end']) if options['end'] else timezone.localdate(bounds['last'])
+        if start is None or end is None or end < start:
+            raise CommandError('--start/--end must be YYYY-MM-DD with start <= end.')
+        step = datetime.timedelta(days=max(options['chunk_days'], 1))
+
+        day, chunks, rows = start, 0, 0
+        while day <= end:
+            upto = min(day + step, end + datetime.timedelta(days=1))
+            rows += rebuild(day, upto)
+            chunks += 1
+            day = upto
+        self.stdout.write(f"Rebuilt {start}..{end} in {chunks} chunks ({rows} booking rows read)")
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, AsyncClient, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api import razorpay_client
+from api.bench import throwaway_database, summarize
+from api.fake_razorpay import FakeRazorpayServer
+from api.models import Location, Site, Pricing
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare booking throughput of the sync view on a WSGI-style thread pool "
+        "with the async view on one ASGI event loop, against a slow fake Razorpay. "
+        "Runs on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.2, help='Simulated gateway latency in seconds.')
+        parser.add_argument('--wsgi-threads', type=int, default=8, help='Worker threads standing in for WSGI workers.')
+        parser.add_argument('--asgi-concurrency', type=int, default=100, help='In-flight requests on the event loop.')
+        parser.add_argument('--json', dest='json_path', help='Also write results to this file.')
+
+    def handle(self, *args, **options):
+        with throwaway_database(), override_settings(RAZORPAY_ASYNC_ORDERS=False):
+            body, headers = self._seed(options['requests'])
+            with FakeRazorpayServer(latency=options['latency']) as server:
+                razorpay_client.configure(base_url=server.url)
+                try:
+                    results = {
+                        'wsgi': self._run_wsgi(body, headers, options['requests'], options['wsgi_threads']),
+                        'asgi': self._run_asgi(body, headers, options['requests'], options['asgi_concurrency']),
+                    }
+                finally:
+                    razorpay_client.configure()
+
+        results['config'] = {k: options[k] for k in ('requests', 'latency', 'wsgi_threads', 'asgi_concurrency')}
+        for mode in ('wsgi', 'asgi'):
+            r = results[mode]
+            self.stdout.write(
+                f"{mode}: {r['throughput_rps']} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                f"p99 {r['p99_ms']} ms  ({r['requests']} requests in {r['elapsed_s']} s, {r['errors']} errors)"
+            )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+    def _seed(self, count):
+        user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench')
+        token = Token.objects.create(user=user)
+        location = Location.objects.create(name='Bench')
+        # Enough capacity for both runs so every booking succeeds.
+        site = Site.objects.create(name='Bench Site', location=location, total_slots_car=count * 2 + 1)
+        Pricing.objects.create(site=site, vehicle_type='car', tier='0_2', price=Decimal('60.00'))
+        start = timezone.now() + timezone.timedelta(days=1)
+        body = {'site_id': site.id, 'vehicle_type': 'car',
+                'start_time': start.isoformat(), 'end_time': (start + timezone.timedelta(hours=1)).isoformat()}
+        return body, {'Authorization': f'Token {token.key}'}
+
+    def _run_wsgi(self, body, headers, count, threads):
+        url = reverse('book_create')
+
+        def one(_):
+            began = time.perf_counter()
+            try:
+                response = Client().post(url, body, content_type='application/json', headers=headers)
+            finally:
+                connections.close_all()
+            return time.perf_counter() - began, response.status_code
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(one, range(count)))
+        return self._result(outcomes, time.perf_counter() - began)
+
+    def _run_asgi(self, body, headers, count, concurrency):
+        url = reverse('async_book_create')
+
+        async def main():
+            client = AsyncClient()
+            gate = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with gate:
+                    began = time.perf_counter()
+                    response = await client.post(url, body, content_type='application/json', headers=headers)
+                    return time.perf_counter() - began, response.status_code
+
+            try:
+                return await asyncio.gather(*(one() for _ in range(count)))
+            finally:
+                # The ORM ran on the sync_to_async worker thread; release its connection.
+                await sync_to_async(connections.close_all)()
+
+        began = time.perf_counter()
+        outcomes = asyncio.run(main())
+        return self._result(outcomes, time.perf_counter() - began)
+
+    def _result(self, outcomes, elapsed):
+        result = summarize([latency for latency, _ in outcomes], elapsed)
+        result['errors'] = sum(1 for _, code in outcomes if code != 201)
+        return result
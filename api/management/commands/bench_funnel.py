@@ -0,0 +1,229 @@
+import datetime
+import json
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api import metrics, razorpay_client
+from api.bench import throwaway_database, summarize
+from api.fake_razorpay import FakeRazorpayServer, sign
+from api.models import Location, Site, Pricing, OptionalCharge, Booking
+
+STAGES = ('search_sites', 'calculate_price', 'book_create', 'verify_payment')
+KEY_SECRET = 'bench_secret'
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the booking funnel (search -> quote -> book -> verify) against a "
+        "seeded throwaway database and a fake Razorpay. Reports p50/p95/p99, "
+        "throughput and queries per request per endpoint; --json stores the results "
+        "and --compare diffs them against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=50)
+        parser.add_argument('--sites-per-location', type=int, default=20)
+        parser.add_argument('--bookings', type=int, default=10000, help='Existing paid bookings to seed.')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per stage.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Simulated gateway latency in seconds.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', dest='json_path', help='Write results to this file.')
+        parser.add_argument('--compare', help='Earlier --json results to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p95/queries growth (0.10 = 10%%).')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with throwaway_database(), \
+                override_settings(RAZORPAY_ASYNC_ORDERS=False, RAZORPAY_KEY_ID='rzp_bench', RAZORPAY_KEY_SECRET=KEY_SECRET), \
+                mock.patch('api.tasks.send_booking_notifications.delay'):
+            started = time.perf_counter()
+            world = self._seed(rng, options)
+            seed_seconds = time.perf_counter() - started
+            with FakeRazorpayServer(latency=options['latency']) as server:
+                razorpay_client.configure(base_url=server.url)
+                try:
+                    endpoints = self._run(rng, world, options)
+                finally:
+                    razorpay_client.configure()
+            vendor = connection.vendor
+
+        results = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': vendor,
+                'seed_seconds': round(seed_seconds, 2),
+            },
+            'config': {k: options[k] for k in (
+                'locations', 'sites_per_location', 'bookings', 'users', 'requests', 'concurrency', 'latency', 'seed')},
+            'endpoints': endpoints,
+        }
+        for name, r in endpoints.items():
+            self.stdout.write(
+                f"{name:16} {r['throughput_rps']:>8} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                f"p99 {r['p99_ms']} ms  {r['queries_per_request']} queries/req  {r['errors']} errors"
+            )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+        if options['compare']:
+            self._compare(results, options)
+
+    def _seed(self, rng, options):
+        locations = Location.objects.bulk_create([
+            Location(name=f"Area {i}", pincode=str(400001 + i),
+                     lat=Decimal('19.0') + Decimal(i % 10) / 50, lng=Decimal('72.8') + Decimal(i // 10) / 50)
+            for i in range(options['locations'])
+        ])
+        sites = Site.objects.bulk_create([
+            Site(name=f"{location.name} Parking {j}", location=location, address=f"{j} Main Road",
+                 lat=location.lat + Decimal(j) / 1000, lng=location.lng, total_slots_car=50, total_slots_bike=100)
+            for location in locations for j in range(options['sites_per_location'])
+        ])
+        Pricing.objects.bulk_create([
+            Pricing(site=site, vehicle_type=vehicle, tier=tier, price=price)
+            for site in sites
+            for vehicle, scale in (('car', 2), ('bike', 1))
+            for tier, price in (('0_2', Decimal('30') * scale), ('2_4', Decimal('50') * scale),
+                                ('full_day', Decimal('120') * scale))
+        ], batch_size=2000)
+        OptionalCharge.objects.bulk_create([
+            OptionalCharge(site=site, name=name, amount=amount)
+            for site in sites for name, amount in (('Valet', Decimal('50')), ('Wash', Decimal('80')))
+        ], batch_size=2000)
+        users = [get_user_model().objects.create_user(f'bench{i}', f'bench{i}@example.com', 'bench')
+                 for i in range(options['users'])]
+        tokens = [Token.objects.create(user=user).key for user in users]
+
+        day0 = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        bookings = []
+        for _ in range(options['bookings']):
+            start = day0 + datetime.timedelta(days=rng.randrange(30), hours=rng.randrange(6, 20))
+            hours = rng.randint(1, 3)
+            bookings.append(Booking(
+                user=rng.choice(users), site=rng.choice(sites), vehicle_type=rng.choice(('car', 'bike')),
+                start_time=start, end_time=start + datetime.timedelta(hours=hours), duration_minutes=hours * 60,
+                base_amount=Decimal('60'), total_amount=Decimal('60'), status='paid',
+            ))
+        Booking.objects.bulk_create(bookings, batch_size=2000)
+        return {'locations': locations, 'sites': sites, 'tokens': tokens, 'day0': day0}
+
+    def _window(self, rng, world):
+        start = world['day0'] + datetime.timedelta(days=rng.randrange(30), hours=rng.randrange(6, 20))
+        return {
+            'site_id': rng.choice(world['sites']).id, 'vehicle_type': rng.choice(('car', 'bike')),
+            'start_time': start.isoformat(), 'end_time': (start + datetime.timedelta(hours=rng.randint(1, 5))).isoformat(),
+        }
+
+    def _run(self, rng, world, options):
+        count = options['requests']
+        auth = [{'Authorization': f'Token {key}'} for key in world['tokens']]
+        searches = [('get', reverse('search_sites'), {'q': rng.choice(world['locations']).name}, rng.choice(auth))
+                    for _ in range(count)]
+        quotes = [('post', reverse('calculate_price'), self._window(rng, world), rng.choice(auth)) for _ in range(count)]
+        books = [('post', reverse('book_create'), self._window(rng, world), rng.choice(auth)) for _ in range(count)]
+
+        endpoints = {}
+        endpoints['search_sites'], _ = self._stage('search_sites', searches, options['concurrency'])
+        endpoints['calculate_price'], _ = self._stage('calculate_price', quotes, options['concurrency'])
+        endpoints['book_create'], booked = self._stage('book_create', books, options['concurrency'], expect=201)
+        verifies = []
+        for (_, _, _, headers), data in zip(books, booked):
+            if data and data.get('razorpay_order_id'):
+                order_id, payment_id = data['razorpay_order_id'], f"pay_{data['booking_id'][:8]}"
+                verifies.append(('post', reverse('verify_payment'), {
+                    'booking_id': data['booking_id'], 'razorpay_order_id': order_id,
+                    'razorpay_payment_id': payment_id, 'razorpay_signature': sign(order_id, payment_id, KEY_SECRET),
+                }, headers))
+        endpoints['verify_payment'], _ = self._stage('verify_payment', verifies, options['concurrency'])
+        return endpoints
+
+    def _stage(self, view, calls, concurrency, expect=200):
+        """
+        Run `calls` on `concurrency` threads. Returns the stage summary (queries
+        per request come from the metrics middleware) and the JSON bodies of
+        `expect`ed 201 responses, in call order.
+        """
+        for histogram in metrics.REGISTRY:
+            histogram.clear()
+
+        def worker(chunk):
+            client = Client()
+            outcomes = []
+            try:
+                for index, (method, url, data, headers) in chunk:
+                    began = time.perf_counter()
+                    if method == 'get':
+                        response = client.get(url, data, headers=headers)
+                    else:
+                        response = client.post(url, data, content_type='application/json', headers=headers)
+                    latency = time.perf_counter() - began
+                    body = response.json() if expect == 201 and response.status_code == 201 else None
+                    outcomes.append((index, latency, response.status_code, body))
+            finally:
+                connections.close_all()
+            return outcomes
+
+        indexed = list(enumerate(calls))
+        chunks = [indexed[i::concurrency] for i in range(concurrency)]
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = sorted(o for chunk in pool.map(worker, chunks) for o in chunk)
+        elapsed = time.perf_counter() - began
+
+        result = summarize([latency for _, latency, _, _ in outcomes], elapsed)
+        statuses = {}
+        for _, _, code, _ in outcomes:
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+        result['statuses'] = statuses
+        result['errors'] = sum(n for code, n in statuses.items() if int(code) != expect)
+        queries = metrics.DB_QUERIES.samples((view,))
+        result['queries_per_request'] = round(queries[1] / queries[0][-1], 2) if queries else 0.0
+        return result, [body for _, _, _, body in outcomes]
+
+    def _compare(self, results, options):
+        with open(options['compare']) as fh:
+            baseline = json.load(fh)
+        regressions = []
+        self.stdout.write(f"\nvs {options['compare']} (commit {baseline['meta'].get('commit')}):")
+        for name, current in results['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if not before:
+                continue
+            parts = []
+            for key in ('p95_ms', 'queries_per_request', 'throughput_rps'):
+                old, new = before[key], current[key]
+                change = (new - old) / old if old else 0.0
+                parts.append(f"{key} {old} -> {new} ({change:+.0%})")
+                # Throughput is shown but not gated; it moves with the machine's load.
+                if key != 'throughput_rps' and change > options['tolerance']:
+                    regressions.append(f"{name} {key}")
+            self.stdout.write(f"{name:16} " + '  '.join(parts))
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"Regressions: {', '.join(regressions)}"))
+            if options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s) beyond {options['tolerance']:.0%}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
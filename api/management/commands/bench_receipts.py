@@ -0,0 +1,65 @@
+import json
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import receipts
+from api.bench import summarize
+
+
+def _render_many(count):
+    """Worker: one cold render, then `count` warm ones. Returns (cold_s, warm_elapsed_s, latencies)."""
+    started = time.perf_counter()
+    renderer = receipts.get_renderer()
+    booking = receipts.sample_booking()
+    renderer.render(booking, charges=[])
+    cold = time.perf_counter() - started
+    latencies = []
+    warm_started = time.perf_counter()
+    for _ in range(count):
+        started = time.perf_counter()
+        renderer.render(booking, charges=[])
+        latencies.append(time.perf_counter() - started)
+    return cold, time.perf_counter() - warm_started, latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure receipt PDF throughput: one warmed renderer per process, "
+        "rendering in memory. Reports the cold first render and receipts/sec per core."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=200, help='Warm renders per process.')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--json', dest='json_path', help='Also write results to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            import weasyprint  # noqa: F401
+        except (ImportError, OSError) as e:
+            raise CommandError(f"WeasyPrint is not usable here: {e}")
+
+        processes = options['processes']
+        if processes == 1:
+            runs = [_render_many(options['receipts'])]
+        else:
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                runs = pool.map(_render_many, [options['receipts']] * processes)
+
+        # Processes render side by side, so the warm phase lasts as long as the slowest one.
+        latencies = [latency for _, _, run in runs for latency in run]
+        results = summarize(latencies, max(warm for _, warm, _ in runs))
+        results['processes'] = processes
+        results['receipts_per_sec_per_core'] = round(results['throughput_rps'] / processes, 1)
+        results['cold_first_render_ms'] = round(max(cold for cold, _, _ in runs) * 1000, 1)
+        self.stdout.write(
+            f"{results['throughput_rps']} receipts/s on {processes} processes "
+            f"({results['receipts_per_sec_per_core']}/s per core)  p50 {results['p50_ms']} ms  "
+            f"p95 {results['p95_ms']} ms  cold first render {results['cold_first_render_ms']} ms"
+        )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
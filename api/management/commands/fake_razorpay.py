@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.fake_razorpay import FakeRazorpayServer
+
+
+class Command(BaseCommand):
+    help = "Run a local fake Razorpay Orders API (point RAZORPAY_BASE_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds to delay every response.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+
+    def handle(self, *args, **options):
+        server = FakeRazorpayServer(options['host'], options['port'], options['latency'], options['failure_rate'])
+        self.stdout.write(f"Fake Razorpay listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
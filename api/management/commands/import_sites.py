@@ -0,0 +1,50 @@
+import contextlib
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import PARSERS, DEFAULT_CHUNK_SIZE, detect_format, import_sites
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk upsert sites with their pricing tiers and optional charges from a CSV or "
+        "JSONL file (see api/importer.py for the formats). Use '-' to read stdin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(PARSERS), help='Default: from the file extension, else jsonl.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and write, then roll every chunk back.')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            # Only close what we opened; stdin belongs to the caller.
+            # Bytes, so the importer reports lines that aren't UTF-8 instead of failing mid-file.
+            stream = (contextlib.nullcontext(getattr(sys.stdin, 'buffer', sys.stdin)) if options['path'] == '-'
+                      else open(options['path'], 'rb'))
+        except OSError as e:
+            raise CommandError(e)
+        with stream as fh:
+            try:
+                report = import_sites(PARSERS[fmt](fh), chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            except UnicodeDecodeError as e:
+                # A text stream handed in by the caller; rows before this one may already be saved.
+                raise CommandError(f"{options['path']} is not UTF-8: {e}")
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+        self.stdout.write(
+            f"{report['rows']} rows in {report['seconds']} s ({report['rows_per_sec']} rows/s): "
+            f"{report['sites_created']} sites created, {report['sites_updated']} updated, "
+            f"{report['locations_created']} locations created, {report['pricings']} pricing tiers, "
+            f"{report['charges']} charges, {report['error_count']} rejected"
+            + (" (dry run, nothing saved)" if report['dry_run'] else '')
+        )
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Site
+from api.site_cards import refresh_cards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed listing card of every site (backfill, or after a serializer change)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Sites rendered per pass.')
+
+    def handle(self, *args, **options):
+        site_ids = list(Site.objects.order_by('id').values_list('id', flat=True))
+        size = options['chunk_size']
+        for start in range(0, len(site_ids), size):
+            refresh_cards(site_ids[start:start + size])
+        self.stdout.write(f"{len(site_ids)} site cards rebuilt")
@@ -0,0 +1,189 @@
+"""
+Request metrics: Prometheus-style histograms kept in process memory.
+
+RequestMetricsMiddleware (api/middleware.py) opens a RequestStats for each
+request in a context variable. Two things feed it while the view runs:
+
+- A query recorder installed in every DB connection's execute_wrappers.
+  It also sees queries that async views run through sync_to_async,
+  because context variables follow the request into those threads.
+- external_call('razorpay') blocks around gateway calls.
+
+A streaming response keeps collecting while its body is iterated (see
+resume()), so rows fetched by the generator count towards the request.
+
+Each worker process keeps its own registry; Prometheus scrapes every
+process, or aggregates by instance.
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def samples(self, key):
+        """(cumulative bucket counts incl. +Inf, sum) for one label set, or None."""
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+            counts, total = list(series[0]), series[1]
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            keys = sorted(self._series)
+        for key in keys:
+            cumulative, total = self.samples(key)
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = f"{labels}," if labels else ''
+            for bound, count in zip(self.buckets + ('+Inf',), cumulative):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative[-1]}")
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('bp_request_duration_seconds', 'Wall time per request.',
+                            ('view', 'method', 'status'), TIME_BUCKETS)
+DB_QUERIES = Histogram('bp_request_db_queries', 'Database queries per request.', ('view',), QUERY_BUCKETS)
+DB_SECONDS = Histogram('bp_request_db_seconds', 'Database time per request.', ('view',), TIME_BUCKETS)
+EXTERNAL_SECONDS = Histogram('bp_request_external_seconds', 'Time in external calls per request.',
+                             ('view', 'service'), TIME_BUCKETS)
+RESPONSE_BYTES = Histogram('bp_response_size_bytes', 'Response body size.', ('view',), SIZE_BUCKETS)
+REGISTRY = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, EXTERNAL_SECONDS, RESPONSE_BYTES)
+
+
+class RequestStats:
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.external = {}
+        self.capture_sql = capture_sql
+        self.sql = []
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if self.capture_sql and len(self.sql) < getattr(settings, 'SLOW_REQUEST_MAX_SQL', 50):
+            self.sql.append((sql, round(seconds * 1000, 2)))
+
+
+@contextmanager
+def collect(capture_sql=False):
+    """Collect stats for the enclosed block (one request)."""
+    stats = RequestStats(capture_sql)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def resume(stats):
+    """Collect into an existing request's stats again, e.g. while its streaming body is produced."""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """DB execute wrapper; a no-op outside a collecting request."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    """connection_created receiver: add record_query to the connection once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def external_call(service):
+    """Attribute the enclosed block's wall time to `service` for the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _current.get()
+        if stats is not None:
+            stats.external[service] = stats.external.get(service, 0.0) + time.perf_counter() - started
+
+
+def observe_request(view, method, status, seconds, stats, size=None):
+    status_class = f"{status // 100}xx"
+    REQUEST_SECONDS.observe(seconds, view=view, method=method, status=status_class)
+    DB_QUERIES.observe(stats.queries, view=view)
+    DB_SECONDS.observe(stats.db_seconds, view=view)
+    for service, spent in stats.external.items():
+        EXTERNAL_SECONDS.observe(spent, view=view, service=service)
+    if size is not None:
+        RESPONSE_BYTES.observe(size, view=view)
+
+
+def exposition():
+    return '\n'.join(h.expose() for h in REGISTRY) + '\n'
+
+
+def metrics_view(request):
+    """
+    GET /metrics in Prometheus text format with `Authorization: Bearer
+    <METRICS_TOKEN>`. Answers 403 while no token is configured.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
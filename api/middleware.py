@@ -0,0 +1,97 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+slow_logger = logging.getLogger('api.slow_requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Per-view wall time, DB query count/time, Razorpay time and response
+    size, exported on /metrics (see api/metrics.py). Streaming responses are
+    recorded once their body has been sent. Requests slower than
+    SLOW_REQUEST_THRESHOLD_MS are logged to `api.slow_requests` along with
+    their SQL. Keep it first in MIDDLEWARE so the timing covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with metrics.collect(self._slow_threshold() is not None) as stats:
+            response = self.get_response(request)
+        return self._finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with metrics.collect(self._slow_threshold() is not None) as stats:
+            response = await self.get_response(request)
+        return self._finish(request, response, stats, started)
+
+    def _finish(self, request, response, stats, started):
+        if not response.streaming:
+            self._record(request, response, stats, time.perf_counter() - started, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self._astream(response.streaming_content, request, response, stats, started)
+        else:
+            response.streaming_content = self._stream(response.streaming_content, request, response, stats, started)
+        return response
+
+    def _stream(self, chunks, request, response, stats, started):
+        # The body is produced after the view returns; its queries belong to this request.
+        chunks, size = iter(chunks), 0
+        try:
+            while True:
+                with metrics.resume(stats):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, stats, time.perf_counter() - started, size)
+
+    async def _astream(self, chunks, request, response, stats, started):
+        chunks, size = aiter(chunks), 0
+        try:
+            while True:
+                with metrics.resume(stats):
+                    chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._record(request, response, stats, time.perf_counter() - started, size)
+
+    @staticmethod
+    def _slow_threshold():
+        return getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+
+    def _record(self, request, response, stats, seconds, size):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        if view == 'metrics':
+            return
+        metrics.observe_request(view, request.method, response.status_code, seconds, stats, size)
+
+        threshold = self._slow_threshold()
+        if threshold is not None and seconds * 1000 >= threshold:
+            slow_logger.warning(
+                'slow request %s %s view=%s status=%d duration_ms=%d queries=%d db_ms=%d external_ms=%d',
+                request.method, request.path, view, response.status_code, seconds * 1000,
+                stats.queries, stats.db_seconds * 1000, sum(stats.external.values()) * 1000,
+                extra={'view': view, 'sql': stats.sql, 'external': stats.external},
+            )
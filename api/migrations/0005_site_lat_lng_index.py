@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:28
+
+from django.db import migrations, models
+
+
+def copy_location_coordinates(apps, schema_editor):
+    Site = apps.get_model('api', 'Site')
+    Location = apps.get_model('api', 'Location')
+    for location in Location.objects.filter(lat__isnull=False, lng__isnull=False).iterator():
+        Site.objects.filter(location=location, lat__isnull=True, lng__isnull=True).update(
+            lat=location.lat, lng=location.lng,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_site_lat_site_lng_site_pincode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='site',
+            index=models.Index(fields=['lat', 'lng'], name='api_site_lat_lng_idx'),
+        ),
+        migrations.RunPython(copy_location_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:45
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+POSTGRES_INDEXES = [
+    ('location', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='api_location_name_trgm')),
+    ('location', models.Index(django.contrib.postgres.indexes.OpClass('pincode', name='varchar_pattern_ops'), name='api_location_pincode_prefix')),
+    ('site', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='api_site_name_trgm')),
+    ('site', django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('address'), name='gin_trgm_ops'), name='api_site_address_trgm')),
+]
+
+
+def add_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in POSTGRES_INDEXES:
+        schema_editor.add_index(apps.get_model('api', model_name), index)
+
+
+def remove_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in POSTGRES_INDEXES:
+        schema_editor.remove_index(apps.get_model('api', model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_site_lat_lng_index'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index)
+                for model_name, index in POSTGRES_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_postgres_indexes, remove_postgres_indexes),
+            ],
+        ),
+    ]
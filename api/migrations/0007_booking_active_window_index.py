@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_search_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'paid'])), fields=['site', 'vehicle_type', 'end_time', 'start_time'], name='api_booking_active_window'),
+        ),
+    ]
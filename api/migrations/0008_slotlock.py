@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_booking_active_window_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_type', models.CharField(choices=[('car', 'Car'), ('bike', 'Bike')], max_length=10)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_locks', to='api.site')),
+            ],
+            options={
+                'unique_together': {('site', 'vehicle_type')},
+            },
+        ),
+    ]
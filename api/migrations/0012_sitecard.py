@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCard',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='api.site')),
+                ('payload', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sitecard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_type', models.CharField(choices=[('car', 'Car'), ('bike', 'Bike')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], max_length=20)),
+                ('bookings', models.IntegerField(default=0)),
+                ('slot_minutes', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('day', models.DateField()),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.site')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='api_rollup_daily_day')],
+                'constraints': [models.UniqueConstraint(fields=('site', 'vehicle_type', 'status', 'day'), name='api_rollup_daily_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyBookingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_type', models.CharField(choices=[('car', 'Car'), ('bike', 'Bike')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], max_length=20)),
+                ('bookings', models.IntegerField(default=0)),
+                ('slot_minutes', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('hour', models.DateTimeField()),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.site')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='api_rollup_hourly_hour')],
+                'constraints': [models.UniqueConstraint(fields=('site', 'vehicle_type', 'status', 'hour'), name='api_rollup_hourly_key')],
+            },
+        ),
+    ]
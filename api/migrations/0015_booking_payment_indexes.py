@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_booking_created_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('razorpay_payment_id__isnull', False)), fields=['razorpay_payment_id'], name='api_booking_payment_id'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['name', 'pincode'], name='api_location_name_pincode'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('razorpay_order_id',), name='api_booking_razorpay_order_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_booking_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sign', models.SmallIntegerField()),
+                ('vehicle_type', models.CharField(max_length=10)),
+                ('status', models.CharField(max_length=20)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('site', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.site')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_booking_rollup_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('expired', 'Expired'), ('refund_due', 'Refund due')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dailybookingrollup',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('expired', 'Expired'), ('refund_due', 'Refund due')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='hourlybookingrollup',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled'), ('expired', 'Expired'), ('refund_due', 'Refund due')], max_length=20),
+        ),
+    ]
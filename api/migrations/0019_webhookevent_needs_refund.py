@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_booking_refund_due_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='needs_refund',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='webhookevent',
+            index=models.Index(condition=models.Q(('needs_refund', True)), fields=['id'], name='api_webhook_needs_refund'),
+        ),
+    ]
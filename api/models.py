@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import uuid
@@ -15,6 +17,8 @@ BOOKING_STATUS = (
     ('paid', 'Paid'),
     ('cancelled', 'Cancelled'),
     ('expired', 'Expired'),
+    # Paid after the hold lapsed and the slot had gone; the payment is kept for refund.
+    ('refund_due', 'Refund due'),
 )
 
 class Location(models.Model):
@@ -24,6 +28,15 @@ class Location(models.Model):
     lng = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # These two are Postgres-only; created by migration 0006 (no-op on other backends).
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='api_location_name_trgm'),
+            models.Index(OpClass('pincode', name='varchar_pattern_ops'), name='api_location_pincode_prefix'),
+            # Exact lookups: create_site's duplicate check, get_or_create, the importer.
+            models.Index(fields=['name', 'pincode'], name='api_location_name_pincode'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.pincode})"
 
@@ -39,6 +52,21 @@ class Site(models.Model):
     total_slots_bike = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['lat', 'lng'], name='api_site_lat_lng_idx'),
+            # Postgres-only; created by migration 0006 (no-op on other backends).
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='api_site_name_trgm'),
+            GinIndex(OpClass(Upper('address'), name='gin_trgm_ops'), name='api_site_address_trgm'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Geo search reads only Site.lat/lng (indexed), so inherit the
+        # location's coordinates when the site has none of its own.
+        if self.lat is None and self.lng is None and self.location_id:
+            self.lat, self.lng = self.location.lat, self.location.lng
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} - {self.location.name}"
 
@@ -75,6 +103,32 @@ class OptionalCharge(models.Model):
     def __str__(self):
         return f"{self.name} - {self.amount}"
 
+class SlotLock(models.Model):
+    """
+    One row per site and vehicle type. Reservations lock it with
+    select_for_update so capacity checks serialize per site, not globally.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='slot_locks')
+    vehicle_type = models.CharField(max_length=10, choices=VEHICLE_CHOICES)
+
+    class Meta:
+        unique_together = ('site', 'vehicle_type')
+
+    def __str__(self):
+        return f"{self.site_id} | {self.vehicle_type}"
+
+class SiteCard(models.Model):
+    """
+    A site's SiteSerializer JSON, rendered ahead of time for listings
+    (api/site_cards.py). Kept current by signals in api/signals.py.
+    """
+    site = models.OneToOneField(Site, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    payload = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"card {self.site_id}"
+
 class Booking(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_bookings')
@@ -95,5 +149,165 @@ class Booking(models.Model):
     razorpay_payment_id = models.CharField(max_length=255, blank=True, null=True)
     razorpay_signature = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Availability overlap scans (see api/availability.py). end_time
+            # leads so bookings that have already ended are never visited.
+            models.Index(
+                fields=['site', 'vehicle_type', 'end_time', 'start_time'],
+                name='api_booking_active_window',
+                condition=models.Q(status__in=['pending', 'paid']),
+            ),
+            # Pending-booking expiry sweeps (api.tasks.expire_pending_bookings).
+            models.Index(fields=['status', 'created_at'], name='api_booking_status_created'),
+            # Admin changelist ordering and date hierarchy.
+            models.Index(fields=['created_at'], name='api_booking_created_at'),
+            # A user's booking history, newest first (my_bookings keyset pages).
+            models.Index(fields=['user', 'created_at', 'id'], name='api_booking_user_created'),
+            # Payment lookups (ALREADY_PAID checks, admin search).
+            models.Index(fields=['razorpay_payment_id'], name='api_booking_payment_id',
+                         condition=models.Q(razorpay_payment_id__isnull=False)),
+        ]
+        constraints = [
+            # One booking per Razorpay order; also the index behind
+            # verify_payment and the webhook consumer's order lookups.
+            models.UniqueConstraint(fields=['razorpay_order_id'], name='api_booking_razorpay_order_uniq'),
+        ]
+
     def __str__(self):
         return f"Booking {self.id} - {self.site.name} - {self.status}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as loaded; the rollup signals diff a save against
+        # them instead of re-reading the row (api/signals.py).
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        names = fields or [field.attname for field in self._meta.concrete_fields]
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in names:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+
+class BookingRollup(models.Model):
+    """
+    Booking totals per (site, vehicle_type, status) and period, maintained
+    incrementally by api/analytics.py. `bookings` and `revenue` count in
+    the period the booking starts; `slot_minutes` is spread over every
+    period the booking occupies.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='+')
+    vehicle_type = models.CharField(max_length=10, choices=VEHICLE_CHOICES)
+    status = models.CharField(max_length=20, choices=BOOKING_STATUS)
+    bookings = models.IntegerField(default=0)
+    slot_minutes = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+class HourlyBookingRollup(BookingRollup):
+    hour = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'vehicle_type', 'status', 'hour'], name='api_rollup_hourly_key'),
+        ]
+        # Dashboard range scans across all sites.
+        indexes = [models.Index(fields=['hour'], name='api_rollup_hourly_hour')]
+
+class DailyBookingRollup(BookingRollup):
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'vehicle_type', 'status', 'day'], name='api_rollup_daily_key'),
+        ]
+        indexes = [models.Index(fields=['day'], name='api_rollup_daily_day')]
+
+class BookingRollupDelta(models.Model):
+    """
+    Queued rollup change: one booking row's contribution, added (sign=1)
+    or withdrawn (sign=-1). Written in the booking's own transaction and
+    folded into the rollup tables by api.tasks.apply_booking_rollups. The
+    site is not a constraint so deleting a site never waits on the queue.
+    """
+    sign = models.SmallIntegerField()
+    site = models.ForeignKey(Site, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    vehicle_type = models.CharField(max_length=10)
+    status = models.CharField(max_length=20)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+class WebhookEvent(models.Model):
+    """
+    Append-only inbox of raw Razorpay webhook deliveries. The webhook view
+    only inserts here; api.tasks.process_webhook_inbox applies them in batches.
+    Razorpay retries deliveries, so event_id is not unique.
+    """
+    event_id = models.CharField(max_length=64)
+    body = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # A captured payment that confirmed no booking (unknown order, booking
+    # already settled by another payment, or slot gone): refund it.
+    needs_refund = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_id'], name='api_webhook_event_id'),
+            # The consumer's queue scan: only undrained rows stay in it.
+            models.Index(fields=['id'], name='api_webhook_unprocessed', condition=models.Q(processed_at__isnull=True)),
+            models.Index(fields=['id'], name='api_webhook_needs_refund', condition=models.Q(needs_refund=True)),
+        ]
+
+    def __str__(self):
+        state = 'needs refund' if self.needs_refund else 'processed' if self.processed_at else 'queued'
+        return f"{self.event_id} | {state}"
+
+class Notification(models.Model):
+    """
+    Outbox for booking notifications. Each channel is drained in batches by
+    its own Celery queue (see api/notifications.py). A worker claims rows as
+    `sending` before talking to the backend; they go back to `pending`
+    between retries and become `failed` after NOTIFICATION_MAX_ATTEMPTS.
+    """
+    CHANNEL_CHOICES = (
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    attachment = models.BinaryField(null=True, blank=True)  # receipt PDF for email
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['channel', 'id'], name='api_notification_pending', condition=models.Q(status='pending')),
+            models.Index(fields=['channel', 'claimed_at'], name='api_notification_sending',
+                         condition=models.Q(status='sending')),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} | {self.status}"
@@ -0,0 +1,140 @@
+"""
+Booking notification pipeline.
+
+send_booking_notifications (api.tasks) fans out each paid booking into
+stages. Every stage runs on its own Celery queue (CELERY_TASK_ROUTES), so
+a slow SMTP server never holds a worker that could be rendering receipts:
+
+  render  render_booking_receipt: receipt PDF -> pending email Notification
+  email   send_email_batch: pending emails over one SMTP connection
+  sms     send_sms_batch: pending SMS through the SMS_BACKEND
+
+Delivery state lives in Notification rows, so a retried stage resumes
+where it stopped and nothing that was sent is sent again.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import mail
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+
+from . import sms
+from .models import Notification
+
+
+def booking_phone(booking):
+    try:
+        return booking.user.userprofile.phone or None
+    except (AttributeError, ObjectDoesNotExist):
+        return None
+
+
+def queue_sms(booking):
+    """Queue the confirmation SMS; returns the Notification or None without a phone number."""
+    phone = booking_phone(booking)
+    if not phone or booking.notifications.filter(channel='sms').exists():
+        return None
+    return Notification.objects.create(
+        booking=booking, channel='sms', recipient=phone,
+        body=f"Booking confirmed: {booking.id}",
+    )
+
+
+def queue_receipt_email(booking, pdf):
+    if booking.notifications.filter(channel='email').exists():
+        return None
+    return Notification.objects.create(
+        booking=booking, channel='email', recipient=booking.user.email,
+        subject=f"Your booking receipt - {booking.id}",
+        body="Please find attached receipt.",
+        attachment=pdf,
+    )
+
+
+def _email(notification):
+    message = mail.EmailMessage(notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL,
+                                [notification.recipient])
+    if notification.attachment:
+        message.attach(f"receipt_{notification.booking_id}.pdf", bytes(notification.attachment), 'application/pdf')
+    return message
+
+
+def _sms(notification):
+    return sms.SmsMessage(notification.recipient, notification.body)
+
+
+CHANNELS = {
+    'email': (lambda: mail.get_connection(), _email),
+    'sms': (lambda: sms.get_connection(), _sms),
+}
+
+
+def _claim(channel, batch_size):
+    """
+    Mark up to `batch_size` pending rows `sending` in a short transaction
+    and return them. Claims older than NOTIFICATION_CLAIM_TIMEOUT belong to
+    a worker that died mid-batch and go back to pending first.
+    """
+    now = timezone.now()
+    Notification.objects.filter(
+        channel=channel, status='sending',
+        claimed_at__lt=now - timedelta(seconds=settings.NOTIFICATION_CLAIM_TIMEOUT),
+    ).update(status='pending', claimed_at=None)
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(channel=channel, status='pending')
+            .order_by('id')[:batch_size]
+        )
+        Notification.objects.filter(id__in=[n.id for n in rows]).update(status='sending', claimed_at=now)
+    return rows
+
+
+def _release(rows):
+    Notification.objects.filter(id__in=[n.id for n in rows], status='sending').update(status='pending', claimed_at=None)
+
+
+def _finish(notification):
+    Notification.objects.filter(id=notification.id, status='sending').update(
+        status=notification.status, attempts=notification.attempts, last_error=notification.last_error,
+        sent_at=notification.sent_at, claimed_at=None,
+    )
+
+
+def deliver_batch(channel, batch_size):
+    """
+    Send up to `batch_size` pending notifications of `channel` over a single
+    backend connection. Rows are claimed and committed before the backend
+    is contacted, so no transaction or row lock is held while SMTP or the
+    SMS gateway is slow; each row is written back as soon as it is sent.
+    A message that fails goes back to pending (or becomes failed after
+    NOTIFICATION_MAX_ATTEMPTS) without stopping the batch. If the
+    connection can't be opened the claims are released and the error
+    propagates. Returns (claimed, still_pending).
+    """
+    get_connection, build = CHANNELS[channel]
+    rows = _claim(channel, batch_size)
+    if not rows:
+        return 0, 0
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception:
+        _release(rows)
+        raise
+    try:
+        for notification in rows:
+            notification.attempts += 1
+            try:
+                connection.send_messages([build(notification)])
+            except Exception as e:
+                notification.last_error = f"{type(e).__name__}: {e}"[:1000]
+                notification.status = 'failed' if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS else 'pending'
+            else:
+                notification.status, notification.sent_at, notification.last_error = 'sent', timezone.now(), ''
+            _finish(notification)
+    finally:
+        connection.close()
+    return len(rows), sum(n.status == 'pending' for n in rows)
@@ -0,0 +1,181 @@
+"""
+Pricing lookups for price quotes without a DB round-trip in the common case.
+
+Two layers: a small per-process LRU (bounded TTL, so other workers pick up
+changes quickly) in front of Django's cache framework (shared between
+workers). Both are invalidated by the signal handlers in api/signals.py
+whenever Pricing, OptionalCharge or Site rows change.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+LOCAL_CACHE_SIZE = getattr(settings, 'PRICING_LOCAL_CACHE_SIZE', 2048)
+LOCAL_CACHE_TTL = getattr(settings, 'PRICING_LOCAL_CACHE_TTL', 30)
+SHARED_CACHE_TIMEOUT = getattr(settings, 'PRICING_CACHE_TIMEOUT', 60 * 60)
+
+
+class LocalLRU:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalLRU(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+
+
+def _prices_key(site_id, vehicle_type):
+    return f"pricing:{site_id}:{vehicle_type}"
+
+
+def _charges_key(site_id):
+    return f"pricing:charges:{site_id}"
+
+
+def _cached(key, loader):
+    value = _local.get(key)
+    if value is not None:
+        return value
+    value = cache.get(key)
+    if value is None:
+        value = loader()
+        if value is None:
+            return None
+        cache.set(key, value, SHARED_CACHE_TIMEOUT)
+    _local.set(key, value)
+    return value
+
+
+def get_tier_prices(site_id, vehicle_type):
+    """
+    {tier: Decimal price} for a site and vehicle type, or None if the site
+    does not exist.
+    """
+    site_id = int(site_id)
+
+    def load():
+        from .models import Pricing, Site
+        prices = {
+            tier: price for tier, price in
+            Pricing.objects.filter(site_id=site_id, vehicle_type=vehicle_type).values_list('tier', 'price')
+        }
+        if not prices and not Site.objects.filter(id=site_id).exists():
+            return None
+        return prices
+    return _cached(_prices_key(site_id, vehicle_type), load)
+
+
+def get_many_tier_prices(pairs):
+    """
+    get_tier_prices for many (site_id, vehicle_type) pairs with at most one
+    shared-cache round-trip and two queries for whatever is not cached.
+    """
+    from .models import Pricing, Site
+    result, missing = {}, {}
+    for site_id, vehicle_type in pairs:
+        key = _prices_key(int(site_id), vehicle_type)
+        value = _local.get(key)
+        if value is None:
+            missing[key] = (int(site_id), vehicle_type)
+        else:
+            result[(int(site_id), vehicle_type)] = value
+    if not missing:
+        return result
+
+    for key, value in cache.get_many(list(missing)).items():
+        _local.set(key, value)
+        result[missing.pop(key)] = value
+    if not missing:
+        return result
+
+    site_ids = {site_id for site_id, _ in missing.values()}
+    loaded = {pair: {} for pair in missing.values()}
+    rows = Pricing.objects.filter(site_id__in=site_ids).values_list('site_id', 'vehicle_type', 'tier', 'price')
+    for site_id, vehicle_type, tier, price in rows:
+        if (site_id, vehicle_type) in loaded:
+            loaded[(site_id, vehicle_type)][tier] = price
+    unpriced = {site_id for (site_id, _), prices in loaded.items() if not prices}
+    existing = set(Site.objects.filter(id__in=unpriced).values_list('id', flat=True)) if unpriced else set()
+
+    to_cache = {}
+    for key, pair in missing.items():
+        prices = loaded[pair]
+        if not prices and pair[0] not in existing:
+            result[pair] = None
+            continue
+        result[pair] = prices
+        to_cache[key] = prices
+        _local.set(key, prices)
+    cache.set_many(to_cache, SHARED_CACHE_TIMEOUT)
+    return result
+
+
+def get_active_charges(site_id):
+    """{charge id: Decimal amount} of active charges for the site and global (site-less) charges."""
+    site_id = int(site_id)
+
+    def load():
+        from django.db.models import Q
+        from .models import OptionalCharge
+        return dict(
+            OptionalCharge.objects.filter(Q(site_id=site_id) | Q(site__isnull=True), is_active=True)
+            .values_list('id', 'amount')
+        )
+    return _cached(_charges_key(site_id), load)
+
+
+def invalidate_site(site_id):
+    from .models import VEHICLE_CHOICES
+    keys = [_prices_key(site_id, vehicle_type) for vehicle_type, _ in VEHICLE_CHOICES]
+    keys.append(_charges_key(site_id))
+    cache.delete_many(keys)
+    for key in keys:
+        _local.delete(key)
+
+
+def invalidate_all_charges():
+    """A global charge changed: every site's charge table is stale."""
+    from .models import Site
+    site_ids = Site.objects.values_list('id', flat=True).iterator()
+    batch = []
+    for site_id in site_ids:
+        batch.append(_charges_key(site_id))
+        if len(batch) >= 1000:
+            cache.delete_many(batch)
+            batch = []
+    if batch:
+        cache.delete_many(batch)
+    _local.clear()
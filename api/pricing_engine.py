@@ -0,0 +1,94 @@
+"""
+Tier pricing for one duration or many at once.
+
+A site's Pricing rows for one vehicle type compile into a TierTable. It
+holds integer paise, so every result is exact and converts back to Decimal
+rupees without rounding. For a stay of `minutes`:
+
+    <= 2 h           0_2
+    <= 4 h           2_4
+    < 24 h           full_day
+    longer           full_day for every started day
+
+With a `monthly` tier, each full 30 days is charged one monthly pass, and
+the price of the remainder is capped at one more pass. A tier the site
+does not price counts as 0.
+
+TierTable.price() evaluates one duration in plain Python. prices() runs
+the same rules over a NumPy array of durations in a single vectorized
+pass; it backs quote grids such as "price for every hour 1-720".
+"""
+from decimal import Decimal
+
+import numpy as np
+
+TIERS = ('0_2', '2_4', 'full_day', 'monthly')
+TWO_HOURS = 2 * 60
+FOUR_HOURS = 4 * 60
+DAY = 24 * 60
+MONTH = 30 * DAY
+
+
+def to_paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def to_rupees(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+class TierTable:
+    """Compiled {tier: Decimal price} table for one site and vehicle type."""
+    __slots__ = ('short_2', 'short_4', 'full_day', 'monthly')
+
+    def __init__(self, prices):
+        self.short_2, self.short_4, self.full_day = (to_paise(prices.get(tier) or 0) for tier in TIERS[:3])
+        monthly = prices.get('monthly')
+        self.monthly = to_paise(monthly) if monthly else None
+
+    def _ladder(self, minutes):
+        if minutes <= TWO_HOURS:
+            return self.short_2
+        if minutes <= FOUR_HOURS:
+            return self.short_4
+        if minutes < DAY:
+            return self.full_day
+        return -(-minutes // DAY) * self.full_day
+
+    def price_paise(self, minutes):
+        if self.monthly is None:
+            return self._ladder(minutes)
+        months, rest = divmod(minutes, MONTH)
+        rest_price = 0 if months and not rest else min(self._ladder(rest), self.monthly)
+        return months * self.monthly + rest_price
+
+    def price(self, minutes):
+        """Base price of one stay, as Decimal rupees."""
+        return to_rupees(self.price_paise(int(minutes)))
+
+    def prices_paise(self, minutes):
+        """price_paise over an array-like of minutes; returns an int64 array."""
+        minutes = np.asarray(minutes, dtype=np.int64)
+        if self.monthly is None:
+            months, rest = 0, minutes
+        else:
+            months, rest = np.divmod(minutes, MONTH)
+        ladder = np.select(
+            [rest <= TWO_HOURS, rest <= FOUR_HOURS, rest < DAY],
+            [self.short_2, self.short_4, self.full_day],
+            -(-rest // DAY) * self.full_day,
+        ).astype(np.int64)
+        if self.monthly is None:
+            return ladder
+        ladder = np.where((months > 0) & (rest == 0), 0, np.minimum(ladder, self.monthly))
+        return months * self.monthly + ladder
+
+    def prices(self, minutes):
+        """Base prices for many stays, as a list of Decimal rupees."""
+        return [to_rupees(paise) for paise in self.prices_paise(minutes).tolist()]
+
+
+def duration_grid(table, max_hours=720, step_minutes=60):
+    """(minutes array, paise array) for stays of step_minutes, 2*step_minutes, ... up to max_hours."""
+    minutes = np.arange(step_minutes, max_hours * 60 + 1, step_minutes, dtype=np.int64)
+    return minutes, table.prices_paise(minutes)
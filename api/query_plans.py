@@ -0,0 +1,75 @@
+"""
+Query-plan checks for the hot paths (Postgres).
+
+PlanCapture records the statements run inside it, then EXPLAINs each
+SELECT/UPDATE/DELETE with sequential scans, hash joins and merge joins
+disabled (so it must run inside a transaction, as TestCase does). With
+those settings the planner reads a whole table only when no index can
+narrow the query or drive a join into it. A full scan in those plans
+therefore means a missing or unusable index, and that holds on a small
+seeded test database as well as a large one.
+
+    with PlanCapture() as plans:
+        client.get(url)
+    assert not plans.full_scans()
+"""
+import json
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+PLANNER_OFF = ('enable_seqscan', 'enable_hashjoin', 'enable_mergejoin')
+
+
+def explain(sql, using=DEFAULT_DB_ALIAS):
+    """The JSON plan of `sql`, planned with only index scans and nested loops available."""
+    with connections[using].cursor() as cursor:
+        for setting in PLANNER_OFF:
+            cursor.execute(f'SET LOCAL {setting} = off')
+        try:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        finally:
+            for setting in PLANNER_OFF:
+                cursor.execute(f'SET LOCAL {setting} = on')
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+
+
+def full_scans(plan, limited=False):
+    """
+    Relations read in full anywhere in a plan tree: a Seq Scan, or an index
+    scan with no index condition (walking a whole index just to dodge the
+    seqscan penalty). The latter is fine under a Limit, where it is the
+    usual top-N-by-index pattern.
+    """
+    found = []
+    node = plan.get('Node Type')
+    if node == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    elif node in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in plan and not limited:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found += full_scans(child, limited or node == 'Limit')
+    return found
+
+
+class PlanCapture(CaptureQueriesContext):
+    """Capture the statements of a block; plans are computed on demand."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__(connections[using])
+        self.using = using
+
+    @property
+    def statements(self):
+        return [q['sql'] for q in self.captured_queries if q['sql'].lstrip().upper().startswith(EXPLAINED)]
+
+    def full_scans(self, allow=()):
+        """[(relation, sql)] for every fully scanned relation not in `allow`."""
+        return [
+            (relation, sql)
+            for sql in self.statements
+            for relation in full_scans(explain(sql, self.using))
+            if relation not in allow
+        ]
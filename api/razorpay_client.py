@@ -1,4 +1,126 @@
+"""
+Razorpay gateway client.
+
+All calls share one pooled keep-alive requests.Session with strict timeouts.
+Connection failures are retried with exponential backoff. Read timeouts
+and 5xx responses are retried only for GETs, because a repeated POST could
+create a second order.
+
+Async views use an httpx.AsyncClient per event loop with the same timeouts
+and connect-only retries (see acreate_order).
+"""
+import asyncio
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import razorpay
 from django.conf import settings
+from .metrics import external_call
+
+CONNECT_TIMEOUT = getattr(settings, 'RAZORPAY_CONNECT_TIMEOUT', 2.0)
+READ_TIMEOUT = getattr(settings, 'RAZORPAY_READ_TIMEOUT', 8.0)
+MAX_RETRIES = getattr(settings, 'RAZORPAY_MAX_RETRIES', 3)
+POOL_SIZE = getattr(settings, 'RAZORPAY_POOL_SIZE', 20)
+ASYNC_MAX_CONNECTIONS = getattr(settings, 'RAZORPAY_ASYNC_MAX_CONNECTIONS', 100)
+BASE_URL = getattr(settings, 'RAZORPAY_BASE_URL', None) or razorpay.Client.DEFAULTS['base_url']
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies a default (connect, read) timeout to every request."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        with external_call('razorpay'):
+            return super().request(method, url, **kwargs)
+
+
+def build_session(connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                  max_retries=MAX_RETRIES, pool_size=POOL_SIZE):
+    session = TimeoutSession((connect_timeout, read_timeout))
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.2,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def build_client(base_url=None, **session_options):
+    return razorpay.Client(
+        session=build_session(**session_options),
+        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+        base_url=base_url or BASE_URL,
+    )
+
+
+client = build_client()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def configure(base_url=None):
+    """Point both clients at another gateway URL (e.g. the fake server in benchmarks)."""
+    global BASE_URL, client
+    BASE_URL = base_url or getattr(settings, 'RAZORPAY_BASE_URL', None) or razorpay.Client.DEFAULTS['base_url']
+    client = build_client()
+    _async_clients.clear()
+
+
+def get_async_client():
+    """The httpx.AsyncClient for the running event loop (pools can't cross loops)."""
+    import httpx
+    loop = asyncio.get_running_loop()
+    http = _async_clients.get(loop)
+    if http is None:
+        transport = httpx.AsyncHTTPTransport(
+            retries=MAX_RETRIES,  # connection failures only
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=POOL_SIZE),
+        )
+        http = httpx.AsyncClient(
+            base_url=BASE_URL,
+            auth=(settings.RAZORPAY_KEY_ID or '', settings.RAZORPAY_KEY_SECRET or ''),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            transport=transport,
+        )
+        _async_clients[loop] = http
+    return http
+
+
+def _order_payload(amount_paise, receipt=None):
+    data = {
+        'amount': amount_paise,
+        'currency': 'INR',
+        'payment_capture': '1'  # auto capture
+    }
+    if receipt:
+        data['receipt'] = receipt[:40]  # Razorpay caps receipt at 40 chars
+    return data
+
+
+def create_order(amount_paise, receipt=None):
+    """Create an auto-captured INR order; returns Razorpay's order dict."""
+    return client.order.create(_order_payload(amount_paise, receipt))
+
 
-client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+async def acreate_order(amount_paise, receipt=None):
+    """Async create_order; raises razorpay errors like the sync client."""
+    with external_call('razorpay'):
+        response = await get_async_client().post('/v1/orders', json=_order_payload(amount_paise, receipt))
+    if response.status_code >= 300:
+        error = response.json().get('error', {})
+        if str(error.get('code', '')).upper() == 'BAD_REQUEST_ERROR':
+            raise razorpay.errors.BadRequestError(error.get('description', ''))
+        raise razorpay.errors.ServerError(error.get('description', ''))
+    return response.json()
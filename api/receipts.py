@@ -0,0 +1,83 @@
+"""
+Booking receipt PDFs.
+
+WeasyPrint's first render in a process pays for importing Pango/Cairo
+bindings and loading fonts. The ReceiptRenderer is therefore built once
+per process and reused. It holds the compiled template, the parsed
+stylesheet and the font configuration. Celery workers build and warm it
+when the worker process starts (see api.tasks). PDFs are rendered into
+memory, never to disk.
+"""
+import io
+import logging
+import threading
+from pathlib import Path
+
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = 'booking_receipt.html'
+STYLESHEET = Path(__file__).resolve().parent / 'static' / 'api' / 'receipt.css'
+
+_renderer = None
+_lock = threading.Lock()
+
+
+class ReceiptRenderer:
+    def __init__(self):
+        # Imported here so web processes that never render receipts don't load WeasyPrint.
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+        self.template = get_template(TEMPLATE_NAME)
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(string=STYLESHEET.read_text(), font_config=self.font_config)
+
+    def render_html(self, booking, charges=None):
+        if charges is None:
+            charges = list(booking.optional_charges.all())
+        return self.template.render({'booking': booking, 'charges': charges})
+
+    def render(self, booking, charges=None):
+        """The receipt for `booking` as PDF bytes."""
+        from weasyprint import HTML
+        buffer = io.BytesIO()
+        HTML(string=self.render_html(booking, charges)).write_pdf(
+            buffer, stylesheets=[self.stylesheet], font_config=self.font_config)
+        return buffer.getvalue()
+
+
+def get_renderer():
+    """This process's renderer, built on first use."""
+    global _renderer
+    if _renderer is None:
+        with _lock:
+            if _renderer is None:
+                _renderer = ReceiptRenderer()
+    return _renderer
+
+
+def render_receipt(booking, charges=None):
+    return get_renderer().render(booking, charges)
+
+
+def sample_booking():
+    """An unsaved booking for warm-up and benchmarks; render it with charges=[]."""
+    from datetime import datetime, timedelta, timezone
+    from decimal import Decimal
+    from .models import Booking, Location, Site
+
+    start = datetime(2030, 1, 1, 10, tzinfo=timezone.utc)
+    site = Site(name='Warm-up Site', address='1 Example Road',
+                location=Location(name='Andheri East', pincode='400069'))
+    return Booking(site=site, vehicle_type='car', start_time=start, end_time=start + timedelta(hours=2),
+                   duration_minutes=120, base_amount=Decimal('60.00'), total_amount=Decimal('60.00'),
+                   status='paid', razorpay_payment_id='pay_sample')
+
+
+def warm():
+    """Build the renderer and render one throwaway receipt so fonts are loaded."""
+    try:
+        get_renderer().render(sample_booking(), charges=[])
+    except Exception:
+        logger.exception('Receipt renderer warm-up failed; receipts will render cold')
@@ -0,0 +1,43 @@
+from django.db import connection
+from django.db.models import Case, When, Value, IntegerField, Q
+from .models import Site, Location
+
+
+def matching_location_ids(q):
+    return Location.objects.filter(name__icontains=q).values_list('id', flat=True)
+
+
+def search_queryset(q='', pincode='', location_ids=None):
+    """
+    Sites matching the typeahead text `q` and/or a pincode prefix.
+
+    Every predicate is on a column of api_site so Postgres can combine the
+    trigram GIN indexes with a BitmapOr instead of scanning an OR across the
+    location join; matching locations are resolved first (a small table with
+    its own trigram/prefix indexes). Text matches are ranked: exact name,
+    name prefix, name substring, then address/location matches.
+
+    Async callers resolve matching_location_ids(q) themselves and pass them
+    in, so building the queryset does no I/O.
+    """
+    qs = Site.objects.all()
+    if pincode:
+        qs = qs.filter(location__in=Location.objects.filter(pincode__startswith=pincode))
+    if not q:
+        return qs.order_by('name', 'id')
+
+    if location_ids is None:
+        location_ids = list(matching_location_ids(q))
+    qs = qs.filter(Q(name__icontains=q) | Q(address__icontains=q) | Q(location_id__in=location_ids))
+    qs = qs.annotate(rank=Case(
+        When(name__iexact=q, then=Value(3)),
+        When(name__istartswith=q, then=Value(2)),
+        When(name__icontains=q, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        qs = qs.annotate(similarity=TrigramWordSimilarity(q, 'name'))
+        return qs.order_by('-rank', '-similarity', 'name', 'id')
+    return qs.order_by('-rank', 'name', 'id')
@@ -1,5 +1,8 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Site, Location, Booking, Pricing, OptionalCharge
+from .models import Site, Location, Booking, Pricing, OptionalCharge, VEHICLE_CHOICES
+
+MAX_BULK_QUOTES = 200
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,8 +28,22 @@ class SiteSerializer(serializers.ModelSerializer):
         model = Site
         fields = ['id','name','location','address','pincode','lat','lng','total_slots_car','total_slots_bike','pricings','charges','created_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Batch-load everything this serializer touches so a listing costs a
+        constant number of queries regardless of how many sites it returns.
+        """
+        return queryset.select_related('location').prefetch_related(
+            'pricings',
+            Prefetch('charges', queryset=OptionalCharge.objects.filter(is_active=True), to_attr='active_charges'),
+        )
+
     def get_charges(self, obj):
-        return [{'id': c.id, 'name': c.name, 'amount': c.amount} for c in obj.charges.filter(is_active=True)]
+        charges = getattr(obj, 'active_charges', None)
+        if charges is None:
+            charges = obj.charges.filter(is_active=True)
+        return [{'id': c.id, 'name': c.name, 'amount': c.amount} for c in charges]
 
 class SiteCreateSerializer(serializers.Serializer):
     """
@@ -78,3 +95,59 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = '__all__'
+
+class BookingHistorySerializer(serializers.ModelSerializer):
+    """A user's own booking with the site and charges it was made for."""
+    site = serializers.SerializerMethodField()
+    optional_charges = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Booking
+        fields = ['id', 'status', 'site', 'vehicle_type', 'slot_number', 'start_time', 'end_time',
+                  'duration_minutes', 'base_amount', 'optional_charges', 'total_amount',
+                  'razorpay_order_id', 'razorpay_payment_id', 'created_at']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Site and location are joined in; charges come in one batched query per page."""
+        return queryset.select_related('site__location').prefetch_related('optional_charges')
+
+    def get_site(self, obj):
+        site, location = obj.site, obj.site.location
+        return {
+            'id': site.id, 'name': site.name, 'address': site.address,
+            'location': {'id': location.id, 'name': location.name, 'pincode': location.pincode},
+        }
+
+    def get_optional_charges(self, obj):
+        return [{'id': c.id, 'name': c.name, 'amount': c.amount} for c in obj.optional_charges.all()]
+
+class PriceQuoteSerializer(serializers.Serializer):
+    site_id = serializers.IntegerField()
+    vehicle_type = serializers.ChoiceField(choices=VEHICLE_CHOICES)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    optional_charges = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        if attrs['end_time'] < attrs['start_time']:
+            raise serializers.ValidationError('end_time must not be before start_time.')
+        return attrs
+
+class BulkPriceQuoteSerializer(serializers.Serializer):
+    quotes = PriceQuoteSerializer(many=True, allow_empty=False, max_length=MAX_BULK_QUOTES)
+
+class PricingImportSerializer(serializers.Serializer):
+    vehicle_type = serializers.ChoiceField(choices=VEHICLE_CHOICES)
+    tier = serializers.ChoiceField(choices=Pricing.TIER_CHOICES)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+class ChargeImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    amount = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0)
+    is_active = serializers.BooleanField(default=True)
+
+class SiteImportSerializer(SiteCreateSerializer):
+    """One row of a bulk site import (see api/importer.py); validation only."""
+    pricing = PricingImportSerializer(many=True, required=False, default=list)
+    charges = ChargeImportSerializer(many=True, required=False, default=list)
@@ -0,0 +1,115 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Location, Site, Pricing, OptionalCharge, Booking
+from . import analytics, pricing_cache, site_cards
+
+
+def _invalidate(invalidate, *args):
+    # Drop the cached rows now and again once the write commits: a reader
+    # that misses in between still sees the old rows and would otherwise
+    # put them back in the cache for PRICING_CACHE_TIMEOUT.
+    invalidate(*args)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(invalidate, *args))
+
+
+def _invalidate_for_charge(site_id):
+    if site_id is None:
+        _invalidate(pricing_cache.invalidate_all_charges)
+    else:
+        _invalidate(pricing_cache.invalidate_site, site_id)
+
+
+@receiver(pre_save, sender=Pricing)
+@receiver(pre_save, sender=OptionalCharge)
+def pricing_row_moving(sender, instance, **kwargs):
+    # A row re-pointed at another site (e.g. in the admin) leaves the old
+    # site's cached table stale too.
+    if instance.pk is None:
+        return
+    old_site_id = sender.objects.filter(pk=instance.pk).values_list('site_id', flat=True).first()
+    if old_site_id != instance.site_id:
+        if sender is OptionalCharge:
+            _invalidate_for_charge(old_site_id)
+        else:
+            _invalidate(pricing_cache.invalidate_site, old_site_id)
+        site_cards.schedule_refresh([old_site_id])
+
+
+@receiver([post_save, post_delete], sender=Pricing)
+def pricing_changed(sender, instance, **kwargs):
+    _invalidate(pricing_cache.invalidate_site, instance.site_id)
+    site_cards.schedule_refresh([instance.site_id])
+
+
+@receiver([post_save, post_delete], sender=OptionalCharge)
+def optional_charge_changed(sender, instance, **kwargs):
+    _invalidate_for_charge(instance.site_id)
+    site_cards.schedule_refresh([instance.site_id])
+
+
+@receiver(post_delete, sender=Site)
+def site_deleted(sender, instance, **kwargs):
+    _invalidate(pricing_cache.invalidate_site, instance.id)
+    site_cards.schedule_refresh([instance.id])
+
+
+@receiver(post_save, sender=Site)
+def site_saved(sender, instance, **kwargs):
+    site_cards.schedule_refresh([instance.id])
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, **kwargs):
+    # Cards embed the location, so every site under it is re-rendered.
+    site_cards.schedule_refresh(instance.sites.values_list('id', flat=True))
+
+
+# Booking rollups for saves and deletes; queryset status updates call
+# analytics.record_transition() themselves. The stored row is taken from
+# the values the instance was loaded with (Booking.from_db), so a save
+# only reads the row back when the instance was not loaded from it.
+
+
+def _written(instance, update_fields):
+    """attnames the save writes, of the ones the rollups use."""
+    if update_fields is None:
+        return set(analytics.ROLLUP_FIELDS)
+    return {instance._meta.get_field(name).attname for name in update_fields} & set(analytics.ROLLUP_FIELDS)
+
+
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._rollup_row = None
+    if raw or instance._state.adding or not _written(instance, update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(name in loaded for name in analytics.ROLLUP_FIELDS):
+        instance._rollup_row = tuple(loaded[name] for name in analytics.ROLLUP_FIELDS)
+    else:
+        instance._rollup_row = Booking.objects.filter(pk=instance.pk).values_list(*analytics.ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_rollup_row', None)
+    if not created and old is None:
+        return
+    if old is None:
+        new = analytics.booking_row(instance)
+    else:
+        written = _written(instance, update_fields)
+        new = tuple(getattr(instance, name) if name in written else value
+                    for name, value in zip(analytics.ROLLUP_FIELDS, old))
+    if old != new:
+        analytics.move([old] if old else [], [new])
+    instance.__dict__.setdefault('_loaded_values', {}).update(zip(analytics.ROLLUP_FIELDS, new))
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    analytics.move([analytics.booking_row(instance)], [])
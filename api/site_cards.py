@@ -0,0 +1,90 @@
+"""
+Precomputed site "cards" for listings.
+
+SiteCard.payload holds a site's SiteSerializer JSON: location, pricing
+tiers and active charges, rendered ahead of time. Listing endpoints read
+it through one LEFT JOIN on the site query and splice the strings into
+the response. No related rows are hydrated and no serializer runs per
+request.
+
+Cards are refreshed after the writing transaction commits (signals in
+api/signals.py, and the bulk importer), which also bumps the catalog
+version behind listing ETags (api/http_cache.py). A site that has no card yet gets
+one when it is first read.
+"""
+import json
+import threading
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import http_cache
+from .models import Site, SiteCard
+from .serializers import SiteSerializer
+
+_pending = threading.local()
+
+
+def render_payload(site):
+    """Card JSON for an eager-loaded site; byte-identical to its DRF list item."""
+    return JSONRenderer().render(SiteSerializer(site).data).decode()
+
+
+def refresh_cards(site_ids):
+    """(Re)build the cards of `site_ids` in one pass; returns {site_id: payload}."""
+    sites = SiteSerializer.setup_eager_loading(Site.objects.filter(id__in=list(site_ids)))
+    now = timezone.now()
+    cards = [SiteCard(site=site, payload=render_payload(site), updated_at=now) for site in sites]
+    SiteCard.objects.bulk_create(cards, update_conflicts=True, unique_fields=['site'],
+                                 update_fields=['payload', 'updated_at'])
+    return {card.site_id: card.payload for card in cards}
+
+
+def _flush():
+    site_ids = getattr(_pending, 'site_ids', None)
+    if site_ids:
+        _pending.site_ids = set()
+        refresh_cards(site_ids)
+        http_cache.bump_catalog_version()
+
+
+def schedule_refresh(site_ids):
+    """Refresh these cards once the current transaction commits, batched per transaction."""
+    site_ids = {site_id for site_id in site_ids if site_id is not None}
+    if not site_ids:
+        return
+    if not hasattr(_pending, 'site_ids'):
+        _pending.site_ids = set()
+    _pending.site_ids |= site_ids
+    # Bumped on write and again after commit: a listing cached in between
+    # (old data under the new version) is dropped by the second bump.
+    http_cache.bump_catalog_version()
+    transaction.on_commit(_flush)
+
+
+def with_cards(queryset):
+    """Narrow a site queryset to what card rendering needs: ids, coordinates and the joined card."""
+    return queryset.prefetch_related(None).select_related(None).select_related('card').only(
+        'id', 'lat', 'lng', 'card__payload')
+
+
+def card_payloads(sites):
+    """Payloads for sites loaded via with_cards(), building any that are missing."""
+    missing = [site.id for site in sites if not hasattr(site, 'card')]
+    built = refresh_cards(missing) if missing else {}
+    return [site.card.payload if hasattr(site, 'card') else built[site.id] for site in sites]
+
+
+def add_field(payload, name, value):
+    """Append one key to a card's JSON object without parsing it."""
+    return f"{payload[:-1]},{json.dumps(name)}:{json.dumps(value)}}}"
+
+
+def json_array(payloads):
+    return '[' + ','.join(payloads) + ']'
+
+
+def cards_response(payloads):
+    return HttpResponse(json_array(payloads), content_type='application/json')
@@ -0,0 +1,78 @@
+"""
+Pluggable SMS sending, shaped like django.core.mail's backends.
+
+    with get_connection() as connection:
+        connection.send_messages([SmsMessage('+919800000000', 'Booking confirmed')])
+
+SMS_BACKEND names the backend class. The console backend is the default
+until a provider is configured. LocMemBackend collects messages in
+`api.sms.outbox` for tests.
+"""
+import sys
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+outbox = []
+
+
+class SmsMessage:
+    def __init__(self, to, body):
+        self.to = to
+        self.body = body
+
+    def __repr__(self):
+        return f"SmsMessage(to={self.to!r})"
+
+
+class BaseSmsBackend:
+    """Subclasses implement send_messages(); open()/close() manage any provider session."""
+
+    def __init__(self, fail_silently=False, **kwargs):
+        self.fail_silently = fail_silently
+
+    def open(self):
+        return False
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        try:
+            self.open()
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send_messages(self, messages):
+        """Send `messages` and return how many were sent."""
+        raise NotImplementedError
+
+
+class ConsoleBackend(BaseSmsBackend):
+    def __init__(self, *args, stream=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send_messages(self, messages):
+        with self._lock:
+            for message in messages:
+                self.stream.write(f"SMS to {message.to}: {message.body}\n")
+            self.stream.flush()
+        return len(messages)
+
+
+class LocMemBackend(BaseSmsBackend):
+    def send_messages(self, messages):
+        outbox.extend(messages)
+        return len(messages)
+
+
+def get_connection(backend=None, fail_silently=False, **kwargs):
+    return import_string(backend or settings.SMS_BACKEND)(fail_silently=fail_silently, **kwargs)
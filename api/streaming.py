@@ -0,0 +1,33 @@
+import json
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+STREAM_CHUNK_SIZE = 500
+
+
+def iter_json_array(queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a JSON array of serialized rows one chunk at a time.
+
+    Rows come from `.iterator(chunk_size=...)`, which also applies the
+    queryset's prefetches per chunk, so memory stays bounded by one chunk.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    yield '['
+    first = True
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        body = ','.join(json.dumps(item, cls=JSONEncoder) for item in serializer_class(chunk, many=True).data)
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+
+
+def streaming_json_response(queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE):
+    return StreamingHttpResponse(
+        iter_json_array(queryset, serializer_class, chunk_size),
+        content_type='application/json',
+    )
@@ -1,36 +1,196 @@
+import logging
+import time
+from datetime import timedelta
 from celery import shared_task
-from django.core.mail import EmailMessage
+from celery.signals import worker_process_init
+from django.db import transaction
+from django.utils import timezone
 from .models import Booking
-from django.template.loader import render_to_string
-from weasyprint import HTML
 from django.conf import settings
+from .razorpay_client import create_order
+from . import analytics, notifications, receipts
+from .booking_state import cancel_pending
+
+logger = logging.getLogger(__name__)
+
+
+@worker_process_init.connect
+def warm_receipt_renderer(**kwargs):
+    # Pay WeasyPrint's import and font loading once per worker process, not on the first paid booking.
+    if getattr(settings, 'RECEIPT_WARM_ON_WORKER_START', True):
+        receipts.warm()
+
 
 @shared_task
 def send_booking_notifications(booking_id):
+    """Fan out a confirmed booking to the render and SMS queues (see api/notifications.py)."""
+    booking = Booking.objects.select_related('user', 'user__userprofile').filter(id=booking_id).first()
+    if booking is None:
+        return
+    if notifications.queue_sms(booking):
+        send_sms_batch.delay()
+    if booking.user and booking.user.email:
+        render_booking_receipt.delay(str(booking.id))
+    return True
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5)
+def render_booking_receipt(self, booking_id):
+    """render queue: receipt PDF in memory with this worker's warmed renderer, then queue the email."""
     try:
-        booking = Booking.objects.select_related('site','site__location','user').get(id=booking_id)
+        booking = (Booking.objects.select_related('site', 'site__location', 'user')
+                   .prefetch_related('optional_charges').get(id=booking_id))
     except Booking.DoesNotExist:
         return
+    try:
+        pdf = receipts.render_receipt(booking)
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=self.default_retry_delay * 2 ** self.request.retries)
+    if notifications.queue_receipt_email(booking, pdf):
+        send_email_batch.delay()
 
-    # Generate PDF receipt HTML
-    html = render_to_string('booking_receipt.html', {'booking': booking})
-    pdf_file = f"/tmp/receipt_{booking_id}.pdf"
-    HTML(string=html).write_pdf(pdf_file)
 
-    # Send email
-    subject = f"Your booking receipt - {booking.id}"
-    body = "Please find attached receipt."
-    email = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [booking.user.email] if booking.user else [booking.user.email or ''])
-    email.attach_file(pdf_file)
+def _drain(task, channel, batch_size):
+    batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+    countdown = task.default_retry_delay * 2 ** task.request.retries
     try:
-        email.send()
-    except Exception as e:
-        # log
+        claimed, pending = notifications.deliver_batch(channel, batch_size)
+    except Exception as exc:
+        # Backend unreachable; nothing was marked, try the whole batch again.
+        raise task.retry(exc=exc, countdown=countdown)
+    if claimed == batch_size:
+        task.delay(batch_size)
+    if pending and task.request.retries < task.max_retries:
+        raise task.retry(countdown=countdown)
+    return claimed
 
-        pass
 
-    # Send SMS
-    # Implement provider call here, e.g. Twilio or Indian SMS provider
-    # sms_send(phone_number, f"Booking confirmed: {booking.id}")
+@shared_task(bind=True, max_retries=5, default_retry_delay=10)
+def send_email_batch(self, batch_size=None):
+    """email queue: pending receipt emails over one reused SMTP connection."""
+    return _drain(self, 'email', batch_size)
 
-    return True
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=10)
+def send_sms_batch(self, batch_size=None):
+    """sms queue: pending SMS through SMS_BACKEND."""
+    return _drain(self, 'sms', batch_size)
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=2)
+def create_razorpay_order(self, booking_id):
+    """
+    Create the Razorpay order for a pending booking (RAZORPAY_ASYNC_ORDERS).
+    Retries with exponential backoff; gives the slot back if the gateway
+    stays down.
+    """
+    booking = Booking.objects.filter(id=booking_id, status='pending').only('id', 'total_amount', 'razorpay_order_id').first()
+    if booking is None or booking.razorpay_order_id:
+        return
+    try:
+        order = create_order(int(booking.total_amount * 100), receipt=str(booking.id))
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            cancel_pending(booking_id)
+            return
+        raise self.retry(exc=exc, countdown=self.default_retry_delay * 2 ** self.request.retries)
+    Booking.objects.filter(id=booking_id, razorpay_order_id__isnull=True).update(razorpay_order_id=order['id'])
+    return order['id']
+
+
+def expire_pending_batch(cutoff, batch_size):
+    """
+    Expire up to `batch_size` pending bookings created before `cutoff`.
+
+    Rows are claimed oldest-first through the (status, created_at) index
+    with SKIP LOCKED, so a booking being paid right now (or a concurrent
+    sweeper) is skipped instead of waited on. Returns the rows expired.
+    """
+    with transaction.atomic():
+        rows = list(
+            Booking.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', created_at__lt=cutoff)
+            .order_by('created_at')
+            .values_list('id', *analytics.ROLLUP_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        Booking.objects.filter(id__in=[row[0] for row in rows]).update(status='expired')
+        analytics.record_transition([row[1:] for row in rows], 'pending', 'expired')
+        return len(rows)
+
+@shared_task
+def expire_pending_bookings(batch_size=None, max_batches=None):
+    """
+    Periodic sweeper (CELERY_BEAT_SCHEDULE): abandoned checkouts older than
+    BOOKING_HOLD_TTL_MINUTES become `expired`. Work per run is bounded by
+    max_batches x batch_size; anything left is picked up on the next run.
+    """
+    batch_size = batch_size or settings.BOOKING_EXPIRY_BATCH_SIZE
+    max_batches = max_batches or settings.BOOKING_EXPIRY_MAX_BATCHES
+    cutoff = timezone.now() - timedelta(minutes=settings.BOOKING_HOLD_TTL_MINUTES)
+    started = time.monotonic()
+    expired = batches = 0
+    while batches < max_batches:
+        count = expire_pending_batch(cutoff, batch_size)
+        batches += 1
+        expired += count
+        if count < batch_size:
+            break
+    logger.info(
+        'expire_pending_bookings expired=%d batches=%d backlog=%s duration_ms=%d',
+        expired, batches, 'yes' if batches == max_batches else 'no',
+        (time.monotonic() - started) * 1000,
+        extra={'bookings_expired': expired, 'batches': batches},
+    )
+    return expired
+
+@shared_task
+def apply_booking_rollups(batch_size=None, max_batches=None):
+    """
+    Periodic (CELERY_BEAT_SCHEDULE): fold queued booking rollup deltas into
+    the hourly/daily rollups (api/analytics.py). Bounded per run like
+    expire_pending_bookings.
+    """
+    batch_size = batch_size or settings.ROLLUP_DELTA_BATCH_SIZE
+    max_batches = max_batches or settings.ROLLUP_DELTA_MAX_BATCHES
+    started = time.monotonic()
+    applied = batches = 0
+    while batches < max_batches:
+        count = analytics.apply_deltas(batch_size)
+        batches += 1
+        applied += count
+        if count < batch_size:
+            break
+    logger.info(
+        'apply_booking_rollups deltas=%d batches=%d backlog=%s duration_ms=%d',
+        applied, batches, 'yes' if batches == max_batches else 'no',
+        (time.monotonic() - started) * 1000,
+        extra={'rollup_deltas': applied, 'batches': batches},
+    )
+    return applied
+
+@shared_task
+def process_webhook_inbox(batch_size=None, max_batches=None):
+    """
+    Periodic consumer (CELERY_BEAT_SCHEDULE) for the Razorpay webhook inbox;
+    see api/webhooks.py. Bounded per run like expire_pending_bookings.
+    """
+    from .webhooks import drain_inbox_batch
+    batch_size = batch_size or settings.WEBHOOK_INBOX_BATCH_SIZE
+    max_batches = max_batches or settings.WEBHOOK_INBOX_MAX_BATCHES
+    started = time.monotonic()
+    events = paid = batches = 0
+    while batches < max_batches:
+        count, confirmed = drain_inbox_batch(batch_size)
+        batches += 1
+        events += count
+        paid += confirmed
+        if count < batch_size:
+            break
+    logger.info(
+        'process_webhook_inbox events=%d paid=%d batches=%d backlog=%s duration_ms=%d',
+        events, paid, batches, 'yes' if batches == max_batches else 'no',
+        (time.monotonic() - started) * 1000,
+        extra={'webhook_events': events, 'bookings_paid': paid, 'batches': batches},
+    )
+    return events
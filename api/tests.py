@@ -1,3 +1,1722 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import io
+import json
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import razorpay
+import requests
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from users.models import UserProfile
+
+from .models import (
+    Site, Location, Pricing, OptionalCharge, Booking, WebhookEvent, Notification, SiteCard,
+    HourlyBookingRollup, DailyBookingRollup, BookingRollupDelta,
+)
+from .serializers import SiteSerializer
+from . import http_cache, metrics, notifications, pricing_cache, site_cards, sms
+from .streaming import iter_json_array
+from .availability import lock_slots, site_capacity
+from .fake_razorpay import FakeRazorpayServer, sign, sign_webhook
+from . import razorpay_client
+from .razorpay_client import build_client
+from .tasks import (
+    apply_booking_rollups, create_razorpay_order, expire_pending_bookings, process_webhook_inbox,
+    send_booking_notifications, render_booking_receipt, send_email_batch, send_sms_batch,
+)
+from .webhooks import drain_inbox_batch
+from .importer import import_sites, parse_csv, parse_jsonl
+from .booking_state import mark_paid, cancel_pending
+from .pricing_engine import TierTable
+from .admin import EstimatedCountPaginator
+from .query_plans import PlanCapture
+from .tasks import expire_pending_batch
+
+User = get_user_model()
+
+
+def at(hour, day=1):
+    """An aware datetime on a fixed test date; hours past 23 roll over."""
+    return datetime.datetime(2030, 1, day, tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=hour)
+
+
+def make_sites(count, prefix='Site'):
+    """Create `count` sites, each with a car/bike pricing tier and two charges."""
+    location, _ = Location.objects.get_or_create(name='Andheri East', defaults={'pincode': '400069'})
+    sites = []
+    for i in range(count):
+        site = Site.objects.create(name=f"{prefix} {i}", location=location, total_slots_car=10, total_slots_bike=10)
+        Pricing.objects.create(site=site, vehicle_type='car', tier='0_2', price=Decimal('60.00'))
+        Pricing.objects.create(site=site, vehicle_type='bike', tier='0_2', price=Decimal('30.00'))
+        OptionalCharge.objects.create(site=site, name='Valet', amount=Decimal('50.00'))
+        OptionalCharge.objects.create(site=site, name='Wash', amount=Decimal('80.00'), is_active=False)
+        sites.append(site)
+    return sites
+
+
+def clear_caches():
+    """Empty the shared cache and this process's pricing LRU."""
+    cache.clear()
+    pricing_cache._local.clear()
+
+
+class APITestMixin:
+    """Fresh caches for every test; login() points `self.client` at an authenticated APIClient."""
+
+    def setUp(self):
+        super().setUp()
+        clear_caches()
+
+    def login(self, user=None, username='u', **fields):
+        """Authenticate `self.client` as `user`, or as a new user named `username`; returns the user."""
+        if user is None:
+            user = User.objects.create_user(username, f'{username}@example.com', 'pw', **fields)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        return user
+
+
+class SiteListingQueryCountTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login(username='admin', is_staff=True)
+
+    def _count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_search_sites_query_count_is_flat(self):
+        make_sites(2)
+        small, _ = self._count_queries(reverse('search_sites'), {'q': 'Site'})
+        make_sites(20, prefix='More Site')
+        large, data = self._count_queries(reverse('search_sites'), {'q': 'Site'})
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small, large)
+
+    def test_list_sites_query_count_is_flat(self):
+        make_sites(2)
+        small, _ = self._count_queries(reverse('list_sites'))
+        make_sites(20, prefix='More Site')
+        large, data = self._count_queries(reverse('list_sites'))
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small, large)
+
+    def test_only_active_charges_are_listed(self):
+        make_sites(1)
+        _, data = self._count_queries(reverse('list_sites'))
+        self.assertEqual([c['name'] for c in data[0]['charges']], ['Valet'])
+        self.assertEqual(len(data[0]['pricings']), 2)
+
+
+class NearbySearchTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        andheri = Location.objects.create(name='Andheri East', lat=Decimal('19.113600'), lng=Decimal('72.869700'))
+        Site.objects.create(name='Far', location=andheri, lat=Decimal('19.200000'), lng=Decimal('72.869700'))
+        Site.objects.create(name='Near', location=andheri, lat=Decimal('19.115000'), lng=Decimal('72.870000'))
+        # No coordinates of its own: inherits the location's.
+        Site.objects.create(name='Inherited', location=andheri)
+        Site.objects.create(name='Pune', location=Location.objects.create(name='Pune', lat=Decimal('18.52'), lng=Decimal('73.85')))
+
+    def test_results_are_within_radius_and_ordered_by_distance(self):
+        response = self.client.get(reverse('search_sites'), {'near': '19.1136,72.8697', 'radius_km': '2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['name'] for s in response.json()], ['Inherited', 'Near'])
+        self.assertEqual(response.json()[0]['distance_km'], 0)
+
+    def test_wider_radius_includes_farther_sites(self):
+        response = self.client.get(reverse('search_sites'), {'near': '19.1136,72.8697', 'radius_km': '20'})
+        self.assertEqual([s['name'] for s in response.json()], ['Inherited', 'Near', 'Far'])
+
+    def test_invalid_point_is_rejected(self):
+        response = self.client.get(reverse('search_sites'), {'near': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('search_sites'), {'near': '19.1,72.8', 'radius_km': '500'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TextSearchTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        andheri = Location.objects.create(name='Andheri East', pincode='400069')
+        bandra = Location.objects.create(name='Bandra West', pincode='400050')
+        Site.objects.create(name='Mall Andheri Parking', location=bandra)
+        Site.objects.create(name='Andheri', location=bandra)
+        Site.objects.create(name='Andheri Station', location=bandra)
+        Site.objects.create(name='Metro Lot', location=andheri)
+        Site.objects.create(name='Carter Road', location=bandra, address='Near Andheri flyover')
+        Site.objects.create(name='Linking Road', location=bandra)
+
+    def test_results_are_ranked(self):
+        response = self.client.get(reverse('search_sites'), {'q': 'andheri'})
+        self.assertEqual(
+            [s['name'] for s in response.json()],
+            ['Andheri', 'Andheri Station', 'Mall Andheri Parking', 'Carter Road', 'Metro Lot'],
+        )
+
+    def test_pincode_is_a_prefix_match(self):
+        response = self.client.get(reverse('search_sites'), {'pincode': '40006'})
+        self.assertEqual([s['name'] for s in response.json()], ['Metro Lot'])
+        response = self.client.get(reverse('search_sites'), {'pincode': '0069'})
+        self.assertEqual(response.json(), [])
+
+    def test_page_param_returns_paginated_envelope(self):
+        response = self.client.get(reverse('search_sites'), {'q': 'andheri', 'page': 2, 'page_size': 2})
+        self.assertEqual(response.json()['count'], 5)
+        self.assertEqual([s['name'] for s in response.json()['results']], ['Mall Andheri Parking', 'Carter Road'])
+
+
+class ListingPaginationTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(username='admin', is_staff=True)
+        self.sites = make_sites(7)
+
+    def _walk(self, url, params):
+        names, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            names += [s['name'] for s in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                return names, pages
+            response = self.client.get(response.data['next'])
+
+    def test_list_sites_keyset_walks_every_site_once(self):
+        names, pages = self._walk(reverse('list_sites'), {'limit': 3})
+        self.assertEqual(names, [s.name for s in self.sites])
+        self.assertEqual(pages, 3)
+
+    def test_search_keyset_follows_ranked_order(self):
+        Site.objects.create(name='Site', location=self.sites[0].location)
+        expected = [s['name'] for s in self.client.get(reverse('search_sites'), {'q': 'site'}).json()]
+        names, _ = self._walk(reverse('search_sites'), {'q': 'site', 'limit': 2})
+        self.assertEqual(names, expected)
+        self.assertEqual(names[0], 'Site')
+
+    def test_bad_cursor_is_404(self):
+        response = self.client.get(reverse('list_sites'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_returns_full_json_array(self):
+        response = self.client.get(reverse('list_sites'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([s['name'] for s in data], [s.name for s in self.sites])
+        self.assertEqual([c['name'] for c in data[0]['charges']], ['Valet'])
+
+    def test_stream_chunks_join_into_valid_json(self):
+        qs = SiteSerializer.setup_eager_loading(Site.objects.order_by('id'))
+        data = json.loads(''.join(iter_json_array(qs, SiteSerializer, chunk_size=3)))
+        self.assertEqual(len(data), 7)
+
+
+class PricingCacheTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(username='admin', is_staff=True)
+        self.site = make_sites(1)[0]
+        self.valet = self.site.charges.get(name='Valet')
+        self.body = {
+            'site_id': self.site.id, 'vehicle_type': 'car',
+            'start_time': '2025-01-01T10:00:00', 'end_time': '2025-01-01T11:30:00',
+            'optional_charges': [self.valet.id],
+        }
+
+    def quote(self):
+        response = self.client.post(reverse('calculate_price'), self.body, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_repeat_quotes_hit_no_database(self):
+        self.assertEqual(self.quote()['total_amount'], 110)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.quote()['total_amount'], 110)
+
+    def test_pricing_change_invalidates(self):
+        self.quote()
+        pricing = Pricing.objects.get(site=self.site, vehicle_type='car', tier='0_2')
+        pricing.price = Decimal('75.00')
+        pricing.save()
+        self.assertEqual(self.quote()['base_amount'], 75)
+
+    def test_charge_change_invalidates(self):
+        self.quote()
+        self.valet.is_active = False
+        self.valet.save()
+        self.assertEqual(self.quote()['optional_amount'], 0)
+
+    def test_invalidated_again_when_the_change_commits(self):
+        self.quote()
+        pricing = Pricing.objects.get(site=self.site, vehicle_type='car', tier='0_2')
+        with self.captureOnCommitCallbacks() as callbacks:
+            pricing.price = Decimal('75.00')
+            pricing.save()
+            self.valet.amount = Decimal('80.00')
+            self.valet.save()
+        # A concurrent reader refilling the cache from the pre-commit rows.
+        cache.set(pricing_cache._prices_key(self.site.id, 'car'), {'0_2': Decimal('60.00')})
+        cache.set(pricing_cache._charges_key(self.site.id), {self.valet.id: Decimal('50.00')})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.quote()['base_amount'], 75)
+        self.assertEqual(self.quote()['optional_amount'], 80)
+
+    def test_global_charge_change_invalidates(self):
+        self.quote()
+        extra = OptionalCharge.objects.create(name='Helmet locker', amount=Decimal('10.00'))
+        self.body['optional_charges'] = [self.valet.id, extra.id]
+        self.assertEqual(self.quote()['optional_amount'], 60)
+        extra.amount = Decimal('20.00')
+        extra.save()
+        self.assertEqual(self.quote()['optional_amount'], 70)
+
+    def test_unknown_site_is_404(self):
+        self.body['site_id'] = self.site.id + 100
+        response = self.client.post(reverse('calculate_price'), self.body, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkQuoteTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def _body(self, sites):
+        quotes = []
+        for site in sites:
+            valet = site.charges.get(name='Valet')
+            for vehicle_type in ('car', 'bike'):
+                quotes.append({
+                    'site_id': site.id, 'vehicle_type': vehicle_type,
+                    'start_time': '2025-01-01T10:00:00Z', 'end_time': '2025-01-01T11:00:00Z',
+                    'optional_charges': [valet.id],
+                })
+        return {'quotes': quotes}
+
+    def test_matches_single_quotes(self):
+        sites = make_sites(3)
+        response = self.client.post(reverse('calculate_price_bulk'), self._body(sites), format='json')
+        self.assertEqual(response.status_code, 200)
+        for item in response.data['quotes']:
+            single = self.client.post(reverse('calculate_price'), {
+                'site_id': item['site_id'], 'vehicle_type': item['vehicle_type'],
+                'start_time': '2025-01-01T10:00:00', 'end_time': '2025-01-01T11:00:00',
+                'optional_charges': [Site.objects.get(id=item['site_id']).charges.get(name='Valet').id],
+            }, format='json').data
+            self.assertEqual(item['total_amount'], single['total_amount'])
+        self.assertEqual([q['total_amount'] for q in response.data['quotes'][:2]], [110, 80])
+
+    def test_query_count_is_flat(self):
+        body = self._body(make_sites(2))
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse('calculate_price_bulk'), body, format='json')
+        clear_caches()
+        body = self._body(make_sites(25, prefix='More'))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(reverse('calculate_price_bulk'), body, format='json')
+        self.assertEqual(len(response.data['quotes']), 50)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_unknown_site_and_validation(self):
+        body = {'quotes': [{'site_id': 999, 'vehicle_type': 'car',
+                            'start_time': '2025-01-01T10:00:00Z', 'end_time': '2025-01-01T11:00:00Z'}]}
+        response = self.client.post(reverse('calculate_price_bulk'), body, format='json')
+        self.assertEqual(response.data['quotes'][0]['detail'], 'Site not found.')
+        response = self.client.post(reverse('calculate_price_bulk'), {'quotes': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.site = make_sites(1)[0]
+        self.site.total_slots_car = 2
+        self.site.save()
+
+    def book(self, start, end, status='paid', vehicle_type='car'):
+        return Booking.objects.create(
+            site=self.site, vehicle_type=vehicle_type, start_time=at(start), end_time=at(end),
+            duration_minutes=60, base_amount=Decimal('60'), total_amount=Decimal('60'), status=status,
+        )
+
+    def availability(self, start, end):
+        response = self.client.get(reverse('site_availability'), {
+            'site_id': str(self.site.id), 'vehicle_type': 'car',
+            'start_time': at(start).isoformat(), 'end_time': at(end).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.data[0]
+
+    def test_peak_overlap_not_total_overlap(self):
+        # Two bookings in the window that never overlap each other use one slot.
+        self.book(10, 11)
+        self.book(11, 12)
+        self.assertEqual(self.availability(9, 13)['available'], 1)
+        self.book(10, 12)
+        self.assertEqual(self.availability(9, 13)['available'], 0)
+        self.assertEqual(self.availability(12, 13)['available'], 2)
+
+    def test_inactive_bookings_and_other_vehicles_do_not_count(self):
+        self.book(10, 12, status='cancelled')
+        self.book(10, 12, status='expired')
+        self.book(10, 12, vehicle_type='bike')
+        self.assertEqual(self.availability(10, 12)['available'], 2)
+
+    def test_book_create_rejects_full_window(self):
+        self.book(10, 12)
+        self.book(10, 12)
+        body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                'start_time': at(11).isoformat(), 'end_time': at(13).isoformat()}
+        with mock.patch('api.razorpay_client.client') as razorpay:
+            response = self.client.post(reverse('book_create'), body, format='json')
+        self.assertEqual(response.status_code, 409)
+        razorpay.order.create.assert_not_called()
+
+    def test_bad_params(self):
+        response = self.client.get(reverse('site_availability'), {'site_id': 'x', 'start_time': at(1).isoformat(), 'end_time': at(2).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('site_availability'), {'site_id': '1', 'start_time': at(2).isoformat(), 'end_time': at(1).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('site_availability'), {
+            'site_id': self.site.id, 'vehicle_type': 'truck', 'start_time': at(1).isoformat(), 'end_time': at(2).isoformat()})
+        self.assertEqual((response.status_code, response.data['detail']), (400, 'vehicle_type must be one of: car, bike.'))
+        with self.assertRaises(ValueError):
+            site_capacity(self.site, 'truck')
+
+    def test_lapsed_pending_hold_frees_the_slot(self):
+        self.book(10, 12, status='pending')
+        stale = self.book(10, 12, status='pending')
+        self.assertEqual(self.availability(10, 12)['available'], 0)
+        Booking.objects.filter(id=stale.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(self.availability(10, 12)['available'], 1)
+
+    def test_gateway_failure_releases_hold(self):
+        body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                'start_time': at(11).isoformat(), 'end_time': at(13).isoformat()}
+        with mock.patch('api.razorpay_client.client') as razorpay:
+            razorpay.order.create.side_effect = ConnectionError('gateway down')
+            response = self.client.post(reverse('book_create'), body, format='json')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(Booking.objects.get().status, 'cancelled')
+        self.assertEqual(self.availability(11, 13)['available'], 2)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReservationTests(APITestMixin, TransactionTestCase):
+    """Hundreds of simultaneous book_create calls must never overbook a site."""
+    attempts = 200
+    workers = 20
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('u', 'u@example.com', 'pw')
+        self.site = make_sites(1)[0]
+        self.site.total_slots_car = 5
+        self.site.save()
+        self.other = make_sites(1, prefix='Other')[0]
+
+    def _book(self, site):
+        try:
+            client = APIClient()
+            client.force_authenticate(self.user)
+            body = {'site_id': site.id, 'vehicle_type': 'car',
+                    'start_time': at(10).isoformat(), 'end_time': at(12).isoformat()}
+            return client.post(reverse('book_create'), body, format='json').status_code
+        finally:
+            connection.close()
+
+    def test_no_overbooking_under_contention(self):
+        with mock.patch('api.razorpay_client.client') as razorpay:
+            razorpay.order.create.side_effect = lambda *a, **kw: {'id': f'order_{uuid.uuid4().hex}'}
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                codes = list(pool.map(self._book, [self.site] * self.attempts))
+        self.assertEqual(codes.count(201), 5)
+        self.assertEqual(codes.count(409), self.attempts - 5)
+        self.assertEqual(Booking.objects.filter(site=self.site, status='pending').count(), 5)
+
+    def test_other_sites_are_not_blocked(self):
+        with transaction.atomic():
+            lock_slots(self.site.id, 'car')
+            with mock.patch('api.razorpay_client.client') as razorpay:
+                razorpay.order.create.return_value = {'id': 'order_other'}
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    code = pool.submit(self._book, self.other).result(timeout=10)
+        self.assertEqual(code, 201)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentPaymentTests(TransactionTestCase):
+    """Simultaneous verify calls for one payment confirm the booking once."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('u', 'u@example.com', 'pw')
+        self.booking = Booking.objects.create(
+            site=make_sites(1)[0], vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+            base_amount=Decimal('60'), total_amount=Decimal('60'), razorpay_order_id='order_1',
+        )
+
+    def _verify(self, _):
+        try:
+            return mark_paid(self.booking.id, 'order_1', 'pay_1')
+        finally:
+            connection.close()
+
+    def test_one_transition_under_contention(self):
+        with mock.patch('api.booking_state._notify') as notify:
+            with ThreadPoolExecutor(max_workers=10) as pool:
+                results = list(pool.map(self._verify, range(20)))
+        self.assertEqual(results.count('paid'), 1)
+        self.assertEqual(results.count('already_paid'), 19)
+        notify.assert_called_once()
+        apply_booking_rollups()
+        self.assertEqual(HourlyBookingRollup.objects.get(status='paid').bookings, 1)
+        self.assertFalse(HourlyBookingRollup.objects.filter(status='pending').exclude(bookings=0).exists())
+
+
+class RazorpayGatewayTests(TestCase):
+    def setUp(self):
+        self.server = FakeRazorpayServer().start()
+        self.addCleanup(self.server.stop)
+
+    def test_orders_reuse_one_pooled_connection(self):
+        client = build_client(base_url=self.server.url)
+        ids = {client.order.create({'amount': 100, 'currency': 'INR'})['id'] for _ in range(5)}
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_slow_gateway_times_out(self):
+        self.server.latency = 0.5
+        client = build_client(base_url=self.server.url, read_timeout=0.1, max_retries=0)
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.order.create({'amount': 100, 'currency': 'INR'})
+        # A timed-out POST is not retried: it could create a duplicate order.
+        self.assertEqual(self.server.requests, 1)
+
+    def test_get_is_retried_on_server_errors(self):
+        client = build_client(base_url=self.server.url, max_retries=3)
+        order = client.order.create({'amount': 100, 'currency': 'INR'})
+        self.server.failure_rate = 1.0
+        with self.assertRaises(razorpay.errors.ServerError):
+            client.order.fetch(order['id'])
+        self.assertEqual(self.server.requests, 1 + 4)
+
+
+@override_settings(RAZORPAY_ASYNC_ORDERS=True)
+class AsyncOrderTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.site = make_sites(1)[0]
+        self.server = FakeRazorpayServer().start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch('api.razorpay_client.client', build_client(base_url=self.server.url))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                     'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}
+
+    def test_booking_returns_before_order_and_poll_sees_it(self):
+        with mock.patch('api.tasks.create_razorpay_order.delay') as delay:
+            response = self.client.post(reverse('book_create'), self.body, format='json')
+        self.assertEqual(response.status_code, 202)
+        booking_id = response.data['booking_id']
+        delay.assert_called_once_with(booking_id)
+
+        status_url = response.data['order_status_url']
+        self.assertFalse(self.client.get(status_url).data['ready'])
+        create_razorpay_order(booking_id)
+        poll = self.client.get(status_url).data
+        self.assertTrue(poll['ready'])
+        self.assertIn(poll['razorpay_order_id'], self.server.orders)
+        self.assertEqual(poll['amount'], 6000)
+
+    def test_other_users_cannot_poll(self):
+        with mock.patch('api.tasks.create_razorpay_order.delay'):
+            response = self.client.post(reverse('book_create'), self.body, format='json')
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('v', 'v@example.com', 'pw'))
+        self.assertEqual(other.get(response.data['order_status_url']).status_code, 404)
+
+
+class AsyncEndpointTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('u', 'u@example.com', 'pw')
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        self.site = make_sites(1)[0]
+        self.server = FakeRazorpayServer().start()
+        self.addCleanup(self.server.stop)
+        razorpay_client.configure(base_url=self.server.url)
+        self.addCleanup(razorpay_client.configure)
+
+    async def test_search_matches_sync_view(self):
+        response = await self.async_client.get(reverse('async_search_sites'), {'q': 'site'}, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['name'] for s in response.json()], ['Site 0'])
+        self.assertEqual([c['name'] for c in response.json()[0]['charges']], ['Valet'])
+
+    async def test_requires_token(self):
+        response = await self.async_client.get(reverse('async_search_sites'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_quote_book_and_verify(self):
+        window = {'site_id': self.site.id, 'vehicle_type': 'car',
+                  'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}
+        quote = await self.async_client.post(reverse('async_calculate_price'), window,
+                                             content_type='application/json', headers=self.auth)
+        self.assertEqual(quote.json()['total_amount'], 60)
+
+        booked = await self.async_client.post(reverse('async_book_create'), window,
+                                              content_type='application/json', headers=self.auth)
+        self.assertEqual(booked.status_code, 201)
+        order_id = booked.json()['razorpay_order_id']
+        self.assertIn(order_id, self.server.orders)
+
+        payment = {
+            'booking_id': booked.json()['booking_id'], 'razorpay_order_id': order_id,
+            'razorpay_payment_id': 'pay_1', 'razorpay_signature': sign(order_id, 'pay_1', 'secret'),
+        }
+        with mock.patch.object(razorpay_client.client, 'auth', ('key', 'secret')), \
+                mock.patch('api.tasks.send_booking_notifications.delay') as notify:
+            verified = await self.async_client.post(reverse('async_verify_payment'), payment,
+                                                    content_type='application/json', headers=self.auth)
+            # The view's transaction lives on the sync thread's connection; run what it queued on commit.
+            for _, callback, _ in await sync_to_async(lambda: list(connection.run_on_commit))():
+                callback()
+        self.assertEqual(verified.status_code, 200)
+        notify.assert_called_once()
+        booking = await Booking.objects.aget(id=booked.json()['booking_id'])
+        self.assertEqual(booking.status, 'paid')
+
+    async def test_malformed_bodies_are_400_like_the_sync_views(self):
+        window = {'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}
+        cases = [
+            ('calculate_price', dict(window, vehicle_type='car')),
+            ('calculate_price', dict(window, site_id='one', vehicle_type='car')),
+            ('book_create', dict(window, site_id=self.site.id, vehicle_type='truck')),
+            ('book_create', [window]),
+            ('verify_payment', {'booking_id': 'b', 'razorpay_order_id': 'order_1'}),
+        ]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for name, body in cases:
+            with self.subTest(name, body=body):
+                response = await self.async_client.post(reverse(f'async_{name}'), body,
+                                                        content_type='application/json', headers=self.auth)
+                self.assertEqual(response.status_code, 400)
+                sync = await sync_to_async(client.post)(reverse(name), body, format='json')
+                self.assertEqual(sync.status_code, 400)
+                if isinstance(body, dict):
+                    self.assertEqual(sync.json(), response.json())
+
+
+class PaymentVerificationTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        self.site = make_sites(1)[0]
+        self.booking = Booking.objects.create(
+            site=self.site, vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+            base_amount=Decimal('60'), total_amount=Decimal('60'), razorpay_order_id='order_1',
+        )
+        patcher = mock.patch.object(razorpay_client.client, 'auth', ('key', 'secret'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def payment(self, order_id='order_1', payment_id='pay_1'):
+        return {'booking_id': str(self.booking.id), 'razorpay_order_id': order_id,
+                'razorpay_payment_id': payment_id, 'razorpay_signature': sign(order_id, payment_id, 'secret')}
+
+    def verify(self, payment, **headers):
+        return self.client.post(reverse('verify_payment'), payment, format='json', headers=headers)
+
+    def test_retries_confirm_once_and_notify_once(self):
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            responses = [self.verify(self.payment()) for _ in range(3)]
+        self.assertEqual([r.status_code for r in responses], [200, 200, 200])
+        notify.assert_called_once_with(str(self.booking.id))
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.razorpay_payment_id), ('paid', 'pay_1'))
+
+    def test_locked_read_then_narrow_update(self):
+        with mock.patch('api.tasks.send_booking_notifications.delay'), \
+                CaptureQueriesContext(connection) as queries:
+            self.verify(self.payment())
+        reads = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual((len(reads), len(writes)), (1, 1))
+        self.assertIn('"status" = ', reads[0].split('WHERE')[1])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', reads[0])
+        # Only the changed columns are written.
+        self.assertNotIn('total_amount', writes[0].split('WHERE')[0])
+
+    def test_other_order_conflicts(self):
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify:
+            self.assertEqual(self.verify(self.payment(order_id='order_2')).status_code, 409)
+        notify.assert_not_called()
+        self.assertEqual(Booking.objects.get(id=self.booking.id).status, 'pending')
+
+    def test_late_payment_revives_booking_while_slot_is_free(self):
+        Booking.objects.filter(id=self.booking.id).update(status='expired')
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.verify(self.payment()).status_code, 200)
+            self.assertEqual(self.verify(self.payment()).status_code, 200)
+        notify.assert_called_once_with(str(self.booking.id))
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.razorpay_payment_id), ('paid', 'pay_1'))
+
+    def test_late_payment_for_a_taken_slot_is_kept_for_refund(self):
+        # The hold lapsed without a sweep, and the only slot has since been sold.
+        Site.objects.filter(id=self.site.id).update(total_slots_car=1)
+        Booking.objects.filter(id=self.booking.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        Booking.objects.create(site=self.site, vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+                               base_amount=Decimal('60'), total_amount=Decimal('60'), status='paid')
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.assertLogs('api.booking_state', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = self.verify(self.payment())
+        self.assertEqual((response.status_code, response.data['status']), (409, 'refund_due'))
+        notify.assert_not_called()
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.razorpay_payment_id), ('refund_due', 'pay_1'))
+        self.assertEqual(self.verify(self.payment()).data['status'], 'refund_due')
+
+    def test_verify_idempotency_key_replays_response(self):
+        with mock.patch('api.tasks.send_booking_notifications.delay'):
+            first = self.verify(self.payment(), **{'Idempotency-Key': 'k1'})
+            with CaptureQueriesContext(connection) as queries:
+                replay = self.verify(self.payment(), **{'Idempotency-Key': 'k1'})
+        self.assertEqual((replay.status_code, replay.data), (first.status_code, first.data))
+        self.assertEqual(replay['Idempotent-Replay'], 'true')
+        self.assertEqual(len(queries), 0)
+
+    def test_book_create_idempotency_key(self):
+        body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                'start_time': at(12).isoformat(), 'end_time': at(13).isoformat()}
+        headers = {'Idempotency-Key': 'checkout-1'}
+        with mock.patch('api.views.create_order', return_value={'id': 'order_2'}) as create:
+            first = self.client.post(reverse('book_create'), body, format='json', headers=headers)
+            again = self.client.post(reverse('book_create'), body, format='json', headers=headers)
+            changed = self.client.post(reverse('book_create'), dict(body, vehicle_type='bike'),
+                                       format='json', headers=headers)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(again.data['booking_id'], first.data['booking_id'])
+        self.assertEqual(changed.status_code, 422)
+        create.assert_called_once()
+        self.assertEqual(Booking.objects.filter(start_time=at(12)).count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                'start_time': at(12).isoformat(), 'end_time': at(13).isoformat()}
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('v', 'v@example.com', 'pw'))
+        # Razorpay order ids are unique per booking.
+        with mock.patch('api.views.create_order', side_effect=[{'id': 'order_2'}, {'id': 'order_3'}]):
+            mine = self.client.post(reverse('book_create'), body, format='json', headers={'Idempotency-Key': 'k'})
+            theirs = other.post(reverse('book_create'), body, format='json', headers={'Idempotency-Key': 'k'})
+        self.assertNotEqual(mine.data['booking_id'], theirs.data['booking_id'])
+
+
+class ExpirySweeperTests(TestCase):
+    def setUp(self):
+        self.site = make_sites(1)[0]
+
+    def booking(self, status, age_minutes):
+        booking = Booking.objects.create(
+            site=self.site, vehicle_type='car', start_time=at(10), end_time=at(11),
+            duration_minutes=60, base_amount=Decimal('60'), total_amount=Decimal('60'), status=status,
+        )
+        Booking.objects.filter(id=booking.id).update(created_at=timezone.now() - datetime.timedelta(minutes=age_minutes))
+        return booking
+
+    def test_expires_only_stale_pending_in_batches(self):
+        stale = [self.booking('pending', 60 + i) for i in range(5)]
+        fresh = self.booking('pending', 1)
+        paid = self.booking('paid', 120)
+        with self.assertLogs('api.tasks', 'INFO') as logs:
+            self.assertEqual(expire_pending_bookings(batch_size=2), 5)
+        self.assertIn('expired=5 batches=3', logs.output[0])
+        self.assertEqual(set(Booking.objects.filter(status='expired').values_list('id', flat=True)), {b.id for b in stale})
+        self.assertEqual(Booking.objects.get(id=fresh.id).status, 'pending')
+        self.assertEqual(Booking.objects.get(id=paid.id).status, 'paid')
+
+    def test_work_per_run_is_bounded(self):
+        for i in range(5):
+            self.booking('pending', 60)
+        self.assertEqual(expire_pending_bookings(batch_size=2, max_batches=1), 2)
+        self.assertEqual(expire_pending_bookings(batch_size=2, max_batches=5), 3)
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        self.site = make_sites(1)[0]
+        self.bookings = [
+            Booking.objects.create(
+                site=self.site, vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+                base_amount=Decimal('60'), total_amount=Decimal('60'), razorpay_order_id=f'order_{i}',
+            )
+            for i in range(4)
+        ]
+
+    def deliver(self, event_id, order_id, event='payment.captured', signature=None):
+        body = json.dumps({'entity': 'event', 'event': event, 'payload': {
+            'payment': {'entity': {'id': f'pay_{order_id}', 'order_id': order_id, 'status': 'captured'}}}})
+        return self.client.post(reverse('razorpay_webhook'), body, content_type='application/json', headers={
+            'X-Razorpay-Signature': signature or sign_webhook(body, 'whsec'), 'X-Razorpay-Event-Id': event_id})
+
+    def test_ingest_is_one_insert_and_checks_signature(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.deliver('evt_1', 'order_0').status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.deliver('evt_2', 'order_1', signature='bad').status_code, 400)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(Booking.objects.get(id=self.bookings[0].id).status, 'pending')
+
+    def test_signature_covers_raw_bytes_and_redeliveries_share_an_id(self):
+        for created_at in (1700000000, 1700000060):
+            body = json.dumps({'event': 'payment.captured', 'created_at': created_at, 'payload': {'payment': {
+                'entity': {'id': 'pay_1', 'order_id': 'order_0', 'notes': {'site': 'Café ₹'}}}}},
+                ensure_ascii=False).encode()
+            response = self.client.post(reverse('razorpay_webhook'), body, content_type='application/json',
+                                        headers={'X-Razorpay-Signature': sign_webhook(body, 'whsec')})
+            self.assertEqual(response.status_code, 200)
+        tampered = body.replace('₹'.encode(), b'\xff')
+        response = self.client.post(reverse('razorpay_webhook'), tampered, content_type='application/json',
+                                    headers={'X-Razorpay-Signature': sign_webhook(body, 'whsec')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(WebhookEvent.objects.values_list('event_id', flat=True)),
+                         ['payment.captured:pay_1', 'payment.captured:pay_1'])
+        self.assertEqual(drain_inbox_batch(10), (2, 1))
+
+    def test_consumer_dedupes_and_applies_in_bulk(self):
+        self.deliver('evt_0', 'order_0')
+        self.deliver('evt_0', 'order_0')  # Razorpay redelivery
+        self.deliver('evt_1', 'order_1', event='order.paid')
+        self.deliver('evt_2', 'order_2', event='payment.failed')
+        self.deliver('evt_3', 'order_3')
+        self.deliver('evt_4', 'order_unknown')
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.captureOnCommitCallbacks(execute=True), self.assertLogs('api.webhooks', 'ERROR'):
+            self.assertEqual(process_webhook_inbox(batch_size=4), 6)
+        statuses = dict(Booking.objects.values_list('razorpay_order_id', 'status'))
+        self.assertEqual(statuses, {'order_0': 'paid', 'order_1': 'paid', 'order_2': 'pending', 'order_3': 'paid'})
+        self.assertEqual(Booking.objects.get(id=self.bookings[0].id).razorpay_payment_id, 'pay_order_0')
+        self.assertEqual(notify.call_count, 3)
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(list(WebhookEvent.objects.filter(needs_refund=True).values_list('event_id', flat=True)), ['evt_4'])
+
+        self.deliver('evt_0', 'order_0')
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            process_webhook_inbox()
+        notify.assert_not_called()
+
+    def test_payments_after_the_hold_are_settled_or_flagged(self):
+        Site.objects.filter(id=self.site.id).update(total_slots_car=3)
+        expired, cancelled, lapsed, paid = self.bookings
+        Booking.objects.filter(id=expired.id).update(status='expired')
+        Booking.objects.filter(id=cancelled.id).update(status='cancelled')
+        Booking.objects.filter(id=lapsed.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        Booking.objects.filter(id=paid.id).update(status='paid', razorpay_payment_id='pay_order_3')
+        Booking.objects.create(site=self.site, vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+                               base_amount=Decimal('60'), total_amount=Decimal('60'), status='paid')
+        for i, booking in enumerate(self.bookings):
+            self.deliver(f'evt_{i}', booking.razorpay_order_id)
+        body = json.dumps({'event': 'payment.captured', 'payload': {'payment': {'entity': {
+            'id': 'pay_again', 'order_id': 'order_3'}}}})
+        self.client.post(reverse('razorpay_webhook'), body, content_type='application/json', headers={
+            'X-Razorpay-Signature': sign_webhook(body, 'whsec'), 'X-Razorpay-Event-Id': 'evt_again'})
+
+        with mock.patch('api.tasks.send_booking_notifications.delay') as notify, \
+                self.captureOnCommitCallbacks(execute=True), self.assertLogs('api', 'ERROR') as logs:
+            self.assertEqual(drain_inbox_batch(100), (5, 1))
+        # Two paid bookings plus the revived one fill the site, so the lapsed hold cannot come back.
+        statuses = dict(Booking.objects.exclude(razorpay_order_id=None).values_list('razorpay_order_id', 'status'))
+        self.assertEqual(statuses, {'order_0': 'paid', 'order_1': 'refund_due', 'order_2': 'refund_due', 'order_3': 'paid'})
+        self.assertEqual(Booking.objects.get(id=cancelled.id).razorpay_payment_id, 'pay_order_1')
+        notify.assert_called_once_with(str(expired.id))
+        flagged = WebhookEvent.objects.filter(needs_refund=True).values_list('event_id', flat=True)
+        self.assertEqual(sorted(flagged), ['evt_1', 'evt_2', 'evt_again'])
+        self.assertIn('evt_again (second_payment)', logs.output[-1])
+        self.assertEqual(len(logs.output), 3)  # two refund_due bookings, then the inbox summary
+
+    def test_batch_query_count_is_flat(self):
+        for i, booking in enumerate(self.bookings):
+            self.deliver(f'evt_{i}', booking.razorpay_order_id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(drain_inbox_batch(100), (4, 4))
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # events, already-seen ids, bookings to lock, bookings update, queued
+        # rollup deltas, events update
+        self.assertEqual(len(statements), 6)
+
+
+class ReceiptTests(TestCase):
+    def setUp(self):
+        site = make_sites(1)[0]
+        self.booking = Booking.objects.create(
+            user=User.objects.create_user('u', 'u@example.com', 'pw'), site=site, vehicle_type='car',
+            start_time=at(10), end_time=at(12), duration_minutes=120, base_amount=Decimal('60'),
+            total_amount=Decimal('110'), status='paid', razorpay_payment_id='pay_1',
+        )
+        self.booking.optional_charges.set(site.charges.filter(is_active=True))
+
+    def test_template_lists_booking_and_charges(self):
+        html = render_to_string('booking_receipt.html', {'booking': self.booking, 'charges': self.booking.optional_charges.all()})
+        for text in ('Site 0', 'Andheri East', 'Valet', '110', 'pay_1'):
+            self.assertIn(text, html)
+
+    def test_receipt_is_attached_from_memory(self):
+        with mock.patch('api.receipts.render_receipt', return_value=b'%PDF-1.7 receipt') as render, \
+                mock.patch('api.tasks.send_email_batch.delay') as queue_email, \
+                mock.patch('builtins.open') as opened:
+            render_booking_receipt(str(self.booking.id))
+        render.assert_called_once()
+        opened.assert_not_called()
+        queue_email.assert_called_once()
+        send_email_batch()
+        self.assertEqual(mail.outbox[0].to, ['u@example.com'])
+        self.assertEqual(mail.outbox[0].attachments,
+                         [(f'receipt_{self.booking.id}.pdf', b'%PDF-1.7 receipt', 'application/pdf')])
+
+
+@override_settings(SMS_BACKEND='api.sms.LocMemBackend', NOTIFICATION_MAX_ATTEMPTS=2)
+class NotificationPipelineTests(TestCase):
+    def setUp(self):
+        sms.outbox.clear()
+        site = make_sites(1)[0]
+        self.bookings = []
+        for i in range(3):
+            user = User.objects.create_user(f'u{i}', f'u{i}@example.com', 'pw')
+            UserProfile.objects.create(user=user, phone=f'+9198000000{i}')
+            self.bookings.append(Booking.objects.create(
+                user=user, site=site, vehicle_type='car', start_time=at(10), end_time=at(11), duration_minutes=60,
+                base_amount=Decimal('60'), total_amount=Decimal('60'), status='paid',
+            ))
+
+    def queue_emails(self):
+        for booking in self.bookings:
+            notifications.queue_receipt_email(booking, b'%PDF')
+
+    def test_fan_out_to_render_and_sms_queues(self):
+        booking = self.bookings[0]
+        with mock.patch('api.tasks.render_booking_receipt.delay') as render, \
+                mock.patch('api.tasks.send_sms_batch.delay') as queue_sms:
+            send_booking_notifications(str(booking.id))
+            send_booking_notifications(str(booking.id))
+        render.assert_called_with(str(booking.id))
+        queue_sms.assert_called_once()
+        self.assertEqual(send_sms_batch(), 1)
+        self.assertEqual([(m.to, m.body) for m in sms.outbox], [('+91980000000', f'Booking confirmed: {booking.id}')])
+
+    def test_emails_share_one_connection(self):
+        self.queue_emails()
+        with mock.patch('api.notifications.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_email_batch(), 3)
+        get_connection.assert_called_once()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['u0@example.com', 'u1@example.com', 'u2@example.com'])
+        self.assertEqual(send_email_batch(), 0)
+
+    def test_failed_message_is_retried_then_given_up(self):
+        self.queue_emails()
+        send = mock.Mock(side_effect=[1, ConnectionError('421 try later'), 1])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', send):
+            self.assertEqual(notifications.deliver_batch('email', 10), (3, 1))
+        pending = Notification.objects.get(status='pending')
+        self.assertEqual((pending.attempts, pending.last_error), (1, 'ConnectionError: 421 try later'))
+        self.assertEqual(Notification.objects.filter(status='sent').count(), 2)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=ConnectionError):
+            self.assertEqual(notifications.deliver_batch('email', 10), (1, 0))
+        self.assertEqual(Notification.objects.get(id=pending.id).status, 'failed')
+
+    def test_rows_are_claimed_before_the_backend_is_called(self):
+        self.queue_emails()
+        seen = []
+
+        def send(messages):
+            seen.append(list(Notification.objects.values_list('status', flat=True).distinct()))
+            return 1
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send):
+            self.assertEqual(notifications.deliver_batch('email', 10), (3, 0))
+        self.assertEqual(seen[0], ['sending'])
+        self.assertEqual(set(Notification.objects.values_list('status', 'claimed_at')), {('sent', None)})
+
+    def test_connection_failure_releases_claims_and_stale_claims_are_resent(self):
+        self.queue_emails()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                notifications.deliver_batch('email', 10)
+        self.assertEqual(set(Notification.objects.values_list('status', 'attempts')), {('pending', 0)})
+
+        first, second, third = Notification.objects.order_by('id')
+        Notification.objects.filter(id=first.id).update(status='sending', claimed_at=timezone.now() - datetime.timedelta(hours=1))
+        Notification.objects.filter(id=second.id).update(status='sending', claimed_at=timezone.now())
+        self.assertEqual(notifications.deliver_batch('email', 10), (2, 0))
+        self.assertEqual(Notification.objects.get(id=second.id).status, 'sending')
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted([first.recipient, third.recipient]))
+
+
+class RequestMetricsTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for histogram in metrics.REGISTRY:
+            histogram.clear()
+        self.user = User.objects.create_user('u', 'u@example.com', 'pw')
+        self.token = Token.objects.create(user=self.user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.site = make_sites(1)[0]
+
+    def test_query_count_and_time_per_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('search_sites'), {'q': 'site'})
+        buckets, query_count = metrics.DB_QUERIES.samples(('search_sites',))
+        self.assertEqual((buckets[-1], query_count), (1, len(queries)))
+        buckets, db_seconds = metrics.DB_SECONDS.samples(('search_sites',))
+        self.assertEqual(buckets[-1], 1)
+        self.assertGreater(db_seconds, 0)
+        self.assertEqual(metrics.REQUEST_SECONDS.samples(('search_sites', 'GET', '2xx'))[0][-1], 1)
+        size = metrics.RESPONSE_BYTES.samples(('search_sites',))[1]
+        self.assertEqual(size, len(self.client.get(reverse('search_sites'), {'q': 'site'}).content))
+
+    async def test_async_views_are_counted(self):
+        await self.async_client.get(reverse('async_search_sites'), {'q': 'site'},
+                                    headers={'Authorization': f'Token {self.token}'})
+        self.assertGreater(metrics.DB_QUERIES.samples(('async_search_sites',))[1], 0)
+
+    def test_razorpay_time_is_attributed_to_the_view(self):
+        body = {'site_id': self.site.id, 'vehicle_type': 'car',
+                'start_time': at(10).isoformat(), 'end_time': at(11).isoformat()}
+        with FakeRazorpayServer(latency=0.05) as server, \
+                mock.patch('api.razorpay_client.client', build_client(base_url=server.url)):
+            self.assertEqual(self.client.post(reverse('book_create'), body, format='json').status_code, 201)
+        self.assertGreaterEqual(metrics.EXTERNAL_SECONDS.samples(('book_create', 'razorpay'))[1], 0.05)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('search_sites'))
+        response = self.client_class().get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE bp_request_duration_seconds histogram', text)
+        self.assertIn('bp_request_db_queries_bucket{view="search_sites",le="+Inf"} 1', text)
+        self.assertNotIn('view="metrics"', text)
+        self.assertEqual(self.client_class().get('/metrics').status_code, 403)
+
+    # settings.py defaults: DEBUG on and METRICS_TOKEN unset.
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_metrics_are_denied_without_a_token_even_in_debug(self):
+        self.assertEqual(self.client_class().get('/metrics').status_code, 403)
+        self.assertEqual(self.client_class().get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client_class().get('/metrics', HTTP_AUTHORIZATION='Bearer scrap').status_code, 403)
+
+    def test_streamed_body_queries_are_counted(self):
+        make_sites(3)
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.get(reverse('list_sites'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        self.assertIsNone(metrics.DB_QUERIES.samples(('list_sites',)))
+        with CaptureQueriesContext(connection) as queries:
+            body = b''.join(response.streaming_content)
+        buckets, query_count = metrics.DB_QUERIES.samples(('list_sites',))
+        self.assertEqual(buckets[-1], 1)
+        self.assertGreaterEqual(query_count, len(queries))
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(metrics.RESPONSE_BYTES.samples(('list_sites',))[1], len(body))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('api.slow_requests', 'WARNING') as logs:
+            self.client.get(reverse('search_sites'), {'q': 'site'})
+        self.assertIn('view=search_sites status=200', logs.output[0])
+        self.assertTrue(any('api_site' in sql for sql, _ in logs.records[0].sql))
+
+
+class BenchFunnelCommandTests(APITestMixin, TransactionTestCase):
+    """Smoke test: the benchmark seeds, runs every stage and compares runs."""
+
+    def setUp(self):
+        super().setUp()
+        # The test runner's database is already a throwaway one; empty it after each run instead.
+        patcher = mock.patch('api.management.commands.bench_funnel.throwaway_database', self.flushed_after)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def flushed_after():
+        try:
+            yield
+        finally:
+            call_command('flush', interactive=False, verbosity=0)
+
+    def bench(self, *args):
+        out = io.StringIO()
+        call_command('bench_funnel', '--locations', '1', '--sites-per-location', '2', '--bookings', '5',
+                     '--users', '2', '--requests', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_runs_every_stage_and_compares(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/run.json'
+            output = self.bench('--json', path)
+            with open(path) as fh:
+                results = json.load(fh)
+            self.assertEqual(list(results['endpoints']), ['search_sites', 'calculate_price', 'book_create', 'verify_payment'])
+            self.assertEqual({name: r['errors'] for name, r in results['endpoints'].items()},
+                             dict.fromkeys(results['endpoints'], 0))
+            self.assertEqual(results['endpoints']['verify_payment']['requests'], 2)
+            self.assertIn('queries/req', output)
+
+            for r in results['endpoints'].values():
+                r['queries_per_request'] /= 10
+            with open(path, 'w') as fh:
+                json.dump(results, fh)
+            output = self.bench('--compare', path)
+            self.assertIn(f'vs {path}', output)
+            self.assertIn('Regressions: search_sites queries_per_request', output)
+            with self.assertRaises(CommandError):
+                self.bench('--compare', path, '--fail-on-regression')
+
+
+class BulkImportTests(APITestMixin, TestCase):
+    def jsonl(self, count, price='60.00', start=0):
+        return io.StringIO(''.join(json.dumps({
+            'site_name': f'P{i}', 'location_name': f'Area {i % 3}', 'pincode': '400069', 'lat': '19.1', 'lng': '72.8',
+            'total_slots_car': 10, 'total_slots_bike': 5,
+            'pricing': [{'vehicle_type': 'car', 'tier': '0_2', 'price': price},
+                        {'vehicle_type': 'bike', 'tier': '0_2', 'price': '30'}],
+            'charges': [{'name': 'Valet', 'amount': '50'}],
+        }) + '\n' for i in range(start, start + count)))
+
+    def test_jsonl_import_and_reimport_upserts(self):
+        report = import_sites(parse_jsonl(self.jsonl(20)))
+        self.assertEqual((report['rows'], report['sites_created'], report['locations_created'], report['error_count']),
+                         (20, 20, 3, 0))
+        self.assertEqual(Pricing.objects.count(), 40)
+        self.assertEqual(OptionalCharge.objects.count(), 20)
+        site = Site.objects.get(name='P3')
+        self.assertEqual(site.location.name, 'Area 0')
+        self.assertEqual(pricing_cache.get_tier_prices(site.id, 'car'), {'0_2': Decimal('60.00')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = import_sites(parse_jsonl(self.jsonl(20, price='75.00')))
+        self.assertEqual((report['sites_created'], report['sites_updated']), (0, 20))
+        self.assertEqual((Site.objects.count(), Pricing.objects.count(), OptionalCharge.objects.count()), (20, 40, 20))
+        # Bulk writes skip signals; the importer invalidates the cache itself.
+        self.assertEqual(pricing_cache.get_tier_prices(site.id, 'car'), {'0_2': Decimal('75.00')})
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def queries(rows, start):
+            with CaptureQueriesContext(connection) as captured:
+                import_sites(parse_jsonl(self.jsonl(rows, start=start)), chunk_size=1000)
+            return len(captured)
+        import_sites(parse_jsonl(self.jsonl(3, start=1000)))  # create the locations
+        self.assertEqual(queries(5, 0), queries(100, 100))
+
+    def test_csv_rows_and_errors(self):
+        data = io.StringIO(
+            'site_name,location_name,total_slots_car,price_car_0_2,price_car_full_day,charges\n'
+            'Alpha,Bandra,40,60,300,Valet:50;Wash:80:inactive\n'
+            ',Bandra,40,60,,\n'
+            'Beta,Bandra,20,,,\n'
+        )
+        report = import_sites(parse_csv(data))
+        self.assertEqual((report['sites_created'], report['error_count']), (2, 1))
+        self.assertEqual(report['errors'][0]['line'], 3)
+        alpha = Site.objects.get(name='Alpha')
+        self.assertEqual(dict(alpha.pricings.values_list('tier', 'price')), {'0_2': Decimal('60'), 'full_day': Decimal('300')})
+        self.assertEqual(dict(alpha.charges.values_list('name', 'is_active')), {'Valet': True, 'Wash': False})
+
+    def test_admin_api_and_command(self):
+        upload = SimpleUploadedFile('sites.jsonl', self.jsonl(3).getvalue().encode())
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('u', 'u@example.com', 'pw'))
+        self.assertEqual(client.post(reverse('bulk_import_sites'), {'file': upload}).status_code, 403)
+        client.force_authenticate(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+        upload.seek(0)
+        response = client.post(reverse('bulk_import_sites') + '?dry_run=1', {'file': upload})
+        self.assertEqual((response.status_code, response.data['sites_created']), (200, 3))
+        self.assertFalse(Site.objects.exists())
+
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as fh:
+            fh.write(self.jsonl(3).getvalue())
+            fh.flush()
+            out = io.StringIO()
+            call_command('import_sites', fh.name, stdout=out)
+        self.assertIn('3 sites created', out.getvalue())
+        self.assertEqual(Site.objects.count(), 3)
+
+    def test_non_utf8_lines_are_rejected_per_line(self):
+        rows = self.jsonl(2).getvalue().encode().splitlines(keepends=True)
+        latin1 = b'{"site_name": "caf\xe9", "location_name": "Area 0"}\n'
+        report = import_sites(parse_jsonl(io.BytesIO(rows[0] + latin1 + rows[1])))
+        self.assertEqual((report['sites_created'], report['error_count']), (2, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertIn('not UTF-8', report['errors'][0]['errors'])
+
+        csv_bytes = 'site_name,location_name\nAlpha,Bandra\nCaf\xe9,Bandra\nBeta,Bandra\n'.encode('latin-1')
+        report = import_sites(parse_csv(io.BytesIO(csv_bytes)))
+        self.assertEqual((report['sites_created'], [e['line'] for e in report['errors']]), (2, [3]))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+        upload = SimpleUploadedFile('sites.csv', csv_bytes)
+        response = client.post(reverse('bulk_import_sites'), {'file': upload})
+        self.assertEqual((response.status_code, response.data['error_count']), (200, 1))
+
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv') as fh:
+            fh.write(csv_bytes)
+            fh.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_sites', fh.name, stdout=out, stderr=err)
+        self.assertIn('1 rejected', out.getvalue())
+        self.assertIn('line 3: not UTF-8', err.getvalue())
+
+    def test_command_dry_run_from_stdin(self):
+        stdin = io.StringIO(self.jsonl(3).getvalue())
+        site_cards._pending.site_ids = set()
+        version = http_cache.catalog_version()
+        with mock.patch('sys.stdin', stdin), self.captureOnCommitCallbacks() as callbacks:
+            call_command('import_sites', '-', '--dry-run', stdout=io.StringIO())
+        self.assertFalse(stdin.closed)
+        self.assertFalse(Site.objects.exists())
+        self.assertEqual((callbacks, http_cache.catalog_version()), ([], version))
+        self.assertEqual(site_cards._pending.site_ids, set())
+
+
+class SiteCardTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sites = make_sites(3)
+
+    def card(self, site):
+        return json.loads(SiteCard.objects.get(site=site).payload)
+
+    def test_cards_match_serializer_output(self):
+        qs = SiteSerializer.setup_eager_loading(Site.objects.order_by('id'))
+        response = self.client.get(reverse('search_sites'), {'q': 'site'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, JSONRenderer().render(SiteSerializer(qs, many=True).data))
+        self.assertEqual(SiteCard.objects.count(), 3)
+
+    def test_search_reads_cards_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('search_sites'), {'q': 'site'})
+            self.client.get(reverse('search_sites'), {'near': '19.1136,72.8697'})
+        site_queries = [q for q in ctx.captured_queries if 'api_site' in q['sql']]
+        self.assertEqual(len(site_queries), 2)
+        self.assertIn('api_sitecard', site_queries[0]['sql'])
+
+    def test_missing_cards_are_built_on_read(self):
+        SiteCard.objects.all().delete()
+        response = self.client.get(reverse('search_sites'), {'q': 'site'})
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(SiteCard.objects.count(), 3)
+
+    def test_writes_refresh_cards_on_commit(self):
+        site = self.sites[0]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Pricing.objects.filter(site=site, vehicle_type='car').first().delete()
+            OptionalCharge.objects.create(site=site, name='Cover', amount=Decimal('20.00'))
+        self.assertEqual(len(callbacks), 4)  # card refresh and pricing cache invalidation per write
+        card = self.card(site)
+        self.assertEqual([p['vehicle_type'] for p in card['pricings']], ['bike'])
+        self.assertEqual({c['name'] for c in card['charges']}, {'Valet', 'Cover'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.filter(pk=site.location_id).update(name='Renamed')
+            site.location.refresh_from_db()
+            site.location.save()
+        self.assertEqual({self.card(s)['location']['name'] for s in self.sites}, {'Renamed'})
+
+    def test_near_adds_distance(self):
+        Site.objects.filter(pk=self.sites[0].pk).update(lat=Decimal('19.1136'), lng=Decimal('72.8697'))
+        response = self.client.get(reverse('search_sites'), {'near': '19.1136,72.8697', 'radius_km': '1'})
+        self.assertEqual([s['name'] for s in response.json()], ['Site 0'])
+        self.assertEqual(response.json()[0]['distance_km'], 0)
+
+    def test_rebuild_command(self):
+        SiteCard.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_site_cards', '--chunk-size', '2', stdout=out)
+        self.assertIn('3 site cards rebuilt', out.getvalue())
+        self.assertEqual(self.card(self.sites[2])['name'], 'Site 2')
+
+
+class ConditionalListingTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login(username='admin', is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site = make_sites(2)[0]
+
+    def test_revalidation_is_304_without_queries(self):
+        first = self.client.get(reverse('search_sites'), {'q': 'site'})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('search_sites'), {'q': 'site'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        response = self.client.get(reverse('list_sites'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_moves_etag(self):
+        etag = self.client.get(reverse('search_sites'), {'q': 'site'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Pricing.objects.filter(site=self.site, vehicle_type='bike').update(price=Decimal('35.00'))
+            Pricing.objects.get(site=self.site, vehicle_type='bike').save()
+        response = self.client.get(reverse('search_sites'), {'q': 'site'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('35.00', response.content.decode())
+
+    def test_search_responses_are_shared_by_normalized_query(self):
+        first = self.client.get(reverse('search_sites'), {'q': 'site', 'pincode': ''})
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('u', 'u@example.com', 'pw'))
+        with self.assertNumQueries(0):
+            response = other.get(reverse('search_sites'), {'q': '  site '})
+        self.assertEqual((response.content, response['ETag']), (first.content, first['ETag']))
+        paged = other.get(reverse('search_sites'), {'q': 'site', 'page': 1})
+        self.assertEqual(other.get(reverse('search_sites'), {'page': 1, 'q': 'site'}).data, paged.data)
+
+    def test_permissions_run_before_cache(self):
+        self.client.get(reverse('list_sites'))
+        self.client.force_authenticate(User.objects.create_user('u', 'u@example.com', 'pw'))
+        self.assertEqual(self.client.get(reverse('list_sites')).status_code, 403)
+
+    async def test_async_search_is_conditional(self):
+        auth = {'Authorization': f"Token {(await Token.objects.acreate(user=self.user)).key}"}
+        first = await self.async_client.get(reverse('async_search_sites'), {'q': 'site'}, headers=auth)
+        response = await self.async_client.get(reverse('async_search_sites'), {'q': 'site'},
+                                                headers={**auth, 'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertGreater(http_cache.catalog_version(), 0)
+
+
+class BookingRollupTests(TestCase):
+    def setUp(self):
+        self.site = make_sites(1)[0]
+
+    def booking(self, start, end, amount='100', **kwargs):
+        return Booking.objects.create(
+            site=self.site, vehicle_type='car', start_time=start, end_time=end, duration_minutes=0,
+            base_amount=Decimal(amount), total_amount=Decimal(amount), **kwargs,
+        )
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(
+                model.objects.exclude(bookings=0, slot_minutes=0, revenue=0)
+                .values_list('site_id', 'vehicle_type', 'status', field, 'bookings', 'slot_minutes', 'revenue')
+            )
+            for model, field in ((HourlyBookingRollup, 'hour'), (DailyBookingRollup, 'day'))
+        }
+
+    def test_slot_minutes_are_spread_over_hours_and_days(self):
+        self.booking(at(10.5), at(12.25))
+        self.booking(at(23.5), at(24.5), amount='40')
+        self.assertFalse(HourlyBookingRollup.objects.exists())
+        self.assertEqual(apply_booking_rollups(), 2)
+        hourly = {(r.hour.hour, r.hour.day): (r.bookings, r.slot_minutes) for r in HourlyBookingRollup.objects.all()}
+        self.assertEqual(hourly, {(10, 1): (1, 30), (11, 1): (0, 60), (12, 1): (0, 15), (23, 1): (1, 30), (0, 2): (0, 30)})
+        daily = {r.day.day: (r.bookings, r.slot_minutes, r.revenue) for r in DailyBookingRollup.objects.all()}
+        self.assertEqual(daily, {1: (2, 135, Decimal('140')), 2: (0, 30, Decimal('0'))})
+
+    def test_changes_only_queue_deltas(self):
+        month = Booking.objects.get(id=self.booking(at(0), at(24 * 30)).id)
+        with CaptureQueriesContext(connection) as ctx:
+            month.status = 'cancelled'
+            month.save()
+        statements = [q['sql'] for q in ctx.captured_queries]
+        # Loaded values stand in for the stored row, and no rollup row is touched.
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT')])
+        self.assertFalse([sql for sql in statements if 'bookingrollup"' in sql])
+        self.assertEqual(list(BookingRollupDelta.objects.order_by('id').values_list('sign', 'status')),
+                         [(1, 'pending'), (-1, 'pending'), (1, 'cancelled')])
+        apply_booking_rollups()
+        self.assertFalse(BookingRollupDelta.objects.exists())
+        self.assertEqual(HourlyBookingRollup.objects.filter(status='cancelled').count(), 24 * 30)
+        self.assertFalse(HourlyBookingRollup.objects.filter(status='pending').exclude(slot_minutes=0).exists())
+
+    def test_transitions_match_a_rebuild(self):
+        paid = self.booking(at(9), at(11), razorpay_order_id='order_1')
+        expired = self.booking(at(10), at(12))
+        cancelled = self.booking(at(20), at(30))
+        edited = self.booking(at(8), at(9), status='paid')
+        deleted = self.booking(at(8), at(9))
+        Booking.objects.filter(id=expired.id).update(created_at=timezone.now() - datetime.timedelta(days=1))
+
+        self.assertEqual(mark_paid(paid.id, 'order_1', 'pay_1'), 'paid')
+        self.assertEqual(expire_pending_bookings(), 1)
+        self.assertTrue(cancel_pending(cancelled.id))
+        edited.end_time, edited.status = at(10), 'cancelled'
+        edited.save()
+        deleted.delete()
+        apply_booking_rollups()
+        by_status = dict(DailyBookingRollup.objects.exclude(bookings=0).values_list('status', 'bookings'))
+        self.assertEqual(by_status, {'paid': 1, 'expired': 1, 'cancelled': 2})
+
+        incremental = self.snapshot()
+        HourlyBookingRollup.objects.update(bookings=999)
+        out = io.StringIO()
+        call_command('backfill_booking_rollups', stdout=out)
+        self.assertIn('Rebuilt 2030-01-01..2030-01-02 in 2 chunks', out.getvalue())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_analytics_endpoint_reads_only_rollups(self):
+        self.booking(at(10), at(12), status='paid')
+        self.booking(at(30), at(31), amount='60.50', status='paid')
+        self.booking(at(10), at(11))
+        apply_booking_rollups()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('u', 'u@example.com', 'pw'))
+        url = reverse('booking_analytics', args=['daily'])
+        params = {'start': '2030-01-01', 'end': '2030-01-02', 'status': 'paid'}
+        self.assertEqual(client.get(url, params).status_code, 403)
+
+        client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pw', is_staff=True))
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, params)
+        self.assertFalse([q for q in ctx.captured_queries if '"api_booking"' in q['sql']])
+        self.assertEqual([(r['day'], r['bookings'], r['slot_minutes']) for r in response.data['results']],
+                         [(datetime.date(2030, 1, 1), 1, 120), (datetime.date(2030, 1, 2), 1, 60)])
+        self.assertEqual(response.data['totals'], {'bookings': 2, 'slot_minutes': 180, 'revenue': '160.50'})
+
+        response = client.get(reverse('booking_analytics', args=['hourly']),
+                              {'start': '2030-01-01', 'end': '2030-01-01', 'group_by': 'site_id,vehicle_type'})
+        self.assertEqual(response.data['results'][0], {
+            'hour': at(10), 'site_id': self.site.id, 'vehicle_type': 'car',
+            'bookings': 2, 'slot_minutes': 120, 'revenue': '200.00',
+        })
+        self.assertEqual(client.get(url, {'start': '2030-01-02', 'end': '2030-01-01'}).status_code, 400)
+        self.assertEqual(client.get(url, {**params, 'group_by': 'user'}).status_code, 400)
+        self.assertEqual(client.get(reverse('booking_analytics', args=['weekly']), params).status_code, 404)
+
+
+class PricingEngineTests(TestCase):
+    TABLE = {'0_2': Decimal('60.00'), '2_4': Decimal('120.00'), 'full_day': Decimal('160.00'), 'monthly': Decimal('3500.00')}
+
+    def test_tier_ladder_and_monthly_cap(self):
+        table = TierTable(self.TABLE)
+        day = 24 * 60
+        cases = {
+            90: '60.00', 120: '60.00', 121: '120.00', 240: '120.00', 241: '160.00', day: '160.00',
+            day + 1: '320.00', 21 * day: '3360.00', 25 * day: '3500.00', 30 * day: '3500.00',
+            31 * day: '3660.00', 60 * day: '7000.00', 85 * day: '10500.00',
+        }
+        self.assertEqual({minutes: str(table.price(minutes)) for minutes in cases}, cases)
+        without_monthly = TierTable({k: v for k, v in self.TABLE.items() if k != 'monthly'})
+        self.assertEqual(without_monthly.price(31 * day), Decimal('4960.00'))
+        self.assertEqual(TierTable({}).price(60), Decimal('0.00'))
+
+    def test_vectorized_pass_matches_scalar_and_is_exact(self):
+        for prices in (self.TABLE, {'0_2': Decimal('33.33'), 'full_day': Decimal('99.99')}):
+            table = TierTable(prices)
+            minutes = list(range(0, 70 * 24 * 60, 37))
+            self.assertEqual(table.prices(minutes), [table.price(m) for m in minutes])
+        self.assertEqual(TierTable({'full_day': Decimal('33.33')}).prices([3 * 24 * 60])[0], Decimal('99.99'))
+
+    def test_price_grid_endpoint(self):
+        site = make_sites(1)[0]
+        Pricing.objects.create(site=site, vehicle_type='car', tier='full_day', price=Decimal('160.00'))
+        Pricing.objects.create(site=site, vehicle_type='car', tier='monthly', price=Decimal('3500.00'))
+        pricing_cache.invalidate_site(site.id)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('u', 'u@example.com', 'pw'))
+        params = {'site_id': site.id, 'vehicle_type': 'car'}
+        client.get(reverse('price_grid'), params)
+        with self.assertNumQueries(0):
+            response = client.get(reverse('price_grid'), params)
+        grid = response.data['base_amounts']
+        self.assertEqual(len(grid), 720)
+        self.assertEqual((grid[0], grid[2], grid[23], grid[24], grid[719]), (60, 0, 160, 320, 3500))
+        quote = client.post(reverse('calculate_price'), {**params, 'start_time': at(0).isoformat(),
+                                                         'end_time': at(30).isoformat()}, format='json')
+        self.assertEqual(quote.data['base_amount'], Decimal(str(grid[29])))
+        self.assertEqual(client.get(reverse('price_grid'), {**params, 'step_minutes': 5}).status_code, 400)
+        self.assertEqual(client.get(reverse('price_grid'), {**params, 'site_id': 999}).status_code, 404)
+        self.assertEqual(client.get(reverse('price_grid'), {**params, 'vehicle_type': 'truck'}).status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+
+    def bookings(self, count, sites):
+        user = User.objects.create_user(f'u{Booking.objects.count()}', 'u@example.com', 'pw')
+        Booking.objects.bulk_create([
+            Booking(user=user, site=sites[i % len(sites)], vehicle_type='car', start_time=at(10), end_time=at(11),
+                    duration_minutes=60, base_amount=Decimal('60'), total_amount=Decimal('60'),
+                    razorpay_order_id=f'order_{Booking.objects.count()}_{i}')
+            for i in range(count)
+        ])
+
+    def queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_changelists_do_not_query_per_row(self):
+        sites = make_sites(2)
+        self.bookings(2, sites)
+        urls = [reverse(f'admin:api_{name}_changelist') for name in ('booking', 'site', 'pricing', 'optionalcharge')]
+        small = [self.queries(url)[0] for url in urls]
+        more = make_sites(10, prefix='More')
+        self.bookings(30, more)
+        self.assertEqual([self.queries(url)[0] for url in urls], small)
+
+    def test_booking_search_is_exact(self):
+        sites = make_sites(1)
+        self.bookings(3, sites)
+        booking = Booking.objects.first()
+        url = reverse('admin:api_booking_changelist')
+        for term in (str(booking.id), booking.razorpay_order_id):
+            _, response = self.queries(url, {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list), [booking])
+        _, response = self.queries(url, {'q': 'order'})
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+    def test_site_search_matches_location_names(self):
+        make_sites(2)
+        Site.objects.create(name='Elsewhere', location=Location.objects.create(name='Bandra West'))
+        _, response = self.queries(reverse('admin:api_site_changelist'), {'q': 'andheri'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_unfiltered_count_is_estimated_on_postgres(self):
+        self.bookings(5, make_sites(1))
+        paginator = EstimatedCountPaginator(Booking.objects.order_by('-created_at'), 100)
+        paginator.estimate_above = 0
+        filtered = EstimatedCountPaginator(Booking.objects.filter(status='pending').order_by('-created_at'), 100)
+        filtered.estimate_above = 0
+        self.assertEqual(filtered.count, 5)
+        if connection.vendor != 'postgresql':
+            self.assertEqual(paginator.count, 5)
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE api_booking')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator.count, 5)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('pg_class', ctx.captured_queries[0]['sql'])
+
+
+
+class BookingHistoryTests(APITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login(username='rider')
+        self.sites = make_sites(3)
+
+    def bookings(self, count, user=None, **fields):
+        created = Booking.objects.bulk_create([
+            Booking(user=user or self.user, site=self.sites[i % 3], vehicle_type='car', start_time=at(i),
+                    end_time=at(i + 1), duration_minutes=60, base_amount=Decimal('60'), total_amount=Decimal('110'),
+                    razorpay_order_id=f'order_{uuid.uuid4().hex}', **fields)
+            for i in range(count)
+        ])
+        valet = OptionalCharge.objects.filter(site__in=self.sites, name='Valet')
+        for booking in created:
+            booking.optional_charges.set(valet.filter(site_id=booking.site_id))
+        return created
+
+    def walk(self, params):
+        ids, response = [], self.client.get(reverse('my_bookings'), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_pages_walk_own_bookings_newest_first(self):
+        mine = self.bookings(7)
+        self.bookings(2, user=User.objects.create_user('other', 'other@example.com', 'pw'))
+        # Same creation time for several rows: the id tie-break keeps pages exact.
+        Booking.objects.filter(id__in=[b.id for b in mine[:4]]).update(created_at=at(0))
+        expected = [str(pk) for pk in Booking.objects.filter(user=self.user)
+                    .order_by('-created_at', '-id').values_list('id', flat=True)]
+        self.assertEqual(self.walk({'limit': 2}), expected)
+        self.assertEqual(len(expected), 7)
+
+    def test_rows_carry_site_location_and_charges(self):
+        self.bookings(1)
+        row = self.client.get(reverse('my_bookings')).data['results'][0]
+        self.assertEqual(row['site']['name'], 'Site 0')
+        self.assertEqual(row['site']['location']['pincode'], '400069')
+        self.assertEqual([c['name'] for c in row['optional_charges']], ['Valet'])
+        self.assertNotIn('razorpay_signature', row)
+
+    def test_status_filter(self):
+        self.bookings(3)
+        self.bookings(2, status='paid')
+        self.bookings(1, status='cancelled')
+        self.assertEqual(len(self.walk({'status': 'paid'})), 2)
+        self.assertEqual(len(self.walk({'status': 'paid,cancelled', 'limit': 1})), 3)
+        response = self.client.get(reverse('my_bookings'), {'status': 'refunded'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_cost_does_not_grow_with_history(self):
+        self.bookings(3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('my_bookings'))
+        self.bookings(40)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('my_bookings'), {'limit': 40})
+        self.assertEqual(len(response.data['results']), 40)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(reverse('my_bookings')).status_code, 401)
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are checked on Postgres')
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+class QueryPlanTests(APITestMixin, TestCase):
+    """Every statement of the hot paths must be servable from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        locations = Location.objects.bulk_create([
+            Location(name=f'Area {i}', pincode=str(400001 + i), lat=Decimal('19.1') + i / Decimal(100),
+                     lng=Decimal('72.8')) for i in range(20)
+        ])
+        sites = Site.objects.bulk_create([
+            Site(name=f'{location.name} Parking {j}', location=location, lat=location.lat + j / Decimal(1000),
+                 lng=location.lng, total_slots_car=20, total_slots_bike=20)
+            for location in locations for j in range(10)
+        ])
+        Pricing.objects.bulk_create([
+            Pricing(site=site, vehicle_type=vehicle, tier='0_2', price=Decimal('60')) for site in sites
+            for vehicle in ('car', 'bike')
+        ])
+        charges = OptionalCharge.objects.bulk_create([
+            OptionalCharge(site=site, name='Valet', amount=Decimal('50')) for site in sites
+        ])
+        call_command('rebuild_site_cards', stdout=io.StringIO())
+        cls.user = User.objects.create_user('u', 'u@example.com', 'pw', is_staff=True)
+        statuses = ('paid', 'pending', 'expired', 'cancelled')
+        Booking.objects.bulk_create([
+            Booking(user=cls.user, site=sites[i % len(sites)], vehicle_type='car', start_time=at(i % 500),
+                    end_time=at(i % 500 + 2), duration_minutes=120, base_amount=Decimal('60'),
+                    total_amount=Decimal('60'), status=statuses[i % 4], razorpay_order_id=f'order_seed_{i}')
+            for i in range(4000)
+        ])
+        valet = {charge.site_id: charge for charge in charges}
+        Booking.optional_charges.through.objects.bulk_create([
+            Booking.optional_charges.through(booking=booking, optionalcharge=valet[booking.site_id])
+            for booking in Booking.objects.filter(status='paid')
+        ])
+        cls.site = sites[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.user)
+        patcher = mock.patch.object(razorpay_client.client, 'auth', ('key', 'secret'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertIndexed(self, plans):
+        self.assertTrue(plans.statements)
+        self.assertEqual(plans.full_scans(), [])
+
+    def test_text_search(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'api_site_name_trgm'")
+            self.assertIsNotNone(cursor.fetchone(), 'api_site_name_trgm is missing; is pg_trgm available?')
+        with PlanCapture() as plans:
+            self.client.get(reverse('search_sites'), {'q': 'area 3'})
+        self.assertIndexed(plans)
+
+    def test_site_reads(self):
+        with PlanCapture() as plans:
+            self.client.get(reverse('search_sites'), {'pincode': '400005'})
+            self.client.get(reverse('search_sites'), {'near': '19.15,72.8', 'radius_km': '0.5'})
+            self.client.get(reverse('list_sites'), {'limit': 20})
+            self.client.get(reverse('price_grid'), {'site_id': self.site.id, 'vehicle_type': 'car'})
+        self.assertIndexed(plans)
+
+    def test_quotes_and_availability(self):
+        window = {'site_id': self.site.id, 'vehicle_type': 'car',
+                  'start_time': at(10).isoformat(), 'end_time': at(12).isoformat()}
+        with PlanCapture() as plans:
+            self.client.post(reverse('calculate_price'), dict(window, optional_charges=[1]), format='json')
+            self.client.post(reverse('calculate_price_bulk'), {'quotes': [window]}, format='json')
+            self.client.get(reverse('site_availability'), window)
+        self.assertIndexed(plans)
+
+    def test_booking_and_payment(self):
+        window = {'site_id': self.site.id, 'vehicle_type': 'car',
+                  'start_time': at(600).isoformat(), 'end_time': at(601).isoformat()}
+        with mock.patch('api.views.create_order', return_value={'id': 'order_new'}), \
+                mock.patch('api.tasks.send_booking_notifications.delay'), PlanCapture() as plans:
+            booked = self.client.post(reverse('book_create'), window, format='json')
+            self.client.get(reverse('booking_order_status', args=[booked.data['booking_id']]))
+            self.client.post(reverse('verify_payment'), {
+                'booking_id': booked.data['booking_id'], 'razorpay_order_id': 'order_new',
+                'razorpay_payment_id': 'pay_new', 'razorpay_signature': sign('order_new', 'pay_new', 'secret'),
+            }, format='json')
+        self.assertEqual(booked.status_code, 201)
+        self.assertIndexed(plans)
+
+    def test_background_sweeps(self):
+        body = json.dumps({'event': 'payment.captured', 'payload': {'payment': {'entity': {
+            'id': 'pay_hook', 'order_id': 'order_seed_1'}}}})
+        self.client.post(reverse('razorpay_webhook'), body, content_type='application/json',
+                         headers={'X-Razorpay-Signature': sign_webhook(body, 'whsec'), 'X-Razorpay-Event-Id': 'evt_1'})
+        with PlanCapture() as plans:
+            drain_inbox_batch(100)
+            expire_pending_batch(timezone.now(), 100)
+            apply_booking_rollups(100, 1)
+        self.assertIndexed(plans)
+
+    def test_booking_history(self):
+        first = self.client.get(reverse('my_bookings'), {'limit': 20})
+        with PlanCapture() as plans:
+            self.client.get(first.data['next'])
+            self.client.get(reverse('my_bookings'), {'status': 'paid,pending'})
+        self.assertIndexed(plans)
+
+    def test_reporting(self):
+        with PlanCapture() as plans:
+            self.client.get(reverse('booking_analytics', args=['daily']), {'start': '2030-01-01', 'end': '2030-01-31'})
+            self.client.get(reverse('admin:api_booking_changelist'), {'status__exact': 'paid'})
+        self.assertIndexed(plans)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views, webhooks
 from rest_framework.authtoken.views import obtain_auth_token
 
 urlpatterns = [
@@ -8,13 +8,29 @@ urlpatterns = [
     
     # Public endpoints
     path('sites/search/', views.search_sites, name='search_sites'),
+    path('sites/availability/', views.site_availability, name='site_availability'),
     path('price/calculate/', views.calculate_price, name='calculate_price'),
+    path('price/calculate/bulk/', views.calculate_price_bulk, name='calculate_price_bulk'),
+    path('price/grid/', views.price_grid, name='price_grid'),
     path('book/', views.book_create, name='book_create'),
+    path('book/<uuid:booking_id>/order/', views.booking_order_status, name='booking_order_status'),
+    path('bookings/', views.my_bookings, name='my_bookings'),
     path('payment/verify/', views.verify_payment, name='verify_payment'),
     
+    # Razorpay server-to-server callbacks
+    path('webhooks/razorpay/', webhooks.razorpay_webhook, name='razorpay_webhook'),
+    
+    # Async (ASGI) variants of the public endpoints
+    path('async/sites/search/', async_views.search_sites, name='async_search_sites'),
+    path('async/price/calculate/', async_views.calculate_price, name='async_calculate_price'),
+    path('async/book/', async_views.book_create, name='async_book_create'),
+    path('async/payment/verify/', async_views.verify_payment, name='async_verify_payment'),
+    
     # Admin endpoints
     path('admin/sites/create/', views.create_site, name='create_site'),
     path('admin/sites/list/', views.list_sites, name='list_sites'),
+    path('admin/sites/import/', views.bulk_import_sites, name='bulk_import_sites'),
+    path('admin/analytics/<str:period>/', views.booking_analytics, name='booking_analytics'),
     path('admin/pricing/create/', views.create_pricing, name='create_pricing'),
     path('admin/charges/create/', views.create_optional_charge, name='create_optional_charge'),
 ]
@@ -1,50 +1,138 @@
+import datetime
 from datetime import timedelta
-import math
+from decimal import Decimal
 from django.utils import timezone
+from .models import VEHICLE_CHOICES
+from .pricing_cache import get_tier_prices, get_many_tier_prices, get_active_charges
+from .pricing_engine import TierTable
 
-# Input durations in minutes
-def calculate_amount(site, vehicle_type, start_dt, end_dt, optional_charge_ids=[]):
+CENTS = Decimal('0.01')
+
+
+VEHICLE_TYPES = tuple(v for v, _ in VEHICLE_CHOICES)
+VEHICLE_ERROR = f"vehicle_type must be one of: {', '.join(VEHICLE_TYPES)}."
+TARGET_ERROR = 'site_id must be an integer and ' + VEHICLE_ERROR
+PAYMENT_FIELDS = ('booking_id', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature')
+PAYMENT_ERROR = ', '.join(PAYMENT_FIELDS) + ' are required.'
+
+
+def parse_target(params):
+    """(site_id, vehicle_type) from site_id/vehicle_type params, or None if either is missing or invalid."""
+    try:
+        site_id = int(params['site_id'])
+        vehicle_type = params['vehicle_type']
+    except (KeyError, TypeError, ValueError):
+        return None
+    if vehicle_type not in VEHICLE_TYPES:
+        return None
+    return site_id, vehicle_type
+
+
+def has_payment_fields(payload):
+    """True if a verify_payment body carries every field the signature check and mark_paid need."""
+    try:
+        return all(isinstance(payload[field], str) and payload[field] for field in PAYMENT_FIELDS)
+    except (KeyError, TypeError):
+        return False
+
+
+def parse_window(params):
+    """(start, end) aware datetimes from start_time/end_time ISO params, or None."""
+    try:
+        start = datetime.datetime.fromisoformat(params['start_time'])
+        end = datetime.datetime.fromisoformat(params['end_time'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+    if end <= start:
+        return None
+    return start, end
+
+
+def base_amount(pricings, minutes):
+    """Tier price for a stay of `minutes` from a {tier: price} table (see pricing_engine)."""
+    return TierTable(pricings).price(minutes)
+
+
+def _quote(pricings, start_dt, end_dt, option_total):
     diff = end_dt - start_dt
     minutes = int(diff.total_seconds() // 60)
-    hours = minutes / 60.0
-
-    # fetch pricing for the site & vehicle
-    pricings = {p.tier: float(p.price) for p in site.pricings.filter(vehicle_type=vehicle_type)}
-
-    base = 0.0
-    # Using your rules:
-    # For car:
-    # 0-2 hrs -> 60
-    # 2-4 -> 120
-    # full day ->160
-    # monthly -> 3500
-    # For bike:
-    # 1-2 hrs -> 30
-    # 2-4 -> 40
-    # full day -> 70
-    # monthly -> 1000
-    # We'll choose tier according to hours.
-    if hours <= 2:
-        base = pricings.get('0_2') or pricings.get('0_2', 0)
-    elif hours <= 4:
-        base = pricings.get('2_4') or pricings.get('2_4', 0)
-    elif hours < 24:
-        base = pricings.get('full_day') or pricings.get('full_day', 0)
-    else:
-        # full days multiples
-        days = math.ceil(hours / 24)
-        base = (pricings.get('full_day') or 0) * days
+    base = base_amount(pricings, minutes)
+    option_total = Decimal(option_total).quantize(CENTS)
+    return {
+        'duration_minutes': minutes,
+        'base_amount': base,
+        'optional_amount': option_total,
+        'total_amount': base + option_total,
+    }
+
+
+# Input durations in minutes
+# `site` may be a Site instance or a site id.
+def calculate_amount(site, vehicle_type, start_dt, end_dt, optional_charge_ids=[]):
+    # fetch pricing for the site & vehicle (cached, see pricing_cache)
+    site_id = getattr(site, 'pk', site)
+    pricings = get_tier_prices(site_id, vehicle_type) or {}
 
     # Now optional charges
-    option_total = 0.0
+    option_total = Decimal('0')
     if optional_charge_ids:
-        from .models import OptionalCharge
-        option_total = sum(c.amount for c in OptionalCharge.objects.filter(id__in=optional_charge_ids, is_active=True))
+        active = get_active_charges(site_id)
+        ids = {int(i) for i in optional_charge_ids}
+        option_total = sum(active[i] for i in ids if i in active)
+        unknown = [i for i in ids if i not in active]
+        if unknown:
+            # Charges belonging to another site are not in this site's cached table.
+            from .models import OptionalCharge
+            option_total += sum(c.amount for c in OptionalCharge.objects.filter(id__in=unknown, is_active=True))
 
-    total = float(base) + float(option_total)
-    return {
-        'duration_minutes': minutes,
-        'base_amount': round(base, 2),
-        'optional_amount': round(option_total, 2),
-        'total_amount': round(total, 2)
-    }
+    return _quote(pricings, start_dt, end_dt, option_total)
+
+
+def calculate_amounts(quotes):
+    """
+    Bulk version of calculate_amount.
+
+    `quotes` is a list of dicts with site_id, vehicle_type, start_time,
+    end_time and optional_charges. Pricing for every (site, vehicle) pair is
+    loaded in one go (cache first, then a single query), all optional
+    charges with one query, and the durations of each table are priced in
+    one vectorized pass. Returns results in input order, with None for
+    quotes whose site does not exist.
+    """
+    from .models import OptionalCharge
+    tables = get_many_tier_prices({(int(q['site_id']), q['vehicle_type']) for q in quotes})
+
+    charge_ids = {int(i) for q in quotes for i in q.get('optional_charges') or []}
+    charges = {}
+    if charge_ids:
+        charges = dict(OptionalCharge.objects.filter(id__in=charge_ids, is_active=True).values_list('id', 'amount'))
+
+    # One vectorized pricing pass per (site, vehicle) table.
+    minutes = [int((q['end_time'] - q['start_time']).total_seconds() // 60) for q in quotes]
+    groups = {}
+    for index, q in enumerate(quotes):
+        groups.setdefault((int(q['site_id']), q['vehicle_type']), []).append(index)
+    bases = {}
+    for pair, indexes in groups.items():
+        if tables[pair] is not None:
+            prices = TierTable(tables[pair]).prices([minutes[i] for i in indexes])
+            bases.update(zip(indexes, prices))
+
+    results = []
+    for index, q in enumerate(quotes):
+        if index not in bases:
+            results.append(None)
+            continue
+        ids = {int(i) for i in q.get('optional_charges') or []}
+        option_total = sum((charges[i] for i in ids if i in charges), Decimal('0')).quantize(CENTS)
+        results.append({
+            'duration_minutes': minutes[index],
+            'base_amount': bases[index],
+            'optional_amount': option_total,
+            'total_amount': bases[index] + option_total,
+        })
+    return results
@@ -1,31 +1,90 @@
 from rest_framework import viewsets, generics, status
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authentication import TokenAuthentication
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.urls import reverse
 from django.conf import settings
-from .models import Site, Location, Booking, OptionalCharge
-from .serializers import SiteSerializer, BookingSerializer, SiteCreateSerializer
-from .utils import calculate_amount
-from .razorpay_client import client
+from .models import Site, Location, Booking, OptionalCharge, BOOKING_STATUS
+from .serializers import SiteSerializer, BookingSerializer, BookingHistorySerializer, SiteCreateSerializer, BulkPriceQuoteSerializer
+from .utils import (calculate_amount, calculate_amounts, parse_window, parse_target, has_payment_fields,
+                    VEHICLE_TYPES, VEHICLE_ERROR, TARGET_ERROR, PAYMENT_ERROR)
+from .pricing_cache import get_tier_prices
+from .pricing_engine import TierTable, duration_grid
+from .geo import sites_near, parse_point, DEFAULT_RADIUS_KM, MAX_RADIUS_KM
+from .search import search_queryset
+from .pagination import SiteSearchPagination, KeysetPagination, BookingHistoryPagination
+from .availability import availability, reserve_booking
+from .streaming import streaming_json_response
+from .site_cards import with_cards, card_payloads, add_field, cards_response
+from .booking_state import mark_paid, cancel_pending, NOT_FOUND, CONFLICT, REFUND_DUE, REFUND_DUE_DETAIL
+from .idempotency import idempotent
+from .http_cache import conditional_listing
+from .importer import PARSERS, DEFAULT_CHUNK_SIZE, detect_format, import_sites
+from . import analytics
+from . import razorpay_client
+from .razorpay_client import create_order
 import razorpay
-import datetime
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db import transaction
 from decimal import Decimal
 
+MAX_AVAILABILITY_SITES = 100
+
+def _site_listing_response(request, qs):
+    """
+    Serialize an ordered site queryset in the mode the client asked for:
+      page=N[&page_size=]   page-number envelope {count, next, previous, results}
+      limit=N / cursor=...  keyset envelope {next, results}; follow `next`
+      stream=1              the full list as a chunked JSON array
+    Without any of these the full list is returned as before, assembled
+    from the precomputed site cards (api/site_cards.py).
+    """
+    params = request.query_params
+    if params.get('stream') in ('1', 'true'):
+        return streaming_json_response(qs, SiteSerializer)
+    if 'page' in params:
+        paginator = SiteSearchPagination()
+    elif 'cursor' in params or 'limit' in params:
+        paginator = KeysetPagination()
+    else:
+        return cards_response(card_payloads(list(with_cards(qs))))
+    page = paginator.paginate_queryset(qs, request)
+    return paginator.get_paginated_response(SiteSerializer(page, many=True).data)
+
 @api_view(['GET'])
+@conditional_listing(shared=True)
 def search_sites(request):
-    q = request.query_params.get('q', '')
-    pincode = request.query_params.get('pincode', '')
-    qs = Site.objects.select_related('location').all()
-    if q:
-        qs = qs.filter(name__icontains=q) | qs.filter(location__name__icontains=q)
-    if pincode:
-        qs = qs.filter(location__pincode__icontains=pincode)
-    serializer = SiteSerializer(qs, many=True)
-    return Response(serializer.data)
+    """
+    query params: q, pincode (prefix), near=lat,lng, radius_km
+    Text matches are ranked best-first. Pagination/streaming params are
+    described on _site_listing_response.
+    With `near`, results are limited to `radius_km` and ordered by distance.
+    Responses carry ETag/Last-Modified and are shared between callers
+    (api/http_cache.py).
+    """
+    q = request.query_params.get('q', '').strip()
+    pincode = request.query_params.get('pincode', '').strip()
+    near = request.query_params.get('near', '')
+    qs = SiteSerializer.setup_eager_loading(search_queryset(q, pincode))
+    if not near:
+        return _site_listing_response(request, qs)
+
+    try:
+        lat, lng = parse_point(near)
+        radius_km = float(request.query_params.get('radius_km', DEFAULT_RADIUS_KM))
+    except ValueError:
+        return Response({'detail': 'near must be "lat,lng" and radius_km a number.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        return Response({'detail': f'radius_km must be between 0 and {MAX_RADIUS_KM}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    sites = sites_near(with_cards(qs), lat, lng, radius_km)
+    payloads = card_payloads(sites)
+    return cards_response([add_field(p, 'distance_km', site.distance_km) for p, site in zip(payloads, sites)])
 
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAdminUser])
@@ -74,13 +133,14 @@ def create_site(request):
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@conditional_listing()
 def list_sites(request):
     """
-    List all sites for admin management.
+    List all sites for admin management, oldest first.
+    Supports the pagination/streaming params of _site_listing_response.
     """
-    sites = Site.objects.select_related('location').all()
-    serializer = SiteSerializer(sites, many=True)
-    return Response(serializer.data)
+    sites = SiteSerializer.setup_eager_loading(Site.objects.order_by('id'))
+    return _site_listing_response(request, sites)
 
 @api_view(['POST'])
 def calculate_price(request):
@@ -88,47 +148,139 @@ def calculate_price(request):
     body: { site_id, vehicle_type, start_time, end_time, optional_charges: [ids] }
     """
     data = request.data
-    site = get_object_or_404(Site, id=data['site_id'])
-    start = datetime.datetime.fromisoformat(data['start_time'])
-    end = datetime.datetime.fromisoformat(data['end_time'])
-    result = calculate_amount(site, data['vehicle_type'], start, end, data.get('optional_charges', []))
+    target = parse_target(data)
+    if target is None:
+        return Response({'detail': TARGET_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+    # Served from the pricing cache; a missing table means the site does not exist.
+    if get_tier_prices(*target) is None:
+        raise Http404
+    window = parse_window(data)
+    if window is None:
+        return Response({'detail': 'start_time and end_time must be ISO datetimes with end after start.'}, status=status.HTTP_400_BAD_REQUEST)
+    result = calculate_amount(*target, *window, data.get('optional_charges', []))
     return Response(result)
 
 @api_view(['POST'])
+def calculate_price_bulk(request):
+    """
+    Quote many site/vehicle/time windows in one request.
+    body: { quotes: [ { site_id, vehicle_type, start_time, end_time, optional_charges: [ids] }, ... ] }
+    Results come back in the same order; unknown sites get a `detail` instead of amounts.
+    """
+    serializer = BulkPriceQuoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    quotes = serializer.validated_data['quotes']
+    results = []
+    for quote, result in zip(quotes, calculate_amounts(quotes)):
+        item = {'site_id': quote['site_id'], 'vehicle_type': quote['vehicle_type']}
+        item.update(result if result is not None else {'detail': 'Site not found.'})
+        results.append(item)
+    return Response({'quotes': results})
+
+MAX_GRID_HOURS = 24 * 366
+
+@api_view(['GET'])
+def price_grid(request):
+    """
+    Base price for stays of every `step_minutes` up to `max_hours`, e.g. for
+    a calendar UI.
+    query params: site_id, vehicle_type, max_hours (default 720), step_minutes (default 60)
+    Returns { site_id, vehicle_type, step_minutes, base_amounts: [price for 1*step, 2*step, ...] }.
+    """
+    params = request.query_params
+    target = parse_target(params)
+    if target is None:
+        return Response({'detail': TARGET_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+    site_id, vehicle_type = target
+    try:
+        max_hours = int(params.get('max_hours', 720))
+        step_minutes = int(params.get('step_minutes', 60))
+    except ValueError:
+        return Response({'detail': 'max_hours and step_minutes must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not (0 < max_hours <= MAX_GRID_HOURS and 15 <= step_minutes <= max_hours * 60):
+        return Response({'detail': f'max_hours must be 1-{MAX_GRID_HOURS} and step_minutes 15-max_hours*60.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    prices = get_tier_prices(site_id, vehicle_type)
+    if prices is None:
+        raise Http404
+    _, paise = duration_grid(TierTable(prices), max_hours, step_minutes)
+    return Response({
+        'site_id': site_id,
+        'vehicle_type': vehicle_type,
+        'step_minutes': step_minutes,
+        'base_amounts': (paise / 100).tolist(),
+    })
+
+@api_view(['GET'])
+def site_availability(request):
+    """
+    Free slots per site over a time window.
+    query params: site_id=1,2,3  start_time  end_time  vehicle_type (optional, both if omitted)
+    """
+    window = parse_window(request.query_params)
+    if window is None:
+        return Response({'detail': 'start_time and end_time must be ISO datetimes with end after start.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        site_ids = [int(i) for i in request.query_params.get('site_id', '').split(',') if i]
+    except ValueError:
+        return Response({'detail': 'site_id must be a comma-separated list of ids.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not site_ids or len(site_ids) > MAX_AVAILABILITY_SITES:
+        return Response({'detail': f'Pass between 1 and {MAX_AVAILABILITY_SITES} site ids.'}, status=status.HTTP_400_BAD_REQUEST)
+    vehicle_type = request.query_params.get('vehicle_type')
+    if vehicle_type and vehicle_type not in VEHICLE_TYPES:
+        return Response({'detail': VEHICLE_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+    vehicle_types = [vehicle_type] if vehicle_type else list(VEHICLE_TYPES)
+
+    sites = Site.objects.filter(id__in=site_ids).only('id', 'total_slots_car', 'total_slots_bike').order_by('id')
+    return Response(availability(sites, vehicle_types, *window))
+
+@api_view(['POST'])
+@idempotent
 def book_create(request):
     """
     Create booking and create Razorpay order.
     """
     data = request.data
-    site = get_object_or_404(Site, id=data['site_id'])
-    start = datetime.datetime.fromisoformat(data['start_time'])
-    end = datetime.datetime.fromisoformat(data['end_time'])
-    calc = calculate_amount(site, data['vehicle_type'], start, end, data.get('optional_charges', []))
+    target = parse_target(data)
+    if target is None:
+        return Response({'detail': TARGET_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+    site_id, vehicle_type = target
+    site = get_object_or_404(Site, id=site_id)
+    window = parse_window(data)
+    if window is None:
+        return Response({'detail': 'start_time and end_time must be ISO datetimes with end after start.'}, status=status.HTTP_400_BAD_REQUEST)
+    start, end = window
+    calc = calculate_amount(site, vehicle_type, start, end, data.get('optional_charges', []))
     amount_in_inr = Decimal(calc['total_amount'])
     amount_paise = int(amount_in_inr * 100)
 
-    # Build razorpay order
-    razorpay_order = client.order.create({
-        'amount': amount_paise,
-        'currency': 'INR',
-        'payment_capture': '1'  # auto capture
-    })
+    booking = reserve_booking(
+        request.user if request.user.is_authenticated else None,
+        site, vehicle_type, start, end, calc, data.get('optional_charges'),
+    )
+    if booking is None:
+        return Response({'detail': 'No slots available for this time window.'}, status=status.HTTP_409_CONFLICT)
 
-    with transaction.atomic():
-        booking = Booking.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            site=site,
-            vehicle_type=data['vehicle_type'],
-            start_time=start,
-            end_time=end,
-            duration_minutes=calc['duration_minutes'],
-            base_amount=Decimal(calc['base_amount']),
-            total_amount=Decimal(calc['total_amount']),
-            razorpay_order_id=razorpay_order['id'],
-            status='pending'
-        )
-        if data.get('optional_charges'):
-            booking.optional_charges.set(OptionalCharge.objects.filter(id__in=data['optional_charges']))
+    if settings.RAZORPAY_ASYNC_ORDERS:
+        # Don't hold this worker on the gateway; the client polls booking_order_status.
+        from .tasks import create_razorpay_order
+        create_razorpay_order.delay(str(booking.id))
+        return Response({
+            'booking_id': str(booking.id),
+            'razorpay_order_id': None,
+            'amount': amount_paise,
+            'razorpay_key': settings.RAZORPAY_KEY_ID,
+            'order_status_url': reverse('booking_order_status', args=[booking.id]),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    # Build razorpay order outside the lock; release the hold if it fails.
+    try:
+        razorpay_order = create_order(amount_paise, receipt=str(booking.id))
+    except Exception:
+        cancel_pending(booking.id)
+        return Response({'detail': 'Could not create payment order, please retry.'}, status=status.HTTP_502_BAD_GATEWAY)
+    Booking.objects.filter(id=booking.id).update(razorpay_order_id=razorpay_order['id'])
 
     return Response({
         'booking_id': str(booking.id),
@@ -137,14 +289,54 @@ def book_create(request):
         'razorpay_key': settings.RAZORPAY_KEY_ID
     }, status=201)
 
+@api_view(['GET'])
+def booking_order_status(request, booking_id):
+    """
+    Poll target for asynchronously created Razorpay orders.
+    `ready` turns true once razorpay_order_id is set; a cancelled status
+    means the order could not be created and the slot was released.
+    """
+    booking = get_object_or_404(Booking.objects.only('id', 'user_id', 'status', 'total_amount', 'razorpay_order_id'), id=booking_id)
+    if booking.user_id and booking.user_id != request.user.id:
+        raise Http404
+    return Response({
+        'booking_id': str(booking.id),
+        'status': booking.status,
+        'ready': booking.razorpay_order_id is not None,
+        'razorpay_order_id': booking.razorpay_order_id,
+        'amount': int(booking.total_amount * 100),
+        'razorpay_key': settings.RAZORPAY_KEY_ID,
+    })
+
+@api_view(['GET'])
+def my_bookings(request):
+    """
+    The caller's bookings, newest first, as keyset pages {next, results}.
+    query params: status (comma-separated), limit, cursor (follow `next`)
+    """
+    statuses = [name for name in request.query_params.get('status', '').split(',') if name]
+    if not set(statuses) <= {value for value, _ in BOOKING_STATUS}:
+        return Response({'detail': f'status must be among {", ".join(value for value, _ in BOOKING_STATUS)}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    bookings = Booking.objects.filter(user=request.user).order_by('-created_at', '-id')
+    if statuses:
+        bookings = bookings.filter(status__in=statuses)
+    paginator = BookingHistoryPagination()
+    page = paginator.paginate_queryset(BookingHistorySerializer.setup_eager_loading(bookings), request)
+    return paginator.get_paginated_response(BookingHistorySerializer(page, many=True).data)
+
 @api_view(['POST'])
+@idempotent
 def verify_payment(request):
     """
     After Razorpay checkout success, frontend posts:
     { booking_id, razorpay_payment_id, razorpay_order_id, razorpay_signature }
+    Safe to retry: only the first call for a payment confirms the booking
+    and sends notifications.
     """
     payload = request.data
-    booking = get_object_or_404(Booking, id=payload['booking_id'])
+    if not has_payment_fields(payload):
+        return Response({'detail': PAYMENT_ERROR}, status=status.HTTP_400_BAD_REQUEST)
     try:
         # Verify signature
         params_dict = {
@@ -152,20 +344,18 @@ def verify_payment(request):
             'razorpay_payment_id': payload['razorpay_payment_id'],
             'razorpay_signature': payload['razorpay_signature']
         }
-        client.utility.verify_payment_signature(params_dict)
+        razorpay_client.client.utility.verify_payment_signature(params_dict)
     except razorpay.errors.SignatureVerificationError:
         return Response({'detail': 'Signature verification failed'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # mark paid
-    booking.razorpay_payment_id = payload['razorpay_payment_id']
-    booking.razorpay_signature = payload['razorpay_signature']
-    booking.status = 'paid'
-    booking.save()
-
-    # Trigger background tasks: send email, sms, generate pdf
-    from .tasks import send_booking_notifications
-    send_booking_notifications.delay(str(booking.id))
-
+    result = mark_paid(payload['booking_id'], payload['razorpay_order_id'],
+                       payload['razorpay_payment_id'], payload['razorpay_signature'])
+    if result == NOT_FOUND:
+        raise Http404
+    if result == CONFLICT:
+        return Response({'detail': 'Booking is not awaiting this payment.'}, status=status.HTTP_409_CONFLICT)
+    if result == REFUND_DUE:
+        return Response({'detail': REFUND_DUE_DETAIL, 'status': 'refund_due'}, status=status.HTTP_409_CONFLICT)
     return Response({'detail': 'Payment verified and booking confirmed.'})
 
 @api_view(['POST'])
@@ -213,3 +403,67 @@ def create_optional_charge(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def bulk_import_sites(request):
+    """
+    Bulk upsert sites with pricing tiers and charges (api/importer.py).
+    multipart: file=<sites.csv | sites.jsonl>
+    query: file_format=csv|jsonl (default from the file name), dry_run=1, chunk_size=500
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'detail': 'Upload the rows as multipart field "file".'}, status=status.HTTP_400_BAD_REQUEST)
+    fmt = request.query_params.get('file_format') or detect_format(upload.name)
+    if fmt not in PARSERS:
+        return Response({'detail': f'file_format must be one of {sorted(PARSERS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        chunk_size = max(1, int(request.query_params.get('chunk_size', DEFAULT_CHUNK_SIZE)))
+    except ValueError:
+        return Response({'detail': 'chunk_size must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+    report = import_sites(PARSERS[fmt](upload), chunk_size=chunk_size,
+                          dry_run=request.query_params.get('dry_run') in ('1', 'true'))
+    return Response(report)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def booking_analytics(request, period):
+    """
+    Booking counts, occupied slot-minutes and revenue per hour or day,
+    read from the rollup tables only (api/analytics.py).
+    period: hourly | daily
+    query params: start, end (YYYY-MM-DD, inclusive), site_id, vehicle_type,
+                  status (comma-separated), group_by (comma-separated
+                  site_id, vehicle_type, status; default status)
+    """
+    if period not in analytics.PERIODS:
+        raise Http404
+    params = request.query_params
+    try:
+        start = parse_date(params.get('start', ''))
+        end = parse_date(params.get('end', ''))
+        site_id = int(params['site_id']) if params.get('site_id') else None
+    except ValueError:
+        start = None
+    if start is None or end is None or end < start:
+        return Response({'detail': 'start and end must be YYYY-MM-DD dates with start <= end.'}, status=status.HTTP_400_BAD_REQUEST)
+    max_days = analytics.PERIODS[period][2]
+    if (end - start).days >= max_days:
+        return Response({'detail': f'{period} reports cover at most {max_days} days.'}, status=status.HTTP_400_BAD_REQUEST)
+    group_by = [name for name in params.get('group_by', 'status').split(',') if name]
+    if not set(group_by) <= set(analytics.GROUP_FIELDS):
+        return Response({'detail': f'group_by must be among {", ".join(analytics.GROUP_FIELDS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+    statuses = [name for name in params.get('status', '').split(',') if name]
+
+    rows = analytics.report(period, start, end, site_id=site_id, vehicle_type=params.get('vehicle_type'),
+                            statuses=statuses, group_by=group_by)
+    totals = {
+        'bookings': sum(row['bookings'] for row in rows),
+        'slot_minutes': sum(row['slot_minutes'] for row in rows),
+        'revenue': f"{sum((row['revenue'] for row in rows), Decimal('0')):.2f}",
+    }
+    for row in rows:
+        row['revenue'] = f"{row['revenue']:.2f}"
+    return Response({'period': period, 'start': start, 'end': end, 'results': rows, 'totals': totals})
@@ -0,0 +1,11 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bpbackend.settings')
+
+app = Celery('bpbackend')
+
+# All CELERY_* settings in bpbackend/settings.py configure the app.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
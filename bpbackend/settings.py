@@ -35,6 +35,17 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
 # External service keys
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+RAZORPAY_BASE_URL = os.getenv('RAZORPAY_BASE_URL')  # e.g. a local `manage.py fake_razorpay`
+RAZORPAY_CONNECT_TIMEOUT = float(os.getenv('RAZORPAY_CONNECT_TIMEOUT', 2))
+RAZORPAY_READ_TIMEOUT = float(os.getenv('RAZORPAY_READ_TIMEOUT', 8))
+RAZORPAY_MAX_RETRIES = int(os.getenv('RAZORPAY_MAX_RETRIES', 3))
+RAZORPAY_POOL_SIZE = int(os.getenv('RAZORPAY_POOL_SIZE', 20))
+# Create orders in a Celery task and let the client poll for them
+RAZORPAY_ASYNC_ORDERS = os.getenv('RAZORPAY_ASYNC_ORDERS', 'false').lower() == 'true'
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+# Webhook inbox consumer (api.tasks.process_webhook_inbox)
+WEBHOOK_INBOX_BATCH_SIZE = int(os.getenv('WEBHOOK_INBOX_BATCH_SIZE', 500))
+WEBHOOK_INBOX_MAX_BATCHES = int(os.getenv('WEBHOOK_INBOX_MAX_BATCHES', 20))
 
 # Email default
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
@@ -49,6 +60,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -61,6 +73,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +86,14 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'bpbackend.urls'
 
+# Request metrics on /metrics (api/metrics.py)
+# Scrapers send `Authorization: Bearer <METRICS_TOKEN>`. /metrics answers 403
+# until a token is set, DEBUG or not.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Log requests slower than this (with their SQL) to the api.slow_requests logger; 0 disables
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 0)) or None
+SLOW_REQUEST_MAX_SQL = 50
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -112,6 +133,80 @@ DATABASES = {
     }
 }
 
+# Cache
+# Use a shared backend (e.g. django.core.cache.backends.redis.RedisCache) in
+# production so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Price quote cache (api/pricing_cache.py)
+PRICING_CACHE_TIMEOUT = int(os.getenv('PRICING_CACHE_TIMEOUT', 60 * 60))
+PRICING_LOCAL_CACHE_TTL = int(os.getenv('PRICING_LOCAL_CACHE_TTL', 30))
+PRICING_LOCAL_CACHE_SIZE = 2048
+
+# Shared cache of site search responses, per catalog version (api/http_cache.py)
+LISTING_CACHE_TIMEOUT = int(os.getenv('LISTING_CACHE_TIMEOUT', 5 * 60))
+
+# How long a pending (unpaid) booking holds its slot before it is expired
+BOOKING_HOLD_TTL_MINUTES = int(os.getenv('BOOKING_HOLD_TTL_MINUTES', 15))
+BOOKING_EXPIRY_BATCH_SIZE = int(os.getenv('BOOKING_EXPIRY_BATCH_SIZE', 1000))
+BOOKING_EXPIRY_MAX_BATCHES = int(os.getenv('BOOKING_EXPIRY_MAX_BATCHES', 50))
+# Booking rollup deltas folded per run of api.tasks.apply_booking_rollups
+ROLLUP_DELTA_BATCH_SIZE = int(os.getenv('ROLLUP_DELTA_BATCH_SIZE', 1000))
+ROLLUP_DELTA_MAX_BATCHES = int(os.getenv('ROLLUP_DELTA_MAX_BATCHES', 20))
+
+# Responses replayed for retried Idempotency-Key requests (api/idempotency.py)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+# Celery (bpbackend/celery.py)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')  # Celery's default (local AMQP) when unset
+CELERY_TIMEZONE = 'UTC'
+# Build and warm the WeasyPrint receipt renderer in each worker process (api/receipts.py)
+RECEIPT_WARM_ON_WORKER_START = os.getenv('RECEIPT_WARM_ON_WORKER_START', 'true').lower() == 'true'
+CELERY_BEAT_SCHEDULE = {
+    'expire-pending-bookings': {
+        'task': 'api.tasks.expire_pending_bookings',
+        'schedule': 60.0,
+    },
+    'process-webhook-inbox': {
+        'task': 'api.tasks.process_webhook_inbox',
+        'schedule': 5.0,
+    },
+    'apply-booking-rollups': {
+        'task': 'api.tasks.apply_booking_rollups',
+        'schedule': 30.0,
+    },
+    # Pick up notifications whose retries ran out or whose trigger was lost
+    'send-pending-emails': {
+        'task': 'api.tasks.send_email_batch',
+        'schedule': 60.0,
+    },
+    'send-pending-sms': {
+        'task': 'api.tasks.send_sms_batch',
+        'schedule': 60.0,
+    },
+}
+# Notification stages get their own workers, e.g.
+#   celery -A bpbackend worker -Q render --concurrency=<cores>
+#   celery -A bpbackend worker -Q email,sms -P threads  (no receipt renderer to warm)
+CELERY_TASK_ROUTES = {
+    'api.tasks.render_booking_receipt': {'queue': 'render'},
+    'api.tasks.send_email_batch': {'queue': 'email'},
+    'api.tasks.send_sms_batch': {'queue': 'sms'},
+}
+
+# Notification outbox (api/notifications.py)
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 100))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+# Seconds before a `sending` claim from a worker that died is handed out again
+NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv('NOTIFICATION_CLAIM_TIMEOUT', 300))
+SMS_BACKEND = os.getenv('SMS_BACKEND', 'api.sms.ConsoleBackend')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators